@@ -0,0 +1,670 @@
+"""
+ASGI entry point
+Serves the page, discovery and research with AsyncAnthropic, so a request
+waiting on the Messages API holds no worker thread
+
+    uvicorn asgi:app --host 0.0.0.0 --port 8080
+
+Caches, the venue store, the rate limiter and metrics are shared with
+main. Jobs, tours and the other endpoints stay on the waitress server,
+so /discover here always makes a single pass; tiered discovery is
+available on /discover/stream.
+"""
+
+import asyncio
+import json
+import sys
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+
+from werkzeug.http import parse_accept_header, parse_etags
+
+import priority
+import timing
+from cache import discover_cache_key, overlay_key, venue_cache_key
+from main import (
+    DISCOVER_MODE, DISCOVER_OUTPUT, ENRICH_CONCURRENCY, ENRICH_LIMIT, FAST_TIER,
+    HTTP_IN_FLIGHT, HTTP_LATENCY, UPSTREAM_QUEUE_WAIT, VENUES_PARSED, VenueStreamParser,
+    abandon, discover_cache, discover_request, dispatcher, enrich_request, error_payload,
+    estimate_usage, finish_tiered, index_page, input_validator, merge_details,
+    metrics, needs_enrichment, page_assets, rate_limiter, read_venues, record_usage,
+    research_cache, research_cache_info,
+    research_overlay_request, research_report_request, response_text,
+    snapshot_usage, sse_event, stats_payload, store_candidates, store_venues,
+    upstream_timer,
+)
+from metrics import CONTENT_TYPE
+from ranking import rerank
+from ratelimit import RateLimited
+from singleflight import AsyncSingleFlight
+from timing import span
+from upstream import AsyncClientManager
+from validation import Invalid
+
+client_manager = AsyncClientManager.from_env()
+inflight = AsyncSingleFlight()
+
+
+@asynccontextmanager
+async def dispatched(label, kwargs):
+    """Hold a dispatcher slot in the call's priority class"""
+    async with AsyncExitStack() as stack:
+        try:
+            ticket = await stack.enter_async_context(
+                dispatcher.slot_async(priority.classify(label)))
+        except asyncio.CancelledError:
+            abandon(label, kwargs, sent=False)
+            raise
+        UPSTREAM_QUEUE_WAIT.observe(ticket.name, value=ticket.waited)
+        yield ticket
+
+
+async def create_message(label, **kwargs):
+    """messages.create admitted and retried by the rate limiter
+
+    Streamed underneath: when the client goes away the task is cancelled
+    and closing the stream stops generation upstream.
+    """
+    client = client_manager.get()
+    sent = False
+
+    async def send():
+        nonlocal sent
+        sent = True
+        stream = None
+        try:
+            with upstream_timer(label, client_manager):
+                async with client.messages.stream(**kwargs) as stream:
+                    return await stream.get_final_message(), stream.response.headers
+        except asyncio.CancelledError:
+            usage = snapshot_usage(stream)
+            abandon(label, kwargs, usage)
+            record_usage(label, usage, finished=False)
+            raise
+
+    with span(f'upstream_{label}'):
+        async with dispatched(label, kwargs):
+            try:
+                response = await rate_limiter.call_async(send, **estimate_usage(kwargs))
+            except asyncio.CancelledError:
+                if not sent:
+                    abandon(label, kwargs, sent=False)
+                raise
+    record_usage(label, response.usage)
+    return response
+
+
+@asynccontextmanager
+async def stream_message(label, **kwargs):
+    """messages.stream admitted and retried by the rate limiter"""
+    client = client_manager.get()
+    sent = False
+    opened = None
+
+    async def send():
+        nonlocal sent, opened
+        sent = True
+        # The timer stays open until the stream is closed below
+        stack = AsyncExitStack()
+        stack.enter_context(upstream_timer(label, client_manager))
+        try:
+            stream = await stack.enter_async_context(client.messages.stream(**kwargs))
+        except BaseException:
+            await stack.__aexit__(*sys.exc_info())
+            raise
+        opened = stack
+        return (stack, stream), stream.response.headers
+
+    timings = timing.current()
+    started = time.perf_counter()
+    async with dispatched(label, kwargs):
+        try:
+            (stack, stream), slot = await rate_limiter.call_async(
+                send, hold=True, **estimate_usage(kwargs))
+        except asyncio.CancelledError:
+            abandon(label, kwargs, sent=sent)
+            # Cancelled after the stream opened, while its headers were read
+            if opened is not None:
+                await opened.aclose()
+            raise
+        finished = False
+        try:
+            async with stack:
+                try:
+                    yield stream
+                    finished = True
+                except (asyncio.CancelledError, GeneratorExit):
+                    abandon(label, kwargs, snapshot_usage(stream))
+                    raise
+        finally:
+            await slot.release_async()
+            if timings is not None:
+                timings.add(f'upstream_{label}', time.perf_counter() - started)
+            record_usage(label, snapshot_usage(stream), finished)
+
+
+async def discover_venues_api(profile, target_city):
+    """Discover venues using Claude"""
+    structured = DISCOVER_OUTPUT == 'tool'
+    try:
+        response = await create_message(
+            'discover_tool' if structured else 'discover',
+            **discover_request(profile, target_city, structured))
+        return read_venues(response, structured)
+    except RateLimited:
+        raise
+    except Exception as e:
+        print(f"Discover error: {e}")
+        raise
+
+
+def remember_venues(key, venues, profile, target_city):
+    """Cache and store a discovered list; SQLite work, so run it in a thread"""
+    discover_cache.set(key, venues)
+    store_venues(venues, profile, target_city)
+
+
+async def discover_venues_cached(profile, target_city):
+    """Discover venues, serving repeat and concurrent queries once"""
+    key = discover_cache_key(profile, target_city)
+    with span('cache'):
+        venues = await asyncio.to_thread(discover_cache.get, key)
+    if venues is not None:
+        return venues, {'cached': True, 'source': 'cache', 'waiters': 1}
+
+    with span('store'):
+        venues = await asyncio.to_thread(store_candidates, profile, target_city)
+    if venues is not None:
+        return venues, {'cached': False, 'source': 'store', 'waiters': 1}
+
+    async def fetch():
+        venues = await discover_venues_api(profile, target_city)
+        if venues:
+            await asyncio.to_thread(remember_venues, key, venues, profile, target_city)
+        return venues
+
+    venues, waiters = await inflight.do(key, fetch)
+    return venues, {'cached': False, 'source': 'upstream', 'waiters': waiters}
+
+
+async def discover_venues_stream(profile, target_city):
+    """Yield venues as each block closes in the streamed response"""
+    parser = VenueStreamParser()
+    try:
+        async with stream_message(
+            'discover', **discover_request(profile, target_city, structured=False)
+        ) as stream:
+            async for text in stream.text_stream:
+                for venue in parser.feed(text):
+                    yield venue
+        for venue in parser.close():
+            yield venue
+        VENUES_PARSED.observe('stream', value=parser.parsed)
+    except RateLimited:
+        raise
+    except Exception as e:
+        print(f"Discover stream error: {e}")
+        raise
+
+
+async def discover_venues_fast(profile, target_city):
+    """Candidate venues from the fast tier, shared by concurrent callers"""
+    async def fetch():
+        response = await create_message(
+            'discover_fast', **discover_request(profile, target_city, True, FAST_TIER))
+        return read_venues(response, True)
+
+    venues, waiters = await inflight.do(('fast', discover_cache_key(profile, target_city)), fetch)
+    return [dict(venue) for venue in venues], waiters
+
+
+async def enrich_venues(venues, profile):
+    """Yield (index, venue) as each venue's enrichment call finishes"""
+    limit = asyncio.Semaphore(ENRICH_CONCURRENCY)
+
+    async def enrich(i, venue):
+        async with limit:
+            response = await create_message('enrich', **enrich_request(venue, profile))
+        return i, merge_details(venue, response.content)
+
+    tasks = [asyncio.ensure_future(enrich(i, venue))
+             for i, venue in enumerate(venues[:ENRICH_LIMIT]) if needs_enrichment(venue)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                yield await next_done
+            except RateLimited as e:
+                print(f"Enrichment stopped: rate limited for {e.retry_after}s")
+                return
+            except Exception as e:
+                print(f"Enrich error: {e}")
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def research_text(label, **kwargs):
+    response = await create_message(label, **kwargs)
+    return response_text(response.content)
+
+
+async def research_venue_api(venue, profile):
+    """Research a specific venue, reusing cached venue-level research"""
+    key = venue_cache_key(venue)
+    with span('cache'):
+        entry = await asyncio.to_thread(research_cache.get_entry, key)
+    hit = entry is not None
+    waiters = 1
+    try:
+        if not hit:
+            async def report():
+                text = await research_text('research', **research_report_request(venue))
+                return await asyncio.to_thread(research_cache.set, key, text)
+            entry, waiters = await inflight.do(key, report)
+        venue_report, created_at, expires_at = entry
+
+        overlay, overlay_waiters = await inflight.do(
+            overlay_key(venue, profile),
+            lambda: research_text(
+                'research_overlay', **research_overlay_request(venue, profile, venue_report)))
+    except RateLimited:
+        raise
+    except Exception as e:
+        print(f"Research error: {e}")
+        raise
+    research = f"{venue_report.rstrip()}\n\n{overlay.strip()}"
+    return research, {
+        'cache': research_cache_info(hit, created_at, expires_at),
+        'waiters': max(waiters, overlay_waiters),
+    }
+
+
+async def research_venue_stream(venue, profile):
+    """Yield ('text', delta) pairs for a report, then ('cache', info)"""
+    key = venue_cache_key(venue)
+    entry = await asyncio.to_thread(research_cache.get_entry, key)
+    hit = entry is not None
+    try:
+        if hit:
+            venue_report = entry[0]
+            yield 'text', venue_report.rstrip()
+        else:
+            parts = []
+            async with stream_message('research', **research_report_request(venue)) as stream:
+                async for text in stream.text_stream:
+                    parts.append(text)
+                    yield 'text', text
+            venue_report = "".join(parts)
+            entry = await asyncio.to_thread(research_cache.set, key, venue_report)
+
+        yield 'text', "\n\n"
+        async with stream_message(
+            'research_overlay', **research_overlay_request(venue, profile, venue_report)
+        ) as stream:
+            async for text in stream.text_stream:
+                yield 'text', text
+    except RateLimited:
+        raise
+    except Exception as e:
+        print(f"Research stream error: {e}")
+        raise
+
+    yield 'cache', research_cache_info(hit, entry[1], entry[2])
+
+
+class Request:
+    """The parts of an ASGI HTTP request the handlers need"""
+
+    def __init__(self, scope, body):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.headers = {k.decode('latin-1').lower(): v.decode('latin-1')
+                        for k, v in scope['headers']}
+        self.body = body
+
+    @property
+    def json(self):
+        """Parsed body, or None when it is not JSON, for the validator to refuse"""
+        try:
+            return json.loads(self.body)
+        except ValueError:
+            return None
+
+
+def json_response(payload, status=200, headers=None):
+    # Same encoding as Flask's jsonify outside debug mode
+    body = json.dumps(payload, separators=(',', ':'), sort_keys=True) + "\n"
+    return status, {'Content-Type': 'application/json', **(headers or {})}, body.encode()
+
+
+def error_response(e, endpoint):
+    if isinstance(e, Invalid):
+        return json_response(error_payload(e), 400)
+    print(f"ERROR in /{endpoint}: {e}")
+    if isinstance(e, RateLimited):
+        return json_response(error_payload(e), 429, {'Retry-After': str(e.retry_after)})
+    return json_response({'error': str(e)}, 500)
+
+
+def sse_response(events):
+    return 200, {
+        'Content-Type': 'text/event-stream; charset=utf-8',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    }, events
+
+
+async def index(request):
+    """Main page"""
+    return index_page.select(parse_accept_header(request.headers.get('accept-encoding')),
+                             parse_etags(request.headers.get('if-none-match')))
+
+
+async def asset(request):
+    """Fingerprinted CSS/JS split out of the page"""
+    page_asset = page_assets.get(request.path[len('/assets/'):])
+    if page_asset is None:
+        return json_response({'error': 'Not found'}, 404)
+    return page_asset.select(parse_accept_header(request.headers.get('accept-encoding')),
+                             parse_etags(request.headers.get('if-none-match')))
+
+
+async def discover(request):
+    """Discover venues endpoint"""
+    try:
+        with span('parse'):
+            profile, target_city = input_validator.discover(request.json)
+
+        print(f"Discovering venues for {profile.get('name')} in {target_city}")
+        venues, meta = await discover_venues_cached(profile, target_city)
+
+        with span('serialize'):
+            return json_response({'venues': venues, **meta})
+    except Exception as e:
+        return error_response(e, 'discover')
+
+
+async def discover_stream(request):
+    """Discover venues, pushing each venue as an SSE event"""
+    try:
+        data = request.json
+        profile, target_city = input_validator.discover(data)
+        tiered = data.get('mode', DISCOVER_MODE) == 'tiered'
+    except Exception as e:
+        return json_response(error_payload(e), 400)
+
+    print(f"Streaming venues for {profile.get('name')} in {target_city}")
+
+    async def generate():
+        started = time.time()
+        key = discover_cache_key(profile, target_city)
+        venues = await asyncio.to_thread(discover_cache.get, key)
+        source = 'cache'
+        if venues is None:
+            venues = await asyncio.to_thread(store_candidates, profile, target_city)
+            source = 'store'
+        if venues is not None:
+            for venue in venues:
+                yield sse_event('venue', venue)
+            yield sse_event('done', {
+                'count': len(venues),
+                'cached': source == 'cache',
+                'source': source,
+            })
+            return
+        if tiered:
+            async for frame in tiered_events(profile, target_city, started):
+                yield frame
+            return
+
+        venues = []
+        first_venue_at = None
+        try:
+            async for venue in discover_venues_stream(profile, target_city):
+                if first_venue_at is None:
+                    first_venue_at = time.time() - started
+                    print(f"First venue after {first_venue_at:.1f}s")
+                venues.append(venue)
+                yield sse_event('venue', venue)
+        except Exception as e:
+            print(f"ERROR in /discover/stream: {e}")
+            yield sse_event('error', error_payload(e))
+            return
+
+        if venues:
+            await asyncio.to_thread(remember_venues, key, venues, profile, target_city)
+        yield sse_event('done', {
+            'count': len(venues),
+            'cached': False,
+            'source': 'upstream',
+            'first_venue_seconds': first_venue_at,
+            'total_seconds': time.time() - started,
+        })
+
+    return sse_response(generate())
+
+
+async def tiered_events(profile, target_city, started):
+    """SSE frames for tiered discovery: venues, candidates, updates, done"""
+    try:
+        venues, _ = await discover_venues_fast(profile, target_city)
+        for venue in venues:
+            yield sse_event('venue', venue)
+        yield sse_event('candidates', {'count': len(venues),
+                                       'seconds': time.time() - started})
+        enriched = 0
+        async for i, venue in enrich_venues(venues, profile):
+            venues[i] = venue
+            enriched += 1
+            yield sse_event('update', {'index': i, 'venue': venue})
+    except Exception as e:
+        print(f"ERROR in /discover/stream (tiered): {e}")
+        yield sse_event('error', error_payload(e))
+        return
+
+    await asyncio.to_thread(finish_tiered, venues, profile, target_city)
+    yield sse_event('done', {
+        'count': len(venues),
+        'cached': False,
+        'source': 'upstream',
+        'enriched': enriched,
+        'total_seconds': time.time() - started,
+    })
+
+
+async def research(request):
+    """Research venue endpoint"""
+    try:
+        with span('parse'):
+            venue, profile = input_validator.research(request.json)
+
+        print(f"Researching venue: {venue.get('name')}")
+        text, meta = await research_venue_api(venue, profile)
+
+        with span('serialize'):
+            return json_response({'research': text, **meta})
+    except Exception as e:
+        return error_response(e, 'research')
+
+
+async def research_stream(request):
+    """Research a venue, forwarding text deltas as SSE events"""
+    try:
+        venue, profile = input_validator.research(request.json)
+    except Exception as e:
+        return json_response(error_payload(e), 400)
+
+    print(f"Streaming research for venue: {venue.get('name')}")
+
+    async def generate():
+        started = time.time()
+        first_token_at = None
+        try:
+            async for kind, payload in research_venue_stream(venue, profile):
+                if kind == 'text':
+                    if first_token_at is None:
+                        first_token_at = time.time() - started
+                    yield sse_event('text', {'text': payload})
+                else:
+                    yield sse_event('done', {
+                        'cache': payload,
+                        'first_token_seconds': first_token_at,
+                        'total_seconds': time.time() - started,
+                    })
+        except Exception as e:
+            print(f"ERROR in /research/stream: {e}")
+            yield sse_event('error', error_payload(e))
+
+    return sse_response(generate())
+
+
+async def rerank_venues(request):
+    """Re-sort and filter a discovered venue list locally, no upstream call"""
+    try:
+        venues, profile, options = input_validator.rerank(request.json)
+    except Exception as e:
+        return json_response(error_payload(e), 400)
+    venues, hidden = rerank(venues, profile, options)
+    return json_response({'venues': venues, 'hidden': hidden})
+
+
+async def metrics_endpoint(request):
+    """Prometheus scrape endpoint"""
+    body = await asyncio.to_thread(metrics.render)
+    return 200, {'Content-Type': CONTENT_TYPE}, body.encode()
+
+
+async def stats(request):
+    """Runtime stats endpoint"""
+    return json_response({
+        **await asyncio.to_thread(stats_payload),
+        'async_pool': client_manager.pool_stats(),
+        'async_inflight': inflight.stats(),
+    })
+
+
+ROUTES = {
+    '/': ('GET', 'index', index),
+    '/discover': ('POST', 'discover', discover),
+    '/discover/stream': ('POST', 'discover_stream', discover_stream),
+    '/research': ('POST', 'research', research),
+    '/research/stream': ('POST', 'research_stream', research_stream),
+    '/rerank': ('POST', 'rerank_venues', rerank_venues),
+    '/metrics': ('GET', 'metrics_endpoint', metrics_endpoint),
+    '/stats': ('GET', 'stats', stats),
+}
+
+
+def route(method, path):
+    """(endpoint, handler) for a request, with 404/405 fallbacks"""
+    if path.startswith('/assets/'):
+        allowed, endpoint, handler = 'GET', 'asset', asset
+    elif path in ROUTES:
+        allowed, endpoint, handler = ROUTES[path]
+    else:
+        return 'unknown', None
+    if method != allowed and not (method == 'HEAD' and allowed == 'GET'):
+        return endpoint, 'method'
+    return endpoint, handler
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await client_manager.aclose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def until_disconnect(receive):
+    """Return once the client has closed the connection"""
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def respond(scope, send, status, headers, body, timings):
+    headers['Server-Timing'] = timings.server_timing()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(k.lower().encode('latin-1'), v.encode('latin-1'))
+                    for k, v in headers.items()],
+    })
+    if scope['method'] == 'HEAD':
+        body = b''
+    if isinstance(body, bytes):
+        await send({'type': 'http.response.body', 'body': body})
+    else:
+        try:
+            async for chunk in body:
+                await send({'type': 'http.response.body',
+                            'body': chunk.encode(), 'more_body': True})
+        finally:
+            await body.aclose()
+        await send({'type': 'http.response.body', 'body': b''})
+
+
+async def handle(scope, send, handler, request, timings):
+    """Run handler and send its response; returns the status sent"""
+    status, headers, body = await handler(request)
+    await respond(scope, send, status, headers, body, timings)
+    return status
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    endpoint, handler = route(scope['method'], scope['path'])
+    timings = timing.begin()
+    HTTP_IN_FLIGHT.inc(endpoint)
+    status = 500
+    try:
+        if handler is None:
+            status, headers, body = json_response({'error': 'Not found'}, 404)
+            await respond(scope, send, status, headers, body, timings)
+        elif handler == 'method':
+            status, headers, body = json_response({'error': 'Method not allowed'}, 405)
+            await respond(scope, send, status, headers, body, timings)
+        else:
+            request = Request(scope, await read_body(receive))
+            # Race the handler against the client leaving; cancelling it
+            # closes any upstream call it is waiting on
+            task = asyncio.ensure_future(handle(scope, send, handler, request, timings))
+            gone = asyncio.ensure_future(until_disconnect(receive))
+            try:
+                await asyncio.wait((task, gone), return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                if not task.done():
+                    task.cancel()
+                gone.cancel()
+            try:
+                status = await task
+            except asyncio.CancelledError:
+                # Nobody reads a response now; 499 marks it in logs and metrics
+                status = 499
+    finally:
+        HTTP_IN_FLIGHT.dec(endpoint)
+        HTTP_LATENCY.observe(endpoint, str(status), value=timings.elapsed())
+        if timings.spans:
+            print(timings.log_record(event='request', method=scope['method'],
+                                     path=scope['path'], endpoint=endpoint,
+                                     status=status, server='asgi'))
+        timing.end()
@@ -0,0 +1,141 @@
+"""
+Discovery output format benchmark
+Compares the ---/VENUE: text layout with record_venues tool input on
+output size and on how many venues survive common model deviations.
+
+    python benchmarks/bench_discover_format.py --lists 200
+    python benchmarks/bench_discover_format.py --count-tokens   # exact counts, needs ANTHROPIC_API_KEY
+
+Without --count-tokens, sizes are estimated at four characters per token.
+Live traffic is tracked in /metrics: output tokens per call type
+(discover vs discover_tool) and venue_agent_discovery_responses_total by
+format.
+"""
+
+import argparse
+import json
+import os
+import random
+
+import common  # noqa: F401  (puts the repository on the import path)
+
+os.environ.setdefault('VENUE_STORE_DB', '')
+
+from main import parse_venues, tool_venues  # noqa: E402
+
+
+class Block:
+    """Stand-in for an SDK content block"""
+
+    def __init__(self, type, text=None, name=None, input=None):
+        self.type = type
+        self.name = name
+        self.input = input
+        if text is not None:
+            self.text = text
+
+
+TYPES = ['Club', 'Theater', 'Bar', 'Music Hall', 'Listening Room', 'Amphitheater']
+CITIES = [('Austin', 'TX'), ('Nashville', 'TN'), ('Portland', 'OR'), ('Chicago', 'IL')]
+
+
+def venue_list(rng, count):
+    city, state = rng.choice(CITIES)
+    return [{
+        'name': f"The {rng.choice(['Blue', 'Red', 'Velvet', 'Iron', 'Golden'])} "
+                f"{rng.choice(['Room', 'Hall', 'Lounge', 'Door'])} {i}",
+        'city': city,
+        'state': state,
+        'capacity': rng.choice([None, rng.randint(80, 2500)]),
+        'type': rng.choice(TYPES),
+        'website': rng.choice([None, f"https://venue{i}.example.com"]),
+        'match_score': rng.randint(40, 98),
+        'reason': 'Regularly books indie and folk acts with a similar draw.',
+    } for i in range(count)]
+
+
+def render_text(venues, rng, defects):
+    """Legacy layout, with the deviations models actually produce"""
+    out = ["I'll search for venues that match this artist.\n\n",
+           f"Here are {len(venues)} venues that would be a good fit:\n\n"]
+    for v in venues:
+        lines = [
+            f"VENUE: {v['name']}",
+            f"CITY: {v['city']}",
+            f"STATE: {v['state']}",
+            f"CAPACITY: {v['capacity'] or 'unknown'}",
+            f"TYPE: {v['type']}",
+            f"WEBSITE: {v['website'] or 'unknown'}",
+            f"MATCH_SCORE: {v['match_score']}",
+            f"REASON: {v['reason']}",
+        ]
+        if defects and rng.random() < 0.15:
+            lines = [f"**{line.replace(': ', ':** ', 1)}" for line in lines]
+        if defects and rng.random() < 0.05:
+            lines.pop(1)  # CITY left out: unrecoverable
+        separator = "---\n" if not defects or rng.random() > 0.05 else "\n"
+        out.append(separator + "\n".join(lines) + "\n")
+    out.append("---\n\nThese venues all book artists in your genre. Let me know if you need more detail.")
+    return "".join(out)
+
+
+def render_tool(venues, rng, defects):
+    items = []
+    for v in venues:
+        item = {k: value for k, value in v.items() if value is not None}
+        if defects and rng.random() < 0.1 and 'capacity' in item:
+            item['capacity'] = f"{item['capacity']:,}"  # string where an integer was asked for
+        if defects and rng.random() < 0.05:
+            item.pop('city')  # missing required field
+        items.append(item)
+    return {'venues': items}
+
+
+def token_counter(exact):
+    if not exact:
+        return lambda text: len(text) // 4
+    import anthropic
+    client = anthropic.Anthropic()
+    empty = client.messages.count_tokens(
+        model="claude-sonnet-4-5-20250929",
+        messages=[{"role": "user", "content": "."}]).input_tokens
+
+    def count(text):
+        return client.messages.count_tokens(
+            model="claude-sonnet-4-5-20250929",
+            messages=[{"role": "user", "content": text}]).input_tokens - empty
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--lists', type=int, default=200, help='discovery responses to simulate')
+    parser.add_argument('--venues', type=int, default=12, help='venues per response')
+    parser.add_argument('--count-tokens', action='store_true', help='use the token counting API')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    count = token_counter(args.count_tokens)
+    lists = [venue_list(rng, args.venues) for _ in range(args.lists)]
+    sample = lists[:20] if args.count_tokens else lists
+
+    text_tokens = sum(count(render_text(v, rng, False)) for v in sample)
+    tool_tokens = sum(count(json.dumps(render_tool(v, rng, False))) for v in sample)
+    print(f"Output size over {len(sample)} responses "
+          f"({'counted' if args.count_tokens else 'estimated'} tokens):")
+    print(f"  text  {text_tokens / len(sample):8.1f} per response")
+    print(f"  tool  {tool_tokens / len(sample):8.1f} per response "
+          f"({(tool_tokens - text_tokens) / text_tokens:+.1%})")
+
+    expected = args.lists * args.venues
+    text_ok = sum(len(parse_venues([Block('text', render_text(v, rng, True))])) for v in lists)
+    tool_ok = sum(len(tool_venues([Block('tool_use', name='record_venues',
+                                         input=render_tool(v, rng, True))])) for v in lists)
+    print(f"Venues recovered with injected deviations ({expected} expected):")
+    print(f"  text  {text_ok:6d}  {text_ok / expected:.1%}")
+    print(f"  tool  {tool_ok:6d}  {tool_ok / expected:.1%}")
+
+
+if __name__ == '__main__':
+    main()
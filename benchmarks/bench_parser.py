@@ -0,0 +1,162 @@
+"""
+Parser benchmark
+Compares parse_venues against the original multi-regex parser on
+synthetic responses with thousands of venue blocks.
+
+    python benchmarks/bench_parser.py --venues 5000 --repeat 5
+"""
+
+import argparse
+import random
+import re
+import time
+
+import common  # noqa: F401  (puts the repository on the import path)
+from main import parse_venues
+
+
+class TextBlock:
+    """Stand-in for an SDK text content block"""
+
+    def __init__(self, text):
+        self.text = text
+
+
+def legacy_parse_venues(content):
+    """The original parser, kept verbatim as the baseline"""
+    venues = []
+    text = ""
+    for block in content:
+        if hasattr(block, 'text'):
+            text += block.text
+    
+    blocks = text.split('---')
+    
+    for block in blocks:
+        if 'VENUE:' not in block:
+            continue
+        
+        try:
+            venue = {}
+            
+            m = re.search(r'VENUE:\s*(.+?)(?:\n|$)', block)
+            if m:
+                venue['name'] = m.group(1).strip()
+            
+            m = re.search(r'CITY:\s*(.+?)(?:\n|$)', block)
+            if m:
+                venue['city'] = m.group(1).strip()
+            
+            m = re.search(r'STATE:\s*(.+?)(?:\n|$)', block)
+            if m:
+                venue['state'] = m.group(1).strip()
+            
+            m = re.search(r'CAPACITY:\s*(.+?)(?:\n|$)', block)
+            if m:
+                cap = m.group(1).strip()
+                if cap.lower() != 'unknown':
+                    cm = re.search(r'\d+', cap)
+                    if cm:
+                        venue['capacity'] = int(cm.group())
+            
+            m = re.search(r'TYPE:\s*(.+?)(?:\n|$)', block)
+            if m:
+                venue['type'] = m.group(1).strip()
+            
+            m = re.search(r'WEBSITE:\s*(.+?)(?:\n|$)', block)
+            if m:
+                website = m.group(1).strip()
+                venue['website'] = None if website.lower() == 'unknown' else website
+            
+            m = re.search(r'MATCH_SCORE:\s*(\d+)', block)
+            if m:
+                venue['match_score'] = int(m.group(1))
+            else:
+                venue['match_score'] = 70
+            
+            m = re.search(r'REASON:\s*(.+?)(?:\n|---|$)', block, re.DOTALL)
+            if m:
+                venue['reason'] = m.group(1).strip()
+            
+            if 'name' in venue and 'city' in venue:
+                venues.append(venue)
+        except Exception as e:
+            print(f"Parse error: {e}")
+            continue
+    
+    return venues
+
+
+def label(name, style):
+    if style == 'bold':
+        return f"**{name}:**"
+    if style == 'bold-label':
+        return f"**{name}**:"
+    if style == 'title':
+        return name.replace('_', ' ').title() + ":"
+    if style == 'spaced':
+        return f"{name} :"
+    if style == 'bullet':
+        return f"- {name}:"
+    return f"{name}:"
+
+
+STYLES = ['plain', 'plain', 'plain', 'bold', 'bold-label', 'title', 'spaced', 'bullet']
+
+
+def make_block(i, rng, styles):
+    style = rng.choice(styles)
+    capacity = rng.choice(['unknown', str(rng.randint(50, 900)), f"{rng.randint(1, 9)},{rng.randint(100, 999)}"])
+    website = rng.choice(['unknown', f"https://venue{i}.example.com", f"[venue{i}](https://venue{i}.example.com)"])
+    lines = [
+        f"{label('VENUE', style)} Venue {i}",
+        f"{label('CITY', style)} City {i % 40}",
+        f"{label('STATE', style)} ST",
+        f"{label('CAPACITY', style)} {capacity}",
+        f"{label('TYPE', style)} Club",
+        f"{label('WEBSITE', style)} {website}",
+        f"{label('MATCH_SCORE', style)} {rng.randint(40, 99)}",
+        f"{label('REASON', style)} Books similar acts every week.",
+    ]
+    return "---\n" + "\n".join(lines) + "\n---\n"
+
+
+def make_corpus(venues, seed=0, styles=STYLES):
+    """A synthetic response with a mix of field formatting styles"""
+    rng = random.Random(seed)
+    intro = "Here are venues that match your profile.\n\n"
+    text = intro + "".join(make_block(i, rng, styles) for i in range(venues))
+    # Deltas of realistic size, as the API splits long answers into blocks
+    chunks = [text[i:i + 4096] for i in range(0, len(text), 4096)]
+    return [TextBlock(c) for c in chunks]
+
+
+def bench(fn, content, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(content)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--venues', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    for corpus, styles in (('exact format', ['plain']), ('mixed format', STYLES)):
+        content = make_corpus(args.venues, args.seed, styles)
+        print(f"\n{corpus}: {args.venues} venue blocks, "
+              f"{sum(len(b.text) for b in content) / 1024:.0f} KiB")
+        print(f"{'parser':<10} {'best (ms)':>10} {'blocks/s':>12} {'recovered':>12}")
+        for name, fn in (('legacy', legacy_parse_venues), ('current', parse_venues)):
+            seconds, venues = bench(fn, content, args.repeat)
+            print(f"{name:<10} {seconds * 1000:>10.1f} {args.venues / seconds:>12.0f} "
+                  f"{len(venues):>6}/{args.venues}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Disconnect cancellation check
+Starts the app against a slow stub Messages API, hangs up on each
+endpoint mid-call, and confirms the upstream stream was abandoned and
+counted as cancelled with tokens saved.
+
+    python benchmarks/check_cancellation.py
+    python benchmarks/check_cancellation.py --server asgi
+"""
+
+import argparse
+import json
+import socket
+import sys
+import time
+
+from common import (
+    PROFILE, VENUE, get_json, post, request, server_command, start_server, stub_env,
+)
+from stub_anthropic import StubAnthropic
+
+
+def hang_up(port, path, payload, after):
+    """Send a POST, then close the socket without reading the reply"""
+    body = json.dumps(payload).encode()
+    sock = socket.create_connection(('127.0.0.1', port))
+    sock.sendall(
+        f"POST {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+    time.sleep(after)
+    sock.close()
+
+
+def cancelled(port):
+    usage = get_json(port, '/stats')['usage']
+    return (sum(c.get('cancelled', 0) for c in usage.values()),
+            sum(c.get('tokens_saved', 0) for c in usage.values()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--server', choices=('waitress', 'asgi'), default='waitress')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=6.0, help='seconds per stub response')
+    args = parser.parse_args()
+
+    stub = StubAnthropic(latency=args.latency, output_tokens=2000, stream_chunk=8).start()
+    proc = start_server(server_command(args.server, 4, args.port), args.port, stub_env(stub))
+
+    cases = [
+        ('/discover', {'profile': PROFILE, 'targetCity': 'Austin, TX'}),
+        ('/research', {'venue': VENUE, 'profile': PROFILE}),
+        ('/discover/stream', {'profile': PROFILE, 'targetCity': 'Denver, CO'}),
+        ('/research/stream', {'venue': dict(VENUE, name='Other Room'), 'profile': PROFILE}),
+    ]
+    failures = []
+    try:
+        for path, payload in cases:
+            before, _ = cancelled(args.port)
+            aborted = stub.aborted
+            started = time.time()
+            hang_up(args.port, path, payload, after=1.0)
+            while time.time() - started < args.latency and (
+                    stub.aborted == aborted or cancelled(args.port)[0] == before):
+                time.sleep(0.1)
+            seconds = time.time() - started
+            count, saved = cancelled(args.port)
+            ok = stub.aborted > aborted and count > before and seconds < args.latency
+            print(f"{path:<18} upstream closed after {seconds:4.1f}s  "
+                  f"cancelled={count} tokens_saved={saved}  {'ok' if ok else 'FAIL'}")
+            if not ok:
+                failures.append(path)
+
+        if args.server == 'waitress':
+            before, _ = cancelled(args.port)
+            aborted = stub.aborted
+            _, job = post(args.port, '/jobs/research',
+                          {'venue': dict(VENUE, name='Job Room'), 'profile': PROFILE})
+            time.sleep(1.0)
+            request(args.port, 'DELETE', f"/jobs/{json.loads(job)['job_id']}")
+            started = time.time()
+            while time.time() - started < args.latency and stub.aborted == aborted:
+                time.sleep(0.1)
+            ok = stub.aborted > aborted and cancelled(args.port)[0] > before
+            print(f"{'DELETE /jobs/<id>':<18} upstream closed after "
+                  f"{time.time() - started:4.1f}s  {'ok' if ok else 'FAIL'}")
+            if not ok:
+                failures.append('jobs')
+    finally:
+        proc.kill()
+        proc.wait()
+        stub.stop()
+
+    if failures:
+        print(f"FAIL {', '.join(failures)}")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Streaming export check
+Fills a scratch venue store, exports it as CSV, JSONL and a research ZIP,
+and confirms the responses stream in chunks. Row exports must keep a flat
+peak as the store grows; the ZIP may only grow by its central directory
+entry per report.
+
+    python benchmarks/check_export.py
+    python benchmarks/check_export.py --venues 20000 50000 200000
+"""
+
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+
+import common  # noqa: F401  (puts the repository on the import path)
+
+SCRATCH = tempfile.mkdtemp()
+os.environ.setdefault('ANTHROPIC_API_KEY', 'stub')
+os.environ['VENUE_STORE_DB'] = os.path.join(SCRATCH, 'venues.db')
+# The research cache has to hold a report for every tenth venue
+os.environ['RESEARCH_CACHE_SIZE'] = '100000'
+os.environ.pop('RESEARCH_CACHE_DB', None)
+
+import main  # noqa: E402
+from cache import venue_cache_key  # noqa: E402
+
+# ZipInfo plus its name, kept for the central directory
+MAX_BYTES_PER_REPORT = 2048
+REPORT = "Booking contact, load-in notes and recent bills. " * 40
+
+
+def fill(target):
+    """Grow the store to target venues, caching research for every tenth"""
+    stored = main.venue_store.stats().get('venues', 0)
+    batch = []
+    for i in range(stored, target):
+        venue = {'name': f"Room {i}", 'city': f"City {i % 200}", 'state': 'TX',
+                 'capacity': 100 + i % 900, 'type': 'club',
+                 'website': f"https://room{i}.example.com", 'match_score': i % 100,
+                 'reason': 'Books touring indie acts on weeknights'}
+        batch.append(venue)
+        if i % 10 == 0:
+            main.research_cache.set(venue_cache_key(venue), REPORT)
+        if len(batch) == 5000:
+            main.venue_store.upsert(batch)
+            batch = []
+    main.venue_store.upsert(batch)
+
+
+def export(path, keep=False):
+    """(body or None, chunks, bytes, seconds, peak bytes) for one full export"""
+    client = main.app.test_client()
+    tracemalloc.start()
+    started = time.time()
+    response = client.get(path, buffered=False)
+    chunks = size = 0
+    body = io.BytesIO() if keep else None
+    for chunk in response.response:
+        chunk = chunk.encode() if isinstance(chunk, str) else chunk
+        chunks += 1
+        size += len(chunk)
+        if keep:
+            body.write(chunk)
+    seconds = time.time() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    response.close()
+    return body, chunks, size, seconds, peak
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--venues', type=int, nargs='+', default=[5000, 20000, 80000])
+    args = parser.parse_args()
+
+    counts = sorted(args.venues)
+    peaks = {}
+    failures = []
+    for count in counts:
+        fill(count)
+        for path in ('/export/venues?format=csv', '/export/venues?format=jsonl',
+                     '/export/research'):
+            _, chunks, size, seconds, peak = export(path)
+            peaks.setdefault(path, []).append(peak)
+            print(f"{count:>7} venues  {path:<28} {chunks:>7} chunks "
+                  f"{size / 1e6:7.1f} MB  {seconds:5.1f}s  peak {peak / 1e6:5.2f} MB")
+
+    # Rows: the largest export peaks no higher than twice the smallest
+    for path, values in peaks.items():
+        if path.startswith('/export/venues') and values[-1] > 2 * values[0] + 1e6:
+            failures.append(f"{path} memory grew with store size")
+    # ZIP: the central directory keeps one entry per report, nothing more
+    per_report = peaks['/export/research'][-1] / (counts[-1] // 10)
+    print(f"research ZIP peak per report {per_report:.0f} bytes")
+    if per_report > MAX_BYTES_PER_REPORT:
+        failures.append(f"/export/research holds {per_report:.0f} bytes per report")
+
+    body = export('/export/research', keep=True)[0]
+    names = zipfile.ZipFile(body).namelist()
+    if names[-1] != 'README.txt' or len(names) != counts[-1] // 10 + 1:
+        failures.append(f"ZIP has {len(names)} members")
+
+    if failures:
+        print(f"FAIL {'; '.join(failures)}")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main_()
@@ -0,0 +1,116 @@
+"""
+Shared ledger check
+Runs serve.py with several workers against the stub Messages API and
+confirms the workers admit calls as one node:
+
+- in-flight cap: with RATE_LIMIT_MAX_IN_FLIGHT set, the stub never sees
+  more calls open at once than the cap, whichever worker sent them
+- request budget: once the stub's per-minute budget is known, workers
+  hold back together; the same run with RATE_LIMIT_LEDGER empty (each
+  worker on its own) draws more upstream 429s
+
+    python benchmarks/check_ledger.py
+"""
+
+import argparse
+import http.client
+import sys
+import threading
+
+from common import PROFILE, free_port, post, server_command, start_server, stop_server, stub_env
+from stub_anthropic import StubAnthropic
+
+
+def fire(port, count, concurrency, tag):
+    """POST count distinct /research requests; returns status -> count"""
+    statuses = {}
+    lock = threading.Lock()
+    cursor = iter(range(count))
+
+    def worker():
+        while True:
+            with lock:
+                i = next(cursor, None)
+            if i is None:
+                return
+            body = {'profile': PROFILE, 'venue': {
+                'name': f"Ledger Room {tag} {i}", 'city': 'Austin', 'state': 'TX'}}
+            try:
+                status, _ = post(port, '/research', body, timeout=120)
+            except (OSError, http.client.HTTPException) as e:
+                status = type(e).__name__
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return statuses
+
+
+def serve(stub, workers, extra):
+    port = free_port()
+    env = stub_env(stub, RATE_LIMIT_MAX_ATTEMPTS='1', **extra)
+    return port, start_server(server_command('multi', 8, port, workers), port, env)
+
+
+def check_in_flight(args):
+    stub = StubAnthropic(latency=1.0).start()
+    port, proc = serve(stub, args.workers, {'RATE_LIMIT_MAX_IN_FLIGHT': str(args.cap)})
+    try:
+        statuses = fire(port, args.requests, args.requests, 'cap')
+    finally:
+        stop_server(proc)
+        stub.stop()
+    ok = stub.max_active <= args.cap and statuses.get(200) == args.requests
+    print(f"in-flight cap {args.cap} over {args.workers} workers: "
+          f"stub saw at most {stub.max_active} open  statuses={statuses}  "
+          f"{'ok' if ok else 'FAIL'}")
+    return ok
+
+
+def budget_run(args, ledger):
+    stub = StubAnthropic(latency=0.2, requests_per_minute=args.rpm, retry_after=30).start()
+    extra = {} if ledger else {'RATE_LIMIT_LEDGER': ''}
+    # Each research request makes two upstream calls (report and overlay)
+    port, proc = serve(stub, args.workers, extra)
+    try:
+        # A few single calls first, so several workers learn the budget
+        fire(port, args.workers, 1, f"warm-{ledger}")
+        statuses = fire(port, args.requests, 8, f"load-{ledger}")
+    finally:
+        stop_server(proc)
+        stub.stop()
+    return stub.rate_limited, len(stub.requests), statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--cap', type=int, default=3)
+    parser.add_argument('--rpm', type=int, default=30, help='stub requests per minute')
+    parser.add_argument('--requests', type=int, default=24)
+    args = parser.parse_args()
+
+    failures = []
+    if not check_in_flight(args):
+        failures.append('in-flight cap')
+
+    shared = budget_run(args, ledger=True)
+    alone = budget_run(args, ledger=False)
+    for name, (limited, sent, statuses) in (('shared ledger', shared), ('per worker', alone)):
+        print(f"{name:<14} upstream calls={sent:<3} upstream 429s={limited:<3} "
+              f"client statuses={statuses}")
+    if shared[0] >= alone[0] or shared[0] > args.workers:
+        failures.append('request budget')
+
+    if failures:
+        print(f"FAIL {', '.join(failures)}")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
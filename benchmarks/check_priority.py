@@ -0,0 +1,125 @@
+"""
+Upstream priority check
+Floods the app with discovery jobs and a tour against the stub
+Messages API, then times single research clicks. With the dispatcher a
+click must finish well ahead of the same run without it, where the same
+number of concurrent calls is enforced by the rate limiter's in-flight
+cap and calls get slots in no particular order. Also confirms a bulk
+call still runs under a steady stream of research calls.
+
+    python benchmarks/check_priority.py
+"""
+
+import argparse
+import statistics
+import sys
+import threading
+import time
+
+from common import (
+    PROFILE, free_port, get_json, post, server_command, start_server, stop_server, stub_env,
+)
+from priority import BULK, RESEARCH, Dispatcher
+from stub_anthropic import StubAnthropic
+
+
+def clicks_under_load(args, extra, tag):
+    """Seconds per research click while a backlog is queued"""
+    stub = StubAnthropic(latency=args.latency).start()
+    port = free_port()
+    env = stub_env(stub, JOB_WORKERS='8', TOUR_CONCURRENCY='8', **extra)
+    proc = start_server(server_command('waitress', 16, port), port, env)
+    try:
+        for i in range(args.jobs):
+            post(port, '/jobs/discover', {'profile': PROFILE, 'targetCity': f"Job City {tag} {i}"})
+        cities = [f"Tour City {tag} {i}" for i in range(args.jobs)]
+        tour = threading.Thread(target=post, args=(port, '/tour', {
+            'profile': PROFILE, 'cities': cities}))
+        tour.start()
+        time.sleep(0.5)
+        seconds, statuses = [], []
+
+        def click(i):
+            started = time.time()
+            status, _ = post(port, '/research', {'profile': PROFILE, 'venue': {
+                'name': f"Click Room {tag} {i}", 'city': 'Austin', 'state': 'TX'}})
+            seconds.append(time.time() - started)
+            statuses.append(status)
+
+        # Clicks a second apart, all while the backlog is still queued
+        clicks = []
+        for i in range(args.clicks):
+            clicks.append(threading.Thread(target=click, args=(i,)))
+            clicks[-1].start()
+            time.sleep(1)
+        for t in clicks:
+            t.join()
+        if set(statuses) != {200}:
+            raise SystemExit(f"/research returned {statuses}")
+        classes = get_json(port, '/stats')['priority']['classes']
+        tour.join()
+    finally:
+        stop_server(proc)
+        stub.stop()
+    return seconds, classes
+
+
+def starvation(max_wait=0.5, call_seconds=0.2):
+    """Seconds a bulk call waits while research calls never let up"""
+    dispatcher = Dispatcher(capacity=1, max_wait=max_wait)
+    stop = threading.Event()
+
+    def research():
+        while not stop.is_set():
+            with dispatcher.slot(RESEARCH):
+                time.sleep(call_seconds)
+
+    flood = [threading.Thread(target=research) for _ in range(4)]
+    for t in flood:
+        t.start()
+    time.sleep(call_seconds / 2)
+    with dispatcher.slot(BULK) as ticket:
+        waited = ticket.waited
+    stop.set()
+    for t in flood:
+        t.join()
+    return waited, dispatcher.stats()['classes'][BULK]['promoted']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=2, help='UPSTREAM_CONCURRENCY')
+    parser.add_argument('--latency', type=float, default=1.0, help='seconds per stub response')
+    parser.add_argument('--jobs', type=int, default=16, help='discovery jobs and tour cities')
+    parser.add_argument('--clicks', type=int, default=6)
+    args = parser.parse_args()
+
+    failures = []
+    results = {}
+    cap = str(args.concurrency)
+    runs = (('priority', {'UPSTREAM_CONCURRENCY': cap}),
+            ('unordered', {'UPSTREAM_CONCURRENCY': '0', 'RATE_LIMIT_MAX_IN_FLIGHT': cap}))
+    for name, extra in runs:
+        seconds, classes = clicks_under_load(args, extra, name)
+        results[name] = statistics.mean(seconds)
+        waits = '  '.join(
+            f"{cls} {c['admitted']} calls, max wait {c['max_wait_seconds']:.1f}s"
+            for cls, c in classes.items())
+        print(f"{name:<10} research click mean {results[name]:5.1f}s  "
+              f"({', '.join(f'{s:.1f}' for s in seconds)})  {waits}")
+    if results['priority'] * 2 > results['unordered']:
+        failures.append('research clicks not ahead of the backlog')
+
+    waited, promoted = starvation()
+    print(f"bulk call under a research flood waited {waited:.2f}s, promoted {promoted}")
+    if waited > 1.0 or promoted != 1:
+        failures.append('bulk call starved')
+
+    if failures:
+        print(f"FAIL {', '.join(failures)}")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
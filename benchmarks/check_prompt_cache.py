@@ -0,0 +1,90 @@
+"""
+Prompt cache layout check
+Runs discovery and research against the stub Messages API, which only
+caches prefixes past the model's minimum length, and confirms:
+
+- static instructions sit in the system prompt, not the user turn
+- the short static prefixes of discovery and the venue report never
+  claim a cache read or write
+- a second artist's overlay on a full venue report reads the report
+  from cache, while an overlay on a short report is billed as input
+
+    python benchmarks/check_prompt_cache.py
+"""
+
+import sys
+
+from common import PROFILE, VENUE, use_stub
+from stub_anthropic import StubAnthropic
+
+# Reports of about this many words, like a real thorough report
+stub = StubAnthropic(output_tokens=1200).start()
+use_stub(stub)
+
+import main  # noqa: E402
+
+ARTISTS = [PROFILE, {'name': 'Second Artist', 'genre': 'folk', 'drawSize': '100-200'}]
+SHORT_REPORT = "Books weeknight indie shows; contact the talent buyer by email."
+
+
+def totals():
+    summed = {}
+    for counts in main.usage_tracker.stats().values():
+        for name, value in counts.items():
+            summed[name] = summed.get(name, 0) + value
+    return summed
+
+
+def run(label, fn):
+    before = totals()
+    fn()
+    after = totals()
+    delta = {k: after[k] - before.get(k, 0) for k in after}
+    print(f"{label:<28} read={delta['cache_read_input_tokens']:>5} "
+          f"write={delta['cache_creation_input_tokens']:>5} "
+          f"uncached={delta['input_tokens']:>5}")
+    return delta
+
+
+def cached(delta):
+    return delta['cache_read_input_tokens'] + delta['cache_creation_input_tokens']
+
+
+def main_check():
+    failures = []
+    for artist in ARTISTS:
+        delta = run(f"discover {artist['name']}",
+                    lambda: main.discover_venues_api(artist, 'Austin, TX'))
+        if cached(delta):
+            failures.append(f"discover {artist['name']}: cached a prefix below the minimum")
+    report = main.research_venue_report(VENUE)
+    delta = run('research repeat', lambda: main.research_venue_report(VENUE))
+    if cached(delta):
+        failures.append("research: cached a prefix below the minimum")
+
+    overlays = [run(f"overlay {artist['name']}",
+                    lambda: main.research_artist_overlay(VENUE, artist, report))
+                for artist in ARTISTS]
+    if not overlays[1]['cache_read_input_tokens']:
+        failures.append("overlay 2: full report not read from cache")
+    for artist in ARTISTS:
+        delta = run(f"short overlay {artist['name']}",
+                    lambda: main.research_artist_overlay(VENUE, artist, SHORT_REPORT))
+        if cached(delta):
+            failures.append("short overlay: cached a prefix below the minimum")
+    run('research stream', lambda: list(
+        main.research_venue_stream(dict(VENUE, name='Streamed Room'), ARTISTS[0])))
+
+    failures.extend(stub.violations)
+    stub.stop()
+
+    print(f"usage totals: {main.usage_tracker.stats()}")
+    if failures:
+        for failure in failures:
+            print(f"FAIL {failure}")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main_check()
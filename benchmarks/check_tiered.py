@@ -0,0 +1,89 @@
+"""
+Tiered discovery check
+Runs tiered discovery against the stub Messages API, with the full tier
+slower than the fast one and some candidates missing details, and
+confirms candidates arrive first and the gaps are filled afterwards.
+
+    python benchmarks/check_tiered.py
+"""
+
+import json
+import sys
+import time
+
+from common import PROFILE, use_stub
+from stub_anthropic import StubAnthropic
+
+stub = StubAnthropic(missing=0.5, latency=0.5,
+                     model_latency={'sonnet': 6.0, 'haiku': 1.0}).start()
+use_stub(stub)
+
+import main  # noqa: E402
+
+
+def events(body):
+    """(event, payload, seconds) for each SSE frame from /discover/stream"""
+    started = time.time()
+    response = main.app.test_client().post('/discover/stream', json=body, buffered=False)
+    buffer = ''
+    for chunk in response.response:
+        buffer += chunk.decode() if isinstance(chunk, bytes) else chunk
+        while '\n\n' in buffer:
+            frame, buffer = buffer.split('\n\n', 1)
+            lines = dict(line.split(': ', 1) for line in frame.splitlines())
+            yield lines['event'], json.loads(lines['data']), time.time() - started
+
+
+def main_check():
+    failures = []
+    venues, first, candidates_at, updates = [], None, None, 0
+    for event, payload, seconds in events({'profile': PROFILE, 'targetCity': 'Austin, TX',
+                                           'mode': 'tiered'}):
+        if event == 'venue':
+            first = first or seconds
+            venues.append(payload)
+        elif event == 'candidates':
+            candidates_at = seconds
+        elif event == 'update':
+            updates += 1
+            venues[payload['index']] = payload['venue']
+        elif event == 'done':
+            print(f"first venue {first:.1f}s, candidates {candidates_at:.1f}s, "
+                  f"{updates} updates, done {seconds:.1f}s")
+        else:
+            failures.append(f"{event}: {payload}")
+    gaps = [v['name'] for v in venues if v.get('capacity') is None or not v.get('website')]
+    if gaps:
+        failures.append(f"still missing details: {gaps}")
+    if not updates:
+        failures.append("no enrichment updates")
+
+    started = time.time()
+    list(events({'profile': dict(PROFILE, name='Single Artist', genre='folk'),
+                 'targetCity': 'Austin, TX', 'mode': 'single'}))
+    print(f"single full pass {time.time() - started:.1f}s")
+
+    data = main.app.test_client().post('/discover', json={
+        'profile': dict(PROFILE, genre='jazz'), 'targetCity': 'Denver, CO', 'mode': 'tiered',
+    }).get_json()
+    job = main.job_queue.get(data['enrichment_job'])
+    job.future.result(timeout=60)
+    enriched = job.to_dict()['result']['venues']
+    print(f"/discover tiered: {len(data['venues'])} candidates, job {job.status}, "
+          f"{sum(1 for v in enriched if v.get('enriched'))} enriched")
+    if job.status != 'succeeded' or any(v.get('capacity') is None for v in enriched):
+        failures.append(f"enrichment job: {job.to_dict()}")
+
+    labels = {body['model'] for body in stub.requests}
+    print(f"models used: {sorted(labels)}")
+    failures.extend(stub.violations)
+    stub.stop()
+    if failures:
+        for failure in failures:
+            print(f"FAIL {failure}")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main_check()
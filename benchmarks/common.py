@@ -0,0 +1,96 @@
+"""
+Shared benchmark helpers
+Puts the repository on the import path and provides the sample profile,
+HTTP calls and app servers the check_* and bench_* scripts run against
+the stub Messages API
+"""
+
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+PROFILE = {'name': 'Benchmark Artist', 'genre': 'indie rock', 'drawSize': '200-400'}
+VENUE = {'name': 'The Stub Room', 'city': 'Austin', 'state': 'TX',
+         'website': 'https://stubroom.example.com'}
+
+
+def stub_env(stub, **extra):
+    """Environment for the app against stub; no venue store unless extra sets one"""
+    env = dict(os.environ, ANTHROPIC_API_KEY='stub', ANTHROPIC_BASE_URL=stub.base_url,
+               VENUE_STORE_DB='')
+    env.update(extra)
+    return env
+
+
+def use_stub(stub, **extra):
+    """Point the app in this process at stub; call before importing main"""
+    os.environ.update(stub_env(stub, **extra))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def request(port, method, path, body=None, timeout=30):
+    """(status, body bytes) for one request to the app"""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    try:
+        conn.request(method, path, json.dumps(body) if body is not None else None,
+                     {'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally:
+        conn.close()
+
+
+def post(port, path, body, timeout=300):
+    return request(port, 'POST', path, body, timeout)
+
+
+def get_json(port, path):
+    _, body = request(port, 'GET', path)
+    return json.loads(body)
+
+
+def server_command(server, threads, port, workers=4):
+    if server == 'asgi':
+        return [sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1',
+                '--port', str(port), '--log-level', 'warning']
+    if server == 'multi':
+        # serve.py is configured from the environment
+        return ['env', f'PORT={port}', 'HOST=127.0.0.1', f'WEB_THREADS={threads}',
+                f'WEB_CONCURRENCY={workers}', sys.executable, 'serve.py']
+    return [sys.executable, '-m', 'waitress', f'--threads={threads}',
+            f'--listen=127.0.0.1:{port}', '--channel-timeout=600',
+            '--channel-request-lookahead=1', 'main:app']
+
+
+def start_server(command, port, env):
+    proc = subprocess.Popen(command, cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"server exited with {proc.returncode}")
+        try:
+            request(port, 'GET', '/stats', timeout=2)
+            return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise SystemExit("server did not start")
+
+
+def stop_server(proc, timeout=15):
+    proc.terminate()
+    proc.wait(timeout=timeout)
@@ -0,0 +1,292 @@
+"""
+Load test
+Serves the app with waitress at several thread counts against the stub
+Messages API and measures throughput, latency percentiles and how many
+worker threads are busy.
+
+    python benchmarks/loadtest.py --threads 4,8,16 --concurrency 32 --requests 300 --latency 2
+    python benchmarks/loadtest.py --server asgi --concurrency 200 --requests 1000 --latency 2
+    python benchmarks/loadtest.py --server multi --workers 4 --threads 8 --latency 0.2
+    python benchmarks/loadtest.py --compare benchmarks/results/loadtest-abc1234.json
+
+Each run writes a JSON report named after the current commit. --compare
+runs the same parameters as the baseline report and exits non-zero when
+throughput or p95 latency regress beyond --tolerance.
+"""
+
+import argparse
+import http.client
+import json
+import math
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from common import ROOT, free_port, server_command, start_server, stop_server, stub_env
+from stub_anthropic import StubAnthropic
+
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+ENDPOINTS = {
+    'discover': '/discover',
+    'research': '/research',
+    'discover_stream': '/discover/stream',
+    'research_stream': '/research/stream',
+}
+
+
+def git_commit():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+        dirty = bool(subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                             cwd=ROOT, text=True).strip())
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+    return commit, dirty
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return None
+    index = max(0, math.ceil(pct / 100 * len(values)) - 1)
+    return values[index]
+
+
+def parse_mix(text):
+    """'discover=3,research=1' -> ['discover', 'discover', 'discover', 'research']"""
+    kinds = []
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in ENDPOINTS:
+            raise SystemExit(f"Unknown endpoint {name!r}; choose from {', '.join(ENDPOINTS)}")
+        kinds.extend([name] * int(weight or 1))
+    return kinds
+
+
+def request_body(kind, i, repeat):
+    """Unique bodies defeat the caches unless this request is a repeat"""
+    tag = 'repeat' if repeat else f'load-{i}'
+    profile = {'name': f'Load Artist {tag}', 'genre': 'indie rock',
+               'drawSize': '200-400', 'similarArtists': tag}
+    if kind.startswith('discover'):
+        return {'profile': profile, 'targetCity': 'Austin, TX'}
+    return {'profile': profile, 'venue': {'name': f'Load Venue {tag}', 'city': 'Austin',
+                                          'state': 'TX', 'website': 'https://venue.example.com'}}
+
+
+def handling_seconds(port):
+    """Total request handling time so far, from the /metrics latency sums"""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    conn.request('GET', '/metrics')
+    body = conn.getresponse().read().decode()
+    conn.close()
+    total = 0.0
+    for line in body.splitlines():
+        if line.startswith('venue_agent_http_request_duration_seconds_sum{') \
+                and 'metrics_endpoint' not in line:
+            total += float(line.rsplit(' ', 1)[1])
+    return total
+
+
+def run_load(port, threads, args):
+    kinds = parse_mix(args.mix)
+    plan = [(kinds[i % len(kinds)], i) for i in range(args.requests)]
+    results = []
+    lock = threading.Lock()
+    cursor = iter(plan)
+
+    def worker():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=args.timeout)
+        while True:
+            with lock:
+                item = next(cursor, None)
+            if item is None:
+                break
+            kind, i = item
+            repeat = args.repeat_ratio and (i % 100) < args.repeat_ratio * 100
+            body = json.dumps(request_body(kind, i, repeat))
+            started = time.perf_counter()
+            try:
+                conn.request('POST', ENDPOINTS[kind], body, {'Content-Type': 'application/json'})
+                response = conn.getresponse()
+                payload = response.read()
+                status = response.status
+                if status == 200 and kind.endswith('_stream') and b'event: error' in payload:
+                    status = 'stream_error'
+            except (OSError, http.client.HTTPException) as e:
+                status = type(e).__name__
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=args.timeout)
+            with lock:
+                results.append((kind, status, time.perf_counter() - started))
+        conn.close()
+
+    # Busy time over wall time is the mean number of requests being
+    # handled (Little's law); polling in-flight gauges would queue behind
+    # the load and only sample the tail. With several workers /metrics
+    # only shows whichever one answers, so it is skipped.
+    measure = args.server != 'multi'
+    handled_before = handling_seconds(port) if measure else 0.0
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    wall = time.perf_counter() - started
+    mean_busy = (handling_seconds(port) - handled_before) / wall if measure else None
+    return summarize(results, wall, threads, mean_busy)
+
+
+def latency_summary(seconds):
+    seconds = sorted(seconds)
+    ms = lambda v: None if v is None else round(v * 1000, 1)  # noqa: E731
+    return {
+        'count': len(seconds),
+        'p50_ms': ms(percentile(seconds, 50)),
+        'p95_ms': ms(percentile(seconds, 95)),
+        'p99_ms': ms(percentile(seconds, 99)),
+        'max_ms': ms(seconds[-1] if seconds else None),
+    }
+
+
+def summarize(results, wall, threads, mean_busy):
+    ok = [r for r in results if r[1] == 200]
+    statuses = {}
+    for _, status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    by_kind = {}
+    for kind in sorted({r[0] for r in results}):
+        by_kind[kind] = latency_summary([r[2] for r in ok if r[0] == kind])
+    return {
+        'threads': threads,
+        'requests': len(results),
+        'wall_seconds': round(wall, 3),
+        'throughput_rps': round(len(ok) / wall, 3) if wall else 0.0,
+        'latency': latency_summary([r[2] for r in ok]),
+        'by_endpoint': by_kind,
+        'status': statuses,
+        'busy_threads': None if mean_busy is None else {
+            'mean': round(mean_busy, 2),
+            'saturation': round(mean_busy / threads, 3),
+        },
+    }
+
+
+def run(args):
+    stub = StubAnthropic(latency=args.latency, venues=args.venues,
+                         output_tokens=args.output_tokens,
+                         rate_limit_every=args.rate_limit_every,
+                         retry_after=args.retry_after).start()
+    env = stub_env(stub, ANTHROPIC_POOL_SIZE=str(args.pool_size))
+    runs = []
+    try:
+        # The event loop server has no thread pool to size
+        for threads in (args.threads if args.server != 'asgi' else [1]):
+            port = free_port()
+            proc = start_server(server_command(args.server, threads, port, args.workers),
+                                port, env)
+            try:
+                before = len(stub.requests)
+                limited = stub.rate_limited
+                result = run_load(port, threads, args)
+                result['upstream'] = {'requests': len(stub.requests) - before,
+                                      'rate_limited': stub.rate_limited - limited}
+                runs.append(result)
+                print_run(result)
+            finally:
+                stop_server(proc, timeout=10)
+    finally:
+        stub.stop()
+    return runs
+
+
+def print_run(r):
+    lat = r['latency']
+    busy = r['busy_threads']
+    print(f"threads={r['threads']:<3} rps={r['throughput_rps']:<8} "
+          f"p50={lat['p50_ms']}ms p95={lat['p95_ms']}ms p99={lat['p99_ms']}ms "
+          f"busy={busy['mean'] if busy else '-'}/{r['threads']} status={r['status']}")
+
+
+def compare(baseline, current, tolerance):
+    """Print deltas per thread count; return True if anything regressed"""
+    regressed = False
+    base_runs = {r['threads']: r for r in baseline['runs']}
+    for run_ in current['runs']:
+        base = base_runs.get(run_['threads'])
+        if base is None:
+            continue
+        rps_change = (run_['throughput_rps'] - base['throughput_rps']) / (base['throughput_rps'] or 1)
+        p95_base, p95 = base['latency']['p95_ms'] or 0, run_['latency']['p95_ms'] or 0
+        p95_change = (p95 - p95_base) / (p95_base or 1)
+        bad = rps_change < -tolerance or p95_change > tolerance
+        regressed = regressed or bad
+        print(f"threads={run_['threads']:<3} rps {base['throughput_rps']} -> {run_['throughput_rps']} "
+              f"({rps_change:+.1%})  p95 {p95_base} -> {p95}ms ({p95_change:+.1%})"
+              f"{'  REGRESSION' if bad else ''}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--server', choices=('waitress', 'asgi', 'multi'), default='waitress')
+    parser.add_argument('--threads', default='4,8,16', help='waitress thread counts to try')
+    parser.add_argument('--workers', type=int, default=4, help='processes for --server multi')
+    parser.add_argument('--concurrency', type=int, default=32, help='client connections')
+    parser.add_argument('--requests', type=int, default=200, help='requests per thread count')
+    parser.add_argument('--mix', default='discover=3,research=1',
+                        help=f"weighted endpoints from {', '.join(ENDPOINTS)}")
+    parser.add_argument('--repeat-ratio', type=float, default=0.0,
+                        help='share of requests that repeat one query and can hit caches')
+    parser.add_argument('--latency', type=float, default=1.0, help='stub seconds per response')
+    parser.add_argument('--venues', type=int, default=12)
+    parser.add_argument('--output-tokens', type=int, default=400)
+    parser.add_argument('--rate-limit-every', type=int, default=0, help='stub 429 on every Nth request')
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--pool-size', type=int, default=100, help='ANTHROPIC_POOL_SIZE for the app')
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--output', help='report path (default benchmarks/results/loadtest-<commit>.json)')
+    parser.add_argument('--compare', help='baseline report; reuses its parameters')
+    parser.add_argument('--tolerance', type=float, default=0.10)
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        baseline['params'].setdefault('server', 'waitress')
+        for name, value in baseline['params'].items():
+            setattr(args, name, value)
+    else:
+        args.threads = [int(t) for t in str(args.threads).split(',')]
+
+    params = {name: getattr(args, name) for name in (
+        'server', 'threads', 'workers', 'concurrency', 'requests', 'mix', 'repeat_ratio', 'latency', 'venues',
+        'output_tokens', 'rate_limit_every', 'retry_after', 'pool_size')}
+    commit, dirty = git_commit()
+    report = {
+        'commit': commit,
+        'dirty': dirty,
+        'python': sys.version.split()[0],
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'params': params,
+        'runs': run(args),
+    }
+
+    name = f"loadtest-{commit}{'-dirty' if dirty else ''}{'' if args.server == 'waitress' else '-' + args.server}.json"
+    path = args.output or os.path.join(RESULTS_DIR, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {path}")
+
+    if baseline is not None and compare(baseline, report, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
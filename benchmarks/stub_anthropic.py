@@ -0,0 +1,402 @@
+"""
+Stub Messages API
+A local stand-in for POST /v1/messages that checks request shape,
+simulates prompt caching and rate limits, and returns venue-shaped text.
+
+    stub = StubAnthropic(latency=0.5).start()
+    os.environ['ANTHROPIC_BASE_URL'] = stub.base_url
+"""
+
+import hashlib
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Text that belongs in the system prompt, never in the user turn
+STATIC_MARKERS = ('format EXACTLY', 'call record_venues once', 'Provide detailed intelligence',
+                  '5. STRATEGIC VALUE')
+# Shortest prefix the API will cache, by model substring; shorter
+# breakpoints are billed as plain input
+MIN_CACHEABLE_TOKENS = (('haiku-4-5', 4096), ('opus-4-5', 4096), ('haiku', 2048))
+DEFAULT_MIN_CACHEABLE_TOKENS = 1024
+
+
+def min_cacheable_tokens(model):
+    for part, tokens in MIN_CACHEABLE_TOKENS:
+        if part in model:
+            return tokens
+    return DEFAULT_MIN_CACHEABLE_TOKENS
+
+
+def block_text(block):
+    if isinstance(block, str):
+        return block
+    return block.get('text', '')
+
+
+def content_blocks(content):
+    if isinstance(content, str):
+        return [{'type': 'text', 'text': content}]
+    return content
+
+
+def cached_prefix(body):
+    """Serialized request prefix up to the last cache_control breakpoint"""
+    parts = [json.dumps(body.get('tools', []), sort_keys=True)]
+    prefix = None
+    system = body.get('system') or []
+    if isinstance(system, str):
+        system = [{'type': 'text', 'text': system}]
+    for block in system:
+        parts.append(block_text(block))
+        if block.get('cache_control'):
+            prefix = list(parts)
+    for message in body.get('messages', []):
+        for block in content_blocks(message['content']):
+            parts.append(block_text(block))
+            if isinstance(block, dict) and block.get('cache_control'):
+                prefix = list(parts)
+    return prefix, parts
+
+
+def shape_errors(body):
+    """Reasons a request does not keep its static instructions in the system prompt"""
+    errors = []
+    if not body.get('system'):
+        errors.append('static instructions must be in the system prompt')
+    for message in body.get('messages', []):
+        if message['role'] != 'user':
+            continue
+        for block in content_blocks(message['content']):
+            text = block_text(block)
+            for marker in STATIC_MARKERS:
+                if marker in text:
+                    errors.append(f'static instruction {marker!r} found in user turn')
+    return errors
+
+
+def venue_list(count, rng, missing=0.0):
+    """count venues; a missing share of them lack capacity and website"""
+    venues = []
+    for i in range(count):
+        known = rng.random() >= missing
+        venues.append({
+            'name': f"Stub Venue {rng.randint(1, 10**6)}",
+            'city': 'Stubville',
+            'state': 'ST',
+            'capacity': rng.randint(80, 1500) if known else None,
+            'type': 'Club',
+            'website': f"https://venue{i}.example.com" if known else None,
+            'match_score': rng.randint(50, 99),
+            'reason': 'Books similar artists every month.',
+        })
+    return venues
+
+
+def venue_text(venues):
+    blocks = []
+    for v in venues:
+        blocks.append(
+            "---\n"
+            f"VENUE: {v['name']}\n"
+            f"CITY: {v['city']}\n"
+            f"STATE: {v['state']}\n"
+            f"CAPACITY: {v['capacity'] or 'unknown'}\n"
+            f"TYPE: {v['type']}\n"
+            f"WEBSITE: {v['website'] or 'unknown'}\n"
+            f"MATCH_SCORE: {v['match_score']}\n"
+            f"REASON: {v['reason']}\n"
+            "---\n"
+        )
+    return "Here are the venues I found.\n\n" + "".join(blocks)
+
+
+def report_text(tokens):
+    words = ("The booking contact responds within a week and prefers email "
+             "with an EPK link and recent draw numbers. ").split()
+    return " ".join(words[i % len(words)] for i in range(tokens))
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops connections under load tests
+    request_queue_size = 256
+
+
+class StubAnthropic:
+    """Threaded stub server with configurable latency, output and 429s"""
+
+    def __init__(self, latency=0.0, venues=12, output_tokens=400,
+                 rate_limit_every=0, retry_after=1, check_shape=True,
+                 stream_chunk=24, seed=0, missing=0.0, model_latency=None,
+                 requests_per_minute=None):
+        self.latency = latency
+        self.venues = venues
+        self.output_tokens = output_tokens
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.check_shape = check_shape
+        self.stream_chunk = stream_chunk
+        self.missing = missing
+        # {model substring: seconds}, overriding latency for matching models
+        self.model_latency = model_latency or {}
+        # Request budget that refills continuously, like the real API's,
+        # enforced with 429s and reported in the rate-limit headers; None
+        # for a roomy fixed budget
+        self.requests_per_minute = requests_per_minute
+        self._level = requests_per_minute
+        self._level_at = time.time()
+        self.active = 0
+        self.max_active = 0
+        self.rng = random.Random(seed)
+        self.requests = []
+        self.violations = []
+        self.rate_limited = 0
+        # Streams the client hung up on before message_stop
+        self.aborted = 0
+        self._seen_prefixes = set()
+        self._count = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self, port=0):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get('content-length', 0))
+                body = json.loads(self.rfile.read(length) or b'{}')
+                with stub._lock:
+                    stub.active += 1
+                    stub.max_active = max(stub.max_active, stub.active)
+                try:
+                    stub.handle(self, body)
+                finally:
+                    with stub._lock:
+                        stub.active -= 1
+
+        self._server = StubServer(('127.0.0.1', port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def usage_for(self, body, output_tokens):
+        prefix, parts = cached_prefix(body)
+        total = sum(len(p) for p in parts) // 4
+        usage = {'input_tokens': total, 'output_tokens': output_tokens,
+                 'cache_read_input_tokens': 0, 'cache_creation_input_tokens': 0}
+        cached = sum(len(p) for p in prefix) // 4 if prefix is not None else 0
+        if cached and cached >= min_cacheable_tokens(body.get('model', '')):
+            # The cache is per model
+            key = hashlib.sha256('\x00'.join([body.get('model', ''), *prefix]).encode()).hexdigest()
+            with self._lock:
+                hit = key in self._seen_prefixes
+                self._seen_prefixes.add(key)
+            usage['cache_read_input_tokens' if hit else 'cache_creation_input_tokens'] = cached
+            usage['input_tokens'] = total - cached
+        if body.get('tools'):
+            usage['server_tool_use'] = {'web_search_requests': 1}
+        return usage
+
+    def latency_for(self, body):
+        model = body.get('model', '')
+        for part, seconds in self.model_latency.items():
+            if part in model:
+                return seconds
+        return self.latency
+
+    def _refill(self, now):
+        rpm = self.requests_per_minute
+        self._level = min(rpm, self._level + (now - self._level_at) * rpm / 60)
+        self._level_at = now
+
+    def within_budget(self):
+        """Take one request from the budget; False when it is empty"""
+        if self.requests_per_minute is None:
+            return True
+        with self._lock:
+            self._refill(time.time())
+            if self._level < 1:
+                return False
+            self._level -= 1
+            return True
+
+    def rate_limit_headers(self):
+        reset_in = 60
+        limit, remaining = 1000, 999
+        if self.requests_per_minute is not None:
+            with self._lock:
+                self._refill(time.time())
+                limit = self.requests_per_minute
+                remaining = int(self._level)
+                # Reset is when the bucket will be full again
+                reset_in = (limit - self._level) * 60 / limit
+        reset = (datetime.now(timezone.utc) + timedelta(seconds=reset_in)).isoformat()
+        return {
+            'anthropic-ratelimit-requests-limit': str(limit),
+            'anthropic-ratelimit-requests-remaining': str(remaining),
+            'anthropic-ratelimit-requests-reset': reset,
+        }
+
+    def handle(self, handler, body):
+        with self._lock:
+            self._count += 1
+            count = self._count
+            self.requests.append(body)
+
+        if self.check_shape:
+            errors = shape_errors(body)
+            if errors:
+                with self._lock:
+                    self.violations.extend(errors)
+                return self.send_json(handler, 400, {
+                    'type': 'error',
+                    'error': {'type': 'invalid_request_error', 'message': '; '.join(errors)},
+                })
+
+        over = not self.within_budget()
+        if over or self.rate_limit_every and count % self.rate_limit_every == 0:
+            with self._lock:
+                self.rate_limited += 1
+            return self.send_json(handler, 429, {
+                'type': 'error',
+                'error': {'type': 'rate_limit_error', 'message': 'stub rate limit'},
+            }, {'retry-after': str(self.retry_after)})
+
+        system = json.dumps(body.get('system', ''))
+        tools = [tool.get('name') for tool in body.get('tools', [])]
+        stop_reason = 'end_turn'
+        if 'record_venues' in tools:
+            venues = {'venues': venue_list(self.venues, self.rng, self.missing)}
+            text = json.dumps(venues)
+            content = [{'type': 'tool_use', 'id': f'toolu_stub_{count}',
+                        'name': 'record_venues', 'input': venues}]
+            stop_reason = 'tool_use'
+        elif 'record_venue_details' in tools:
+            details = {'capacity': self.rng.randint(80, 2500),
+                       'website': f"https://venue{count}.example.com",
+                       'match_score': self.rng.randint(40, 98),
+                       'reason': 'Books similar acts most weekends.'}
+            text = json.dumps(details)
+            content = [{'type': 'tool_use', 'id': f'toolu_stub_{count}',
+                        'name': 'record_venue_details', 'input': details}]
+            stop_reason = 'tool_use'
+        else:
+            if 'VENUE: [name]' in system:
+                text = venue_text(venue_list(self.venues, self.rng, self.missing))
+            else:
+                text = report_text(min(self.output_tokens, body.get('max_tokens', 1000)))
+            content = [{'type': 'text', 'text': text}]
+        output_tokens = len(text) // 4
+        usage = self.usage_for(body, output_tokens)
+
+        if body.get('stream'):
+            return self.send_stream(handler, body, content[0], text, stop_reason, usage)
+        time.sleep(self.latency_for(body))
+        self.send_json(handler, 200, {
+            'id': f'msg_stub_{count}',
+            'type': 'message',
+            'role': 'assistant',
+            'model': body.get('model', 'stub'),
+            'content': content,
+            'stop_reason': stop_reason,
+            'stop_sequence': None,
+            'usage': usage,
+        }, self.rate_limit_headers())
+
+    def send_json(self, handler, status, payload, headers=None):
+        data = json.dumps(payload).encode()
+        handler.send_response(status)
+        handler.send_header('content-type', 'application/json')
+        handler.send_header('content-length', str(len(data)))
+        for name, value in (headers or {}).items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def send_stream(self, handler, body, block, text, stop_reason, usage):
+        handler.send_response(200)
+        handler.send_header('content-type', 'text/event-stream')
+        handler.send_header('connection', 'close')
+        for name, value in self.rate_limit_headers().items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.close_connection = True
+
+        def event(kind, data):
+            data = dict(data, type=kind)
+            handler.wfile.write(f"event: {kind}\ndata: {json.dumps(data)}\n\n".encode())
+            handler.wfile.flush()
+
+        start_usage = dict(usage, output_tokens=1)
+        chunks = [text[i:i + self.stream_chunk] for i in range(0, len(text), self.stream_chunk)]
+        delay = self.latency_for(body) / max(len(chunks), 1)
+        try:
+            event('message_start', {'message': {
+                'id': 'msg_stub_stream', 'type': 'message', 'role': 'assistant',
+                'model': body.get('model', 'stub'), 'content': [],
+                'stop_reason': None, 'stop_sequence': None, 'usage': start_usage,
+            }})
+            if block['type'] == 'tool_use':
+                start = dict(block, input={})
+                delta = lambda chunk: {'type': 'input_json_delta', 'partial_json': chunk}
+            else:
+                start = {'type': 'text', 'text': ''}
+                delta = lambda chunk: {'type': 'text_delta', 'text': chunk}
+            event('content_block_start', {'index': 0, 'content_block': start})
+            for chunk in chunks:
+                time.sleep(delay)
+                event('content_block_delta', {'index': 0, 'delta': delta(chunk)})
+            event('content_block_stop', {'index': 0})
+            event('message_delta', {
+                'delta': {'stop_reason': stop_reason, 'stop_sequence': None},
+                'usage': {'output_tokens': usage['output_tokens']},
+            })
+            event('message_stop', {})
+        except (BrokenPipeError, ConnectionResetError):
+            with self._lock:
+                self.aborted += 1
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--port', type=int, default=9100)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds per response')
+    parser.add_argument('--venues', type=int, default=12, help='venues per discovery')
+    parser.add_argument('--output-tokens', type=int, default=400, help='words per report')
+    parser.add_argument('--rate-limit-every', type=int, default=0, help='answer every Nth request with 429')
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--no-shape-check', action='store_true')
+    args = parser.parse_args()
+    stub = StubAnthropic(latency=args.latency, venues=args.venues,
+                         output_tokens=args.output_tokens,
+                         rate_limit_every=args.rate_limit_every,
+                         retry_after=args.retry_after,
+                         check_shape=not args.no_shape_check).start(args.port)
+    print(f"Stub Messages API on {stub.base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == '__main__':
+    main()
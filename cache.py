@@ -0,0 +1,243 @@
+"""
+Result caches
+Bounded in-memory LRU with TTL, optionally backed by SQLite on disk
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_text(value):
+    """Lowercase and collapse whitespace"""
+    return re.sub(r'\s+', ' ', str(value or '')).strip().lower()
+
+
+def normalize_list(value):
+    """Normalize a comma separated string into a sorted tuple"""
+    if isinstance(value, (list, tuple)):
+        items = value
+    else:
+        items = str(value or '').split(',')
+    return tuple(sorted({normalize_text(i) for i in items if normalize_text(i)}))
+
+
+def make_key(prefix, parts):
+    """Stable cache key from a JSON-serializable structure"""
+    raw = json.dumps(parts, sort_keys=True, separators=(',', ':'))
+    return f"{prefix}:{hashlib.sha1(raw.encode('utf-8')).hexdigest()}"
+
+
+def discover_cache_key(profile, target_city):
+    """Cache key for a discovery query"""
+    return make_key('discover', {
+        'genre': normalize_text(profile.get('genre')),
+        'draw': re.sub(r'\s+', '', normalize_text(profile.get('drawSize'))),
+        'similar': normalize_list(profile.get('similarArtists')),
+        'city': normalize_text(target_city),
+    })
+
+
+def normalize_url(value):
+    """Strip scheme, www and trailing slashes from a website"""
+    url = normalize_text(value)
+    if url in ('', 'unknown', 'none'):
+        return ''
+    url = re.sub(r'^[a-z]+://', '', url)
+    url = re.sub(r'^www\.', '', url)
+    return url.rstrip('/')
+
+
+def venue_cache_key(venue):
+    """Cache key for artist-independent venue research"""
+    return make_key('venue', {
+        'name': normalize_text(venue.get('name')),
+        'city': normalize_text(venue.get('city')),
+        'website': normalize_url(venue.get('website')),
+    })
+
+
+def overlay_key(venue, profile):
+    """Key for one artist's overlay on one venue's research"""
+    return make_key('overlay', {
+        'venue': venue_cache_key(venue),
+        'name': normalize_text(profile.get('name')),
+        'genre': normalize_text(profile.get('genre')),
+        'draw': re.sub(r'\s+', '', normalize_text(profile.get('drawSize'))),
+        'fee': normalize_text(profile.get('feeRange')),
+        'similar': normalize_list(profile.get('similarArtists')),
+    })
+
+
+class SQLiteBackend:
+    """On-disk store so cached entries survive restarts"""
+
+    def __init__(self, path, max_entries=5000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "created_at REAL NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at, expires_at FROM cache WHERE key = ?",
+                (key,),
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1], row[2]
+
+    def set(self, key, value, created_at, expires_at):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, created_at, expires_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), created_at, expires_at),
+            )
+            self._writes += 1
+            evicted = 0
+            if self._writes % 50 == 0:
+                evicted = self._prune()
+            self._conn.commit()
+        return evicted
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def _prune(self):
+        cur = self._conn.execute(
+            "DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+        evicted = cur.rowcount
+        cur = self._conn.execute(
+            "DELETE FROM cache WHERE key NOT IN "
+            "(SELECT key FROM cache ORDER BY created_at DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+        return evicted + cur.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after a TTL"""
+
+    def __init__(self, max_entries=512, ttl=3600, backend=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.backend = backend
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get_entry(self, key):
+        """Return (value, created_at, expires_at) or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                if entry[2] > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return entry
+                del self._data[key]
+                self.expirations += 1
+        if self.backend is not None:
+            entry = self.backend.get(key)
+            if entry is not None and entry[2] > now:
+                with self._lock:
+                    self._store(key, entry)
+                    self.hits += 1
+                return entry
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def peek(self, key):
+        """Cached value or None, without counting a hit or touching LRU order"""
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+        if entry is None and self.backend is not None:
+            entry = self.backend.get(key)
+        if entry is None or entry[2] <= now:
+            return None
+        return entry[0]
+
+    def get(self, key):
+        """Return the cached value or None"""
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def set(self, key, value, ttl=None):
+        """Cache a value for ttl seconds and return the stored entry"""
+        created_at = time.time()
+        entry = (value, created_at, created_at + (ttl or self.ttl))
+        with self._lock:
+            self._store(key, entry)
+        if self.backend is not None:
+            evicted = self.backend.set(key, value, entry[1], entry[2])
+            if evicted:
+                with self._lock:
+                    self.evictions += evicted
+        return entry
+
+    def delete(self, key):
+        """Drop a key from every tier"""
+        with self._lock:
+            self._data.pop(key, None)
+        if self.backend is not None:
+            self.backend.delete(key)
+
+    def _store(self, key, entry):
+        self._data[key] = entry
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        """Hit, miss and eviction counters"""
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'persistent': self.backend is not None,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+    @classmethod
+    def from_env(cls, prefix, max_entries=512, ttl=3600):
+        """Build a cache from <PREFIX>_CACHE_SIZE/_TTL/_DB variables"""
+        env = os.environ
+        db_path = env.get(f"{prefix}_CACHE_DB")
+        backend = SQLiteBackend(db_path) if db_path else None
+        return cls(
+            max_entries=int(env.get(f"{prefix}_CACHE_SIZE", max_entries)),
+            ttl=float(env.get(f"{prefix}_CACHE_TTL", ttl)),
+            backend=backend,
+        )
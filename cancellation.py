@@ -0,0 +1,96 @@
+"""
+Request cancellation
+Lets upstream calls notice that nobody is waiting for their result any more
+"""
+
+import contextvars
+import functools
+import threading
+from contextlib import contextmanager
+
+_current = contextvars.ContextVar('cancel_token', default=None)
+
+
+class Cancelled(Exception):
+    """Raised inside work whose caller has gone away"""
+
+
+class CancelToken:
+    """Cancelled once cancel() is called or any check returns true
+
+    checks are polled, e.g. waitress's client_disconnected callable.
+    """
+
+    def __init__(self, *checks, event=None):
+        self.checks = [check for check in checks if check is not None]
+        self.event = event or threading.Event()
+
+    @property
+    def cancelled(self):
+        if self.event.is_set():
+            return True
+        for check in self.checks:
+            if check():
+                self.event.set()
+                return True
+        return False
+
+    def cancel(self):
+        self.event.set()
+
+
+class SharedToken:
+    """Cancelled only once every caller sharing the work is cancelled
+
+    A None member (a caller that cannot be cancelled) keeps it alive.
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+
+    @property
+    def cancelled(self):
+        return all(token is not None and token.cancelled for token in list(self.tokens))
+
+
+def begin(token):
+    """Bind token to the request on this thread"""
+    _current.set(token)
+    return token
+
+
+def current():
+    """Token for the work on this thread, or None"""
+    return _current.get()
+
+
+def end():
+    _current.set(None)
+
+
+@contextmanager
+def bound(token):
+    """Run a block under token, restoring the previous one afterwards"""
+    reset = _current.set(token)
+    try:
+        yield token
+    finally:
+        _current.reset(reset)
+
+
+def check():
+    """Raise Cancelled if the current work has been cancelled"""
+    token = _current.get()
+    if token is not None and token.cancelled:
+        raise Cancelled("caller went away")
+
+
+def propagate(fn):
+    """Wrap fn to run under the current token on another thread"""
+    token = _current.get()
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        with bound(token):
+            return fn(*args, **kwargs)
+    return run
@@ -0,0 +1,106 @@
+"""
+Bulk export
+Generators that turn venue rows and research reports into CSV, JSONL or
+ZIP output one row or file at a time, so a response can be streamed with
+chunked transfer and memory stays flat however large the export is
+"""
+
+import csv
+import io
+import json
+import re
+import zipfile
+
+COLUMNS = ('name', 'city', 'state', 'capacity', 'type', 'website',
+           'match_score', 'reason')
+
+# Spreadsheets and CRMs evaluate cells starting with these as formulas
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+# Rows are batched up to this many characters per chunk, so a large export
+# is not one chunked-transfer frame and socket write per row
+CHUNK_SIZE = 64 * 1024
+
+
+def cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_stream(rows, columns=COLUMNS):
+    """Yield a header line, then CSV lines for each row dict, in chunks"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([cell(row.get(name)) for name in columns])
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def jsonl_stream(rows):
+    """Yield one JSON object per line, in chunks"""
+    lines = []
+    size = 0
+    for row in rows:
+        line = json.dumps(row) + "\n"
+        lines.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield ''.join(lines)
+            lines = []
+            size = 0
+    if lines:
+        yield ''.join(lines)
+
+
+class _ChunkWriter:
+    """Write-only file object whose output is drained after each write
+
+    ZipFile accepts unseekable output and then writes data descriptors
+    after each member instead of seeking back to fix up its header.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        self.size = 0
+        return data
+
+
+def zip_stream(members):
+    """Yield a ZIP archive of (name, text) members as bytes chunks"""
+    out = _ChunkWriter()
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, text in members:
+            with archive.open(name, 'w') as member:
+                member.write(text.encode('utf-8'))
+            if out.size >= CHUNK_SIZE:
+                yield out.drain()
+    # Remaining members and the central directory
+    yield out.drain()
+
+
+def safe_filename(text, fallback='venue'):
+    """Lowercase ASCII slug for a file name inside the archive"""
+    slug = re.sub(r'[^a-z0-9]+', '_', (text or '').lower()).strip('_')
+    return slug[:80] or fallback
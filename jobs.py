@@ -0,0 +1,174 @@
+"""
+Background jobs
+Bounded worker pool for long upstream calls with poll/subscribe support
+"""
+
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import cancellation
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class QueueFull(Exception):
+    """Raised when too many jobs are already waiting"""
+
+
+class Job:
+    """One unit of background work and its observable state"""
+
+    def __init__(self, kind, fn, args):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.fn = fn
+        self.args = args
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.retry_after = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.version = 0
+        self.cancel_event = threading.Event()
+        self.future = None
+        self._cond = threading.Condition()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def _update(self, **fields):
+        with self._cond:
+            if self.status in FINISHED:
+                return False
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.version += 1
+            self._cond.notify_all()
+            return True
+
+    def wait_for_change(self, version, timeout):
+        """Block until the job moves past version or timeout expires"""
+        with self._cond:
+            self._cond.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def to_dict(self):
+        with self._cond:
+            data = {
+                'job_id': self.id,
+                'kind': self.kind,
+                'status': self.status,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+            }
+            if self.status == SUCCEEDED:
+                data['result'] = self.result
+            elif self.status == FAILED:
+                data['error'] = self.error
+                if self.retry_after is not None:
+                    data['retry_after'] = self.retry_after
+            return data
+
+
+class JobQueue:
+    """Runs jobs on a bounded thread pool and keeps results for a while"""
+
+    def __init__(self, max_workers=4, max_pending=100, result_ttl=900):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Build a queue from JOB_* environment variables"""
+        env = os.environ
+        return cls(
+            max_workers=int(env.get('JOB_WORKERS', 4)),
+            max_pending=int(env.get('JOB_MAX_PENDING', 100)),
+            result_ttl=float(env.get('JOB_RESULT_TTL', 900)),
+        )
+
+    def submit(self, kind, fn, *args):
+        """Enqueue fn(*args) and return its Job"""
+        job = Job(kind, fn, args)
+        with self._lock:
+            self._prune()
+            pending = sum(1 for j in self._jobs.values() if j.status == QUEUED)
+            if pending >= self.max_pending:
+                raise QueueFull(f"{pending} jobs already queued")
+            self._jobs[job.id] = job
+        job.future = self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        """Look up a job by id"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job; returns the job or None"""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.cancel_event.set()
+        if job.future is not None:
+            job.future.cancel()
+        job._update(status=CANCELLED, finished_at=time.time())
+        return job
+
+    def _run(self, job):
+        if job.cancelled:
+            return
+        job._update(status=RUNNING, started_at=time.time())
+        try:
+            # cancel() sets the event, which stops the upstream call too
+            with cancellation.bound(cancellation.CancelToken(event=job.cancel_event)):
+                result = job.fn(*job.args)
+        except cancellation.Cancelled:
+            pass
+        except Exception as e:
+            print(f"Job {job.id} ({job.kind}) failed: {e}")
+            job._update(status=FAILED, error=str(e), finished_at=time.time(),
+                        retry_after=getattr(e, 'retry_after', None))
+        else:
+            job._update(status=SUCCEEDED, result=result, finished_at=time.time())
+
+    def _prune(self):
+        cutoff = time.time() - self.result_ttl
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.status in FINISHED and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def stats(self):
+        """Job counts by status"""
+        with self._lock:
+            self._prune()
+            counts = {status: 0 for status in (QUEUED, RUNNING) + FINISHED}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+        counts['max_workers'] = self.max_workers
+        counts['max_pending'] = self.max_pending
+        return counts
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
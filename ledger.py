@@ -0,0 +1,152 @@
+"""
+Shared usage ledger
+Rate-limit budgets, reset times, the 429 block and each worker's in-flight
+calls kept in one SQLite WAL file, so every worker process on a node
+admits calls against the same numbers
+"""
+
+import fcntl
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    name TEXT PRIMARY KEY,
+    lim INTEGER NOT NULL,
+    remaining REAL NOT NULL,
+    reset_at REAL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS state (
+    name TEXT PRIMARY KEY,
+    value REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS workers (
+    pid INTEGER PRIMARY KEY,
+    in_flight INTEGER NOT NULL,
+    pending_requests INTEGER NOT NULL,
+    pending_input_tokens INTEGER NOT NULL,
+    pending_output_tokens INTEGER NOT NULL
+);
+"""
+# Bucket name -> workers column of budget taken but not yet seen upstream
+PENDING = {
+    'requests': 'pending_requests',
+    'input-tokens': 'pending_input_tokens',
+    'output-tokens': 'pending_output_tokens',
+}
+
+
+class UsageLedger:
+    """Limiter state shared by the worker processes on one node
+
+    Each decision runs in one transaction: load() refreshes the limiter
+    from the file, the limiter decides, store() writes it back. Writers
+    use BEGIN IMMEDIATE, so a check and the reservation that follows it
+    never interleave with another worker's. They queue on a flock first:
+    SQLite's own busy handler sleeps and polls, which put 100ms+ stalls
+    on calls when several workers were admitting at once.
+    """
+
+    def __init__(self, path, timeout=5.0):
+        self.path = path
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=timeout, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Losing the last moments of budget state in a power cut is harmless
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._lock_file = open(path + '.lock', 'a')
+        # A process that had this pid before cannot still have calls open
+        self._conn.execute("DELETE FROM workers WHERE pid = ?", (self.pid,))
+        self.transactions = 0
+        self.lock_wait_seconds = 0.0
+
+    @classmethod
+    def from_env(cls):
+        """Ledger at RATE_LIMIT_LEDGER; None keeps limits per process"""
+        path = os.environ.get('RATE_LIMIT_LEDGER')
+        return cls(path) if path else None
+
+    @contextmanager
+    def transaction(self, write=True):
+        """Hold the ledger for one decision; a read-only one takes no write lock"""
+        with self._lock:
+            started = time.perf_counter()
+            if write:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            try:
+                self._conn.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+                self.lock_wait_seconds += time.perf_counter() - started
+                self.transactions += 1
+                try:
+                    yield
+                except BaseException:
+                    self._conn.execute("ROLLBACK")
+                    raise
+                self._conn.execute("COMMIT")
+            finally:
+                if write:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def load(self, limiter):
+        """Copy the shared buckets, block and node totals into limiter"""
+        rows = self._conn.execute(
+            "SELECT name, lim, remaining, reset_at, updated_at FROM buckets").fetchall()
+        for name, limit, remaining, reset_at, updated_at in rows:
+            bucket = limiter.buckets.get(name)
+            if bucket is not None:
+                bucket.limit = limit
+                bucket.remaining = remaining
+                bucket.reset_at = reset_at
+                bucket.updated_at = updated_at
+        row = self._conn.execute(
+            "SELECT value FROM state WHERE name = 'blocked_until'").fetchone()
+        limiter.blocked_until = row[0] if row else 0.0
+        columns = ', '.join(f"coalesce(sum({c}), 0)" for c in ('in_flight', *PENDING.values()))
+        totals = self._conn.execute(f"SELECT {columns} FROM workers").fetchone()
+        limiter.node_in_flight = totals[0]
+        limiter.node_pending = dict(zip(PENDING, totals[1:]))
+
+    def store(self, limiter):
+        """Write limiter's buckets, block and this worker's row back"""
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO buckets (name, lim, remaining, reset_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [(name, b.limit, b.remaining, b.reset_at, b.updated_at)
+             for name, b in limiter.buckets.items() if b.limit is not None])
+        self._conn.execute(
+            "INSERT OR REPLACE INTO state (name, value) VALUES ('blocked_until', ?)",
+            (limiter.blocked_until,))
+        self._conn.execute(
+            f"INSERT OR REPLACE INTO workers (pid, in_flight, {', '.join(PENDING.values())}) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (self.pid, limiter.in_flight, *(limiter.pending[name] for name in PENDING)))
+
+    def forget(self, pid):
+        """Drop the calls of a worker that has exited"""
+        with self.transaction():
+            self._conn.execute("DELETE FROM workers WHERE pid = ?", (pid,))
+
+    def clear_workers(self):
+        """Drop every worker's calls, before any worker has started"""
+        with self.transaction():
+            self._conn.execute("DELETE FROM workers")
+
+    def stats(self):
+        return {
+            'path': self.path,
+            'pid': self.pid,
+            'transactions': self.transactions,
+            'lock_wait_seconds': round(self.lock_wait_seconds, 3),
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+            self._lock_file.close()
@@ -3,13 +3,103 @@ Venue Discovery Web App
 Complete web interface for musicians
 """
 
-from flask import Flask, render_template_string, request, jsonify
-import anthropic
+from flask import Flask, Response, render_template_string, request, jsonify
+import asyncio
+import atexit
+import json
 import os
 import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack, contextmanager
+
+import cancellation
+from cache import TTLCache, discover_cache_key, overlay_key, venue_cache_key
+from cancellation import Cancelled, CancelToken
+from export import csv_stream, jsonl_stream, safe_filename, zip_stream
+from jobs import FINISHED, QUEUED, RUNNING, JobQueue, QueueFull
+from metrics import CONTENT_TYPE, COUNT_BUCKETS, Registry
+import priority
+from priority import BULK, DISCOVER, Dispatcher
+from ranking import rerank
+from ratelimit import RateLimited, RateLimiter
+from singleflight import SingleFlight
+from static_assets import build_site
+import timing
+from tiers import Tier
+from timing import Profiler, span
+from tour import merge_tour, route_order
+from venue_store import VenueStore
+from upstream import ClientManager, UsageTracker
+from validation import InputValidator, Invalid
 
 app = Flask(__name__)
 
+client_manager = ClientManager.from_env()
+atexit.register(client_manager.close)
+usage_tracker = UsageTracker()
+
+discover_cache = TTLCache.from_env('DISCOVER', max_entries=512, ttl=3600)
+research_cache = TTLCache.from_env('RESEARCH', max_entries=1024, ttl=7 * 86400)
+RESEARCH_STALE_AFTER = float(os.environ.get('RESEARCH_STALE_AFTER', 86400))
+
+rate_limiter = RateLimiter.from_env()
+dispatcher = Dispatcher.from_env()
+inflight = SingleFlight()
+input_validator = InputValidator.from_env()
+
+venue_store = VenueStore.from_env()
+if venue_store is not None:
+    atexit.register(venue_store.close)
+
+job_queue = JobQueue.from_env()
+atexit.register(job_queue.shutdown)
+
+TOUR_MAX_CITIES = int(os.environ.get('TOUR_MAX_CITIES', 25))
+tour_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('TOUR_CONCURRENCY', 4)),
+    thread_name_prefix='tour')
+
+# 'single' makes one full discovery call; 'tiered' returns a fast
+# candidate list first, then enriches venues in the background
+DISCOVER_MODE = os.environ.get('DISCOVER_MODE', 'single')
+FULL_TIER = Tier.from_env('full', "claude-sonnet-4-5-20250929", 3000)
+FAST_TIER = Tier.from_env('fast', "claude-haiku-4-5-20251001", 1500, web_searches=2)
+ENRICH_TIER = Tier.from_env('enrich', "claude-haiku-4-5-20251001", 600, web_searches=2)
+ENRICH_LIMIT = int(os.environ.get('DISCOVER_ENRICH_LIMIT', 15))
+ENRICH_CONCURRENCY = int(os.environ.get('DISCOVER_ENRICH_CONCURRENCY', 4))
+enrich_executor = ThreadPoolExecutor(
+    max_workers=ENRICH_CONCURRENCY, thread_name_prefix='enrich')
+
+profiler = Profiler.from_env()
+
+metrics = Registry()
+HTTP_LATENCY = metrics.histogram(
+    'venue_agent_http_request_duration_seconds',
+    'End-to-end request time, including streamed bodies', ('endpoint', 'status'))
+HTTP_IN_FLIGHT = metrics.gauge(
+    'venue_agent_http_requests_in_flight', 'Requests being handled', ('endpoint',))
+UPSTREAM_LATENCY = metrics.histogram(
+    'venue_agent_upstream_request_duration_seconds',
+    'Messages API time per attempt', ('call', 'outcome'))
+UPSTREAM_IN_FLIGHT = metrics.gauge(
+    'venue_agent_upstream_requests_in_flight', 'Messages API calls open', ('call',))
+UPSTREAM_QUEUE_WAIT = metrics.histogram(
+    'venue_agent_upstream_queue_wait_seconds',
+    'Time a call waited for its turn in the priority dispatcher', ('class',))
+VENUES_PARSED = metrics.histogram(
+    'venue_agent_discovery_venues_parsed', 'Venues parsed per upstream discovery',
+    ('mode',), buckets=COUNT_BUCKETS)
+DISCOVER_FORMAT = metrics.counter(
+    'venue_agent_discovery_responses_total',
+    'Discovery responses by how venues were read', ('format',))
+EXPORT_ROWS = metrics.counter(
+    'venue_agent_export_rows_total', 'Venues and reports written by exports', ('format',))
+PARSE_FAILURES = metrics.counter(
+    'venue_agent_venue_parse_failures_total',
+    'Venue blocks dropped by the parser', ('reason',))
+
 # HTML Template - Single page application
 HTML_TEMPLATE = """
 <!DOCTYPE html>
@@ -260,6 +350,18 @@ HTML_TEMPLATE = """
         
         <div id="venuesSection" class="card hidden">
             <h2>Discovered Venues</h2>
+            <div class="venue-details" style="margin-bottom: 15px">
+                <select id="rankSort" onchange="applyRanking()">
+                    <option value="score">Best fit</option>
+                    <option value="capacity">Capacity</option>
+                    <option value="match">Match score</option>
+                </select>
+                <label><input type="checkbox" id="rankHideUnfit" onchange="applyRanking()"> Hide too big / too small</label>
+                <input type="text" id="rankTypes" placeholder="Types, e.g. club, theater" oninput="applyRanking()">
+                <span id="rankHidden"></span>
+                <button type="button" onclick="exportVenues('csv')">Export CSV</button>
+                <button type="button" onclick="exportVenues('research')">Export reports</button>
+            </div>
             <div id="venuesList"></div>
         </div>
         
@@ -334,48 +436,53 @@ HTML_TEMPLATE = """
     const controller = new AbortController();
     const timeoutId = setTimeout(() => controller.abort(), 180000);
 
+    let data = {};
+    currentVenues = [];
+    document.getElementById('venuesList').innerHTML = '';
+
     try {
-        const response = await fetch('/discover', {
+        const response = await fetch('/discover/stream', {
             method: 'POST',
             headers: {'Content-Type': 'application/json'},
             body: JSON.stringify({profile, targetCity}),
             signal: controller.signal
         });
 
+        if (!response.ok) {
+            data = await response.json();
+        } else {
+            await readEventStream(response, (event, payload) => {
+                if (event === 'venue') {
+                    currentVenues.push(payload);
+                    appendVenue(payload, currentVenues.length - 1);
+                } else if (event === 'candidates') {
+                    // Tiered discovery: details keep arriving as updates
+                    document.getElementById('loadingDiscover').classList.add('hidden');
+                    showMessage(`Found ${payload.count} venues, filling in details...`, 'success');
+                } else if (event === 'update') {
+                    currentVenues[payload.index] = payload.venue;
+                    applyRanking();
+                } else {
+                    data = payload;
+                }
+            });
+        }
         clearTimeout(timeoutId);
-        const data = await response.json();
         
         if (data.error) {
             console.log('Error received:', data.error); // Debug log
             
-            // Check if it's a rate limit error (check multiple variations)
-            const errorLower = data.error.toLowerCase();
-            if (errorLower.includes('rate') || errorLower.includes('limit')) {
-                showMessage('⏱️ Rate limit reached. Waiting 60 seconds and retrying...', 'error');
-                
-                // Show countdown
-                let countdown = 60;
-                const countdownInterval = setInterval(() => {
-                    countdown--;
-                    showMessage(`⏱️ Rate limit reached. Retrying in ${countdown} seconds...`, 'error');
-                }, 1000);
-                
-                // Wait 60 seconds
-                await new Promise(resolve => setTimeout(resolve, 60000));
-                clearInterval(countdownInterval);
-                
-                // Retry the request
-                showMessage('Retrying now...', 'success');
-                document.getElementById('loadingResearch').classList.remove('hidden');
-                await researchVenue(index);
+            // The server reports exactly how long the upstream budget needs
+            if (data.error === 'RATE_LIMIT_ERROR') {
+                await waitForRateLimit(data.retry_after);
+                await discoverVenues();
                 return;
             } else {
                 showMessage('Error: ' + data.error, 'error');
             }
         } else {
-            currentVenues = data.venues;
-            displayVenues(data.venues);
-            showMessage(`Found ${data.venues.length} venues!`, 'success');
+            showMessage(`Found ${currentVenues.length} venues${data.cached ? ' (cached)' : ''}!`, 'success');
+            applyRanking();
         }
     } catch (error) {
         clearTimeout(timeoutId);
@@ -392,22 +499,134 @@ HTML_TEMPLATE = """
 }
         
         function displayVenues(venues) {
+            document.getElementById('venuesList').innerHTML = '';
+            venues.forEach((venue, idx) => appendVenue(venue, idx));
+        }
+        
+        // Same rules as ranking.py, so re-sorting needs no round trip
+        function parseRange(text) {
+            text = (text || '').toLowerCase().replace(/[,$]/g, '');
+            const amounts = [...text.matchAll(/(\\d+(?:\\.\\d+)?)\\s*(k\\b)?/g)]
+                .map(m => parseFloat(m[1]) * (m[2] ? 1000 : 1));
+            if (!amounts.length) return [null, null];
+            let high = Math.max(...amounts);
+            if (amounts.length === 1 && text.includes('+')) high = null;
+            return [Math.min(...amounts), high];
+        }
+        
+        function capacityFit(capacity, low, high) {
+            if (!capacity || low === null) return 0.5;
+            const fill = (high !== null ? (low + high) / 2 : low) / capacity;
+            if (fill < 0.6) return fill / 0.6;
+            if (fill > 1.0) return 1.0 / fill;
+            return 1.0;
+        }
+        
+        function feeFit(capacity, feeLow) {
+            if (!capacity || !feeLow) return 0.5;
+            return Math.min(1.0, capacity * 20 * 0.7 / feeLow);
+        }
+        
+        function rankVenues(venues, profile, options) {
+            const [low, high] = parseRange(profile.drawSize);
+            const [feeLow] = parseRange(profile.feeRange);
+            const types = (options.types || []).map(t => t.trim().toLowerCase()).filter(t => t);
+            const ranked = [];
+            venues.forEach((venue, idx) => {
+                const capacity = venue.capacity;
+                const venueType = (venue.type || '').toLowerCase();
+                const typeFit = types.length
+                    ? types.filter(t => venueType.includes(t)).length / types.length : 1;
+                if (!typeFit) return;
+                if (options.hideUnfit && capacity && low !== null
+                        && (capacity < low || capacity > (high || low) * 3)) return;
+                const score = 0.5 * (venue.match_score ?? 70) / 100
+                    + 0.3 * capacityFit(capacity, low, high)
+                    + 0.1 * typeFit
+                    + 0.1 * feeFit(capacity, feeLow);
+                ranked.push({venue, idx, score});
+            });
+            const keys = {
+                capacity: r => r.venue.capacity || 0,
+                match: r => r.venue.match_score || 0,
+                score: r => r.score
+            };
+            const key = keys[options.sort] || keys.score;
+            return ranked.sort((a, b) => key(b) - key(a));
+        }
+        
+        function applyRanking() {
+            const ranked = rankVenues(currentVenues, saveProfile(), {
+                sort: document.getElementById('rankSort').value,
+                hideUnfit: document.getElementById('rankHideUnfit').checked,
+                types: document.getElementById('rankTypes').value.split(',')
+            });
+            document.getElementById('venuesList').innerHTML = '';
+            // Cards keep their index into currentVenues for researchVenue
+            ranked.forEach(r => appendVenue(r.venue, r.idx));
+            const hidden = currentVenues.length - ranked.length;
+            document.getElementById('rankHidden').textContent = hidden ? `${hidden} hidden` : '';
+        }
+        
+        async function exportVenues(kind) {
+            const path = kind === 'research' ? '/export/research' : '/export/venues';
+            const response = await fetch(path, {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({venues: currentVenues, format: kind})
+            });
+            if (!response.ok) {
+                showMessage('Export failed: ' + (await response.json()).error, 'error');
+                return;
+            }
+            const disposition = response.headers.get('Content-Disposition') || '';
+            const link = document.createElement('a');
+            link.href = URL.createObjectURL(await response.blob());
+            link.download = (disposition.match(/filename="(.+)"/) || [])[1] || 'venues';
+            link.click();
+            URL.revokeObjectURL(link.href);
+        }
+        
+        function appendVenue(venue, idx) {
             const container = document.getElementById('venuesList');
-            container.innerHTML = venues.map((venue, idx) => `
+            container.insertAdjacentHTML('beforeend', `
                 <div class="venue-card" onclick="researchVenue(${idx})">
                     <div class="venue-name">${venue.name}</div>
                     <div class="venue-details">
-                        📍 ${venue.city}, ${venue.state}
+                        📍 ${[venue.city, venue.state].filter(Boolean).join(', ')}
                         ${venue.capacity ? `• 👥 Capacity: ${venue.capacity}` : ''}
                     </div>
                     <div class="venue-details">${venue.reason}</div>
                     <span class="match-score">${venue.match_score}% Match</span>
                 </div>
-            `).join('');
+            `);
             
             document.getElementById('venuesSection').classList.remove('hidden');
         }
         
+        async function readEventStream(response, onEvent) {
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const {value, done} = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, {stream: true});
+                let sep;
+                while ((sep = buffer.indexOf('\\n\\n')) !== -1) {
+                    const frame = buffer.slice(0, sep);
+                    buffer = buffer.slice(sep + 2);
+                    let event = 'message';
+                    let data = '';
+                    for (const line of frame.split('\\n')) {
+                        if (line.startsWith('event:')) event = line.slice(6).trim();
+                        else if (line.startsWith('data:')) data += line.slice(5).trim();
+                    }
+                    if (data) onEvent(event, JSON.parse(data));
+                }
+            }
+        }
+        
         async function researchVenue(index) {
     const venue = currentVenues[index];
     const profile = saveProfile();
@@ -420,38 +639,45 @@ HTML_TEMPLATE = """
     const controller = new AbortController();
     const timeoutId = setTimeout(() => controller.abort(), 180000);
 
+    let data = {};
+    currentResearch = '';
+    const content = document.getElementById('researchContent');
+    content.textContent = '';
+    document.getElementById('researchTitle').textContent = `Research: ${venue.name}`;
+
     try {
-        const response = await fetch('/research', {
+        const response = await fetch('/research/stream', {
             method: 'POST',
             headers: {'Content-Type': 'application/json'},
             body: JSON.stringify({venue, profile}),
             signal: controller.signal
         });
 
-clearTimeout(timeoutId);
-        const data = await response.json();
+        if (!response.ok) {
+            data = await response.json();
+        } else {
+            await readEventStream(response, (event, payload) => {
+                if (event === 'text') {
+                    if (!currentResearch) {
+                        document.getElementById('loadingResearch').classList.add('hidden');
+                        document.getElementById('researchSection').classList.remove('hidden');
+                        document.getElementById('researchSection').scrollIntoView({behavior: 'smooth'});
+                    }
+                    currentResearch += payload.text;
+                    content.textContent = currentResearch;
+                } else {
+                    data = payload;
+                }
+            });
+        }
+        clearTimeout(timeoutId);
         
         if (data.error) {
             console.log('Error received:', data.error); // Debug log
             
-            // Check if it's a rate limit error (check multiple variations)
-            const errorLower = data.error.toLowerCase();
-            if (errorLower.includes('rate') || errorLower.includes('limit')) {
-                showMessage('⏱️ Rate limit reached. Waiting 60 seconds and retrying...', 'error');
-                
-                // Show countdown
-                let countdown = 60;
-                const countdownInterval = setInterval(() => {
-                    countdown--;
-                    showMessage(`⏱️ Rate limit reached. Retrying in ${countdown} seconds...`, 'error');
-                }, 1000);
-                
-                // Wait 60 seconds
-                await new Promise(resolve => setTimeout(resolve, 60000));
-                clearInterval(countdownInterval);
-                
-                // Retry the request
-                showMessage('Retrying now...', 'success');
+            // The server reports exactly how long the upstream budget needs
+            if (data.error === 'RATE_LIMIT_ERROR') {
+                await waitForRateLimit(data.retry_after);
                 document.getElementById('loadingResearch').classList.remove('hidden');
                 await researchVenue(index);
                 return;
@@ -459,11 +685,10 @@ clearTimeout(timeoutId);
                 showMessage('Error: ' + data.error, 'error');
             }
         } else {
-            currentResearch = data.research;
-            document.getElementById('researchTitle').textContent = `Research: ${venue.name}`;
-            document.getElementById('researchContent').textContent = data.research;
-            document.getElementById('researchSection').classList.remove('hidden');
-            document.getElementById('researchSection').scrollIntoView({behavior: 'smooth'});
+            if (data.cache && data.cache.hit) {
+                const note = data.cache.stale ? ' (may be outdated)' : '';
+                showMessage(`Venue details researched ${formatAge(data.cache.age_seconds)} ago${note}`, 'success');
+            }
         }
     } catch (error) {
         clearTimeout(timeoutId);
@@ -478,6 +703,26 @@ clearTimeout(timeoutId);
     }
 }
         
+        async function waitForRateLimit(seconds) {
+            const wait = seconds || 60;
+            let countdown = wait;
+            showMessage(`⏱️ Rate limit reached. Retrying in ${countdown} seconds...`, 'error');
+            const countdownInterval = setInterval(() => {
+                countdown--;
+                showMessage(`⏱️ Rate limit reached. Retrying in ${countdown} seconds...`, 'error');
+            }, 1000);
+            
+            await new Promise(resolve => setTimeout(resolve, wait * 1000));
+            clearInterval(countdownInterval);
+            showMessage('Retrying now...', 'success');
+        }
+        
+        function formatAge(seconds) {
+            if (seconds < 3600) return `${Math.max(1, Math.round(seconds / 60))} min`;
+            if (seconds < 86400) return `${Math.round(seconds / 3600)} h`;
+            return `${Math.round(seconds / 86400)} days`;
+        }
+        
         function downloadResearch() {
             const element = document.createElement('a');
             const file = new Blob([currentResearch], {type: 'text/plain'});
@@ -495,23 +740,230 @@ clearTimeout(timeoutId);
 
 
 def get_client():
-    """Get Anthropic client"""
-    api_key = os.environ.get("ANTHROPIC_API_KEY")
-    if not api_key:
-        raise ValueError("ANTHROPIC_API_KEY environment variable not set")
-    return anthropic.Anthropic(api_key=api_key)
+    """Get the shared Anthropic client"""
+    return client_manager.get()
 
 
-def discover_venues_api(profile, target_city):
-    """Discover venues using Claude"""
+def estimate_usage(kwargs):
+    """Rough input/output token reservation for the rate limiter"""
+    chars = sum(len(str(m.get('content', ''))) for m in kwargs.get('messages', []))
+    chars += len(str(kwargs.get('system', '')))
+    return {'input_tokens': chars // 4, 'output_tokens': kwargs.get('max_tokens', 0)}
+
+
+def record_usage(label, usage, finished=True):
+    """Log one call's token usage, split into cache reads and writes"""
+    if usage is None:
+        return
+    counts = usage_tracker.record(label, usage, finished)
+    print(f"Usage {label}: input={counts['input_tokens']} "
+          f"cache_read={counts['cache_read_input_tokens']} "
+          f"cache_write={counts['cache_creation_input_tokens']} "
+          f"output={counts['output_tokens']}")
+
+
+def create_message(label, **kwargs):
+    """messages.create admitted and retried by the rate limiter
+
+    When the caller can go away (a cancel token is bound) the call is
+    streamed instead, so it can be abandoned between events.
+    """
     client = get_client()
+    token = cancellation.current()
     
-    prompt = f"""Find 10-15 music venues in {target_city} for this artist:
+    def send():
+        if token is None:
+            with upstream_timer(label):
+                raw = client.messages.with_raw_response.create(**kwargs)
+            return raw.parse(), raw.headers
+        if token.cancelled:
+            abandon(label, kwargs, sent=False)
+            raise Cancelled(f"{label} cancelled before sending")
+        with upstream_timer(label), client.messages.stream(**kwargs) as stream:
+            try:
+                for _ in watch(stream):
+                    pass
+            except Cancelled:
+                usage = snapshot_usage(stream)
+                abandon(label, kwargs, usage)
+                record_usage(label, usage, finished=False)
+                raise
+            return stream.get_final_message(), stream.response.headers
+    
+    with span(f'upstream_{label}'), dispatched(label, kwargs):
+        response = rate_limiter.call(send, **estimate_usage(kwargs))
+    record_usage(label, response.usage)
+    return response
+
+
+@contextmanager
+def stream_message(label, **kwargs):
+    """messages.stream admitted and retried by the rate limiter
+
+    Iterate it with text_deltas() so a departed caller stops the stream.
+    """
+    client = get_client()
+    token = cancellation.current()
+    
+    def send():
+        if token is not None and token.cancelled:
+            abandon(label, kwargs, sent=False)
+            raise Cancelled(f"{label} cancelled before sending")
+        # The timer stays open until the stream is closed below
+        stack = ExitStack()
+        stack.enter_context(upstream_timer(label))
+        try:
+            stream = stack.enter_context(client.messages.stream(**kwargs))
+        except BaseException:
+            stack.__exit__(*sys.exc_info())
+            raise
+        return (stack, stream), stream.response.headers
+    
+    timings = timing.current()
+    started = time.perf_counter()
+    with dispatched(label, kwargs):
+        (stack, stream), slot = rate_limiter.call(send, hold=True, **estimate_usage(kwargs))
+        finished = False
+        try:
+            with stack:
+                try:
+                    yield stream
+                    finished = True
+                except (Cancelled, GeneratorExit):
+                    # GeneratorExit: the server closed a streamed response early
+                    abandon(label, kwargs, snapshot_usage(stream))
+                    raise
+        finally:
+            slot.release()
+            if timings is not None:
+                timings.add(f'upstream_{label}', time.perf_counter() - started)
+            record_usage(label, snapshot_usage(stream), finished)
+
+
+def snapshot_usage(stream):
+    """Usage so far on a message stream, or None before message_start"""
+    try:
+        return stream.current_message_snapshot.usage
+    except Exception:
+        return None
+
+
+def watch(stream):
+    """Iterate stream events, raising Cancelled once the caller has gone"""
+    token = cancellation.current()
+    for event in stream:
+        if token is not None and token.cancelled:
+            raise Cancelled("caller went away")
+        yield event
+
+
+def text_deltas(stream):
+    """stream.text_stream, checked for cancellation on every event"""
+    for event in watch(stream):
+        if event.type == 'content_block_delta' and event.delta.type == 'text_delta':
+            yield event.delta.text
+
+
+def abandon(label, kwargs, usage=None, sent=True):
+    """Count a call nobody is waiting for any more
+
+    usage is what the call reported before it was dropped. Closing its
+    connection stops generation upstream; tokens already produced are
+    still billed and recorded.
+    """
+    produced = getattr(usage, 'output_tokens', None) or 0
+    unsent = 0 if sent else estimate_usage(kwargs)['input_tokens']
+    saved = usage_tracker.record_cancelled(
+        label, produced, kwargs.get('max_tokens', 0), unsent_input=unsent)
+    print(f"Cancelled {label}: caller went away, ~{saved} tokens saved")
+
+
+@contextmanager
+def dispatched(label, kwargs):
+    """Hold a dispatcher slot in the call's priority class
+
+    The slot is taken before the rate limiter, so calls waiting on the
+    budget are already in priority order.
+    """
+    with ExitStack() as stack:
+        try:
+            ticket = stack.enter_context(dispatcher.slot(priority.classify(label)))
+        except Cancelled:
+            abandon(label, kwargs, sent=False)
+            raise
+        UPSTREAM_QUEUE_WAIT.observe(ticket.name, value=ticket.waited)
+        yield ticket
 
-Artist: {profile['name']}
-Genre: {profile['genre']}
-Draw: {profile['drawSize']}
-Similar Artists: {profile.get('similarArtists', 'N/A')}
+
+@contextmanager
+def upstream_timer(label, pool=None):
+    """Time one upstream attempt and count it as in flight
+
+    pool is the client manager whose connection it holds, the shared
+    sync one by default.
+    """
+    started = time.perf_counter()
+    UPSTREAM_IN_FLIGHT.inc(label)
+    outcome = 'error'
+    try:
+        with (pool or client_manager).checkout():
+            yield
+        outcome = 'ok'
+    except (Cancelled, GeneratorExit, asyncio.CancelledError):
+        outcome = 'cancelled'
+        raise
+    finally:
+        UPSTREAM_IN_FLIGHT.dec(label)
+        UPSTREAM_LATENCY.observe(label, outcome, value=time.perf_counter() - started)
+
+
+def cached_block(text):
+    """Text block marked as a prompt-cache breakpoint"""
+    return {"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}
+
+
+WEB_SEARCH_TOOL = {
+    "type": "web_search_20250305",
+    "name": "web_search"
+}
+
+# 'tool' asks for venues as record_venues input; 'text' keeps the
+# ---/VENUE: layout. Streaming discovery always uses text.
+DISCOVER_OUTPUT = os.environ.get('DISCOVER_OUTPUT', 'tool')
+
+VENUE_TOOL = {
+    "name": "record_venues",
+    "description": "Record every venue found for the artist. Call once, after searching.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "venues": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "name": {"type": "string"},
+                        "city": {"type": "string"},
+                        "state": {"type": "string"},
+                        "capacity": {"type": ["integer", "null"]},
+                        "type": {"type": "string"},
+                        "website": {"type": ["string", "null"]},
+                        "match_score": {"type": "integer", "minimum": 0, "maximum": 100},
+                        "reason": {"type": "string", "description": "One sentence"},
+                    },
+                    "required": ["name", "city", "match_score"],
+                },
+            },
+        },
+        "required": ["venues"],
+    },
+}
+
+
+# Static instructions go in the system prompt, ahead of any per-request
+# data. They are far below the API's minimum cacheable prefix (1024
+# tokens on Sonnet, more on Haiku), so they are not marked for caching.
+DISCOVER_SYSTEM = """You find music venues that book touring artists. Search thoroughly for venues that book the artist's genre and suit their draw.
 
 For EACH venue, format EXACTLY like this:
 ---
@@ -523,111 +975,452 @@ TYPE: [type]
 WEBSITE: [url or unknown]
 MATCH_SCORE: [0-100]
 REASON: [one sentence]
----
+---"""
+
+DISCOVER_TOOL_SYSTEM = """You find music venues that book touring artists. Search thoroughly for venues that book the artist's genre and suit their draw.
+
+When you have finished searching, call record_venues once with every venue. Use null for an unknown capacity or website. Do not list the venues in text."""
+
+
+DETAILS_TOOL = {
+    "name": "record_venue_details",
+    "description": "Record what you found about the venue. Call once, after searching.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "capacity": {"type": ["integer", "null"]},
+            "website": {"type": ["string", "null"]},
+            "type": {"type": "string"},
+            "match_score": {"type": "integer", "minimum": 0, "maximum": 100},
+            "reason": {"type": "string", "description": "One sentence"},
+        },
+        "required": ["match_score"],
+    },
+}
+
+ENRICH_SYSTEM = """You check the details of one music venue for a touring artist. Find its capacity and official website, and rate from 0 to 100 how well it suits the artist's genre and draw.
+
+Call record_venue_details once. Use null for anything you cannot confirm."""
+
+
+def discover_prompt(profile, target_city):
+    """Build the per-request part of the discovery prompt"""
+    return f"""Find 10-15 music venues in {target_city} for this artist:
+
+Artist: {profile['name']}
+Genre: {profile['genre']}
+Draw: {profile['drawSize']}
+Similar Artists: {profile.get('similarArtists', 'N/A')}
 
 Search thoroughly for venues that book {profile['genre']} music."""
 
+
+def discover_request(profile, target_city, structured, tier=FULL_TIER):
+    """messages.create arguments for a discovery call"""
+    with span('prompt'):
+        prompt = discover_prompt(profile, target_city)
+    if structured:
+        return tier.request(DISCOVER_TOOL_SYSTEM, prompt, VENUE_TOOL)
+    return tier.request(DISCOVER_SYSTEM, prompt)
+
+
+def read_venues(response, structured):
+    """Venues from a discovery response, tool input first"""
+    with span('parse_venues'):
+        venues = tool_venues(response.content) if structured else None
+        if venues is None:
+            # No record_venues call: the answer came back as text
+            venues = parse_venues(response.content)
+            DISCOVER_FORMAT.inc('text_fallback' if structured else 'text')
+        else:
+            DISCOVER_FORMAT.inc('tool')
+    VENUES_PARSED.observe('api', value=len(venues))
+    return venues
+
+
+def discover_venues_api(profile, target_city):
+    """Discover venues using Claude"""
+    structured = DISCOVER_OUTPUT == 'tool'
     try:
-        response = client.messages.create(
-            model="claude-sonnet-4-5-20250929",
-            max_tokens=3000,
-            tools=[{
-                "type": "web_search_20250305",
-                "name": "web_search"
-            }],
-            messages=[{"role": "user", "content": prompt}]
-        )
-        
-        return parse_venues(response.content)
+        response = create_message(
+            'discover_tool' if structured else 'discover',
+            **discover_request(profile, target_city, structured))
+        return read_venues(response, structured)
         
-    except anthropic.RateLimitError as e:
-        raise Exception("RATE_LIMIT_ERROR")
+    except RateLimited:
+        raise
     except Exception as e:
         print(f"Discover error: {e}")
         raise
 
 
+def discover_venues_stream(profile, target_city):
+    """Yield venues as each block closes in the streamed response"""
+    parser = VenueStreamParser()
+
+    try:
+        with stream_message(
+            'discover', **discover_request(profile, target_city, structured=False)
+        ) as stream:
+            for text in text_deltas(stream):
+                yield from parser.feed(text)
+        
+        yield from parser.close()
+        VENUES_PARSED.observe('stream', value=parser.parsed)
+        
+    except RateLimited:
+        raise
+    except Exception as e:
+        print(f"Discover stream error: {e}")
+        raise
+
+
+def known_venues(key, profile, target_city):
+    """(venues, meta) from the cache or the local store, or None"""
+    with span('cache'):
+        venues = discover_cache.get(key)
+    if venues is not None:
+        return venues, {'cached': True, 'source': 'cache', 'waiters': 1}
+
+    with span('store'):
+        venues = store_candidates(profile, target_city)
+    if venues is not None:
+        return venues, {'cached': False, 'source': 'store', 'waiters': 1}
+    return None
+
+
+def discover_venues_cached(profile, target_city):
+    """Discover venues, serving repeat and concurrent queries once"""
+    key = discover_cache_key(profile, target_city)
+    known = known_venues(key, profile, target_city)
+    if known is not None:
+        return known
+
+    def fetch():
+        venues = discover_venues_api(profile, target_city)
+        if venues:
+            discover_cache.set(key, venues)
+            store_venues(venues, profile, target_city)
+        return venues
+
+    venues, waiters = inflight.do(key, fetch)
+    return venues, {'cached': False, 'source': 'upstream', 'waiters': waiters}
+
+
+def discover_venues_fast(profile, target_city):
+    """Candidate venues from the fast tier, shared by concurrent callers"""
+    def fetch():
+        response = create_message(
+            'discover_fast', **discover_request(profile, target_city, True, FAST_TIER))
+        return read_venues(response, True)
+    
+    venues, waiters = inflight.do(('fast', discover_cache_key(profile, target_city)), fetch)
+    return [dict(venue) for venue in venues], waiters
+
+
+def discover_venues_tiered(profile, target_city):
+    """Fast candidates now, with enrichment queued as a background job"""
+    key = discover_cache_key(profile, target_city)
+    known = known_venues(key, profile, target_city)
+    if known is not None:
+        return known
+    
+    venues, waiters = discover_venues_fast(profile, target_city)
+    try:
+        job = job_queue.submit('enrich', priority.runs_as(BULK, enrich_job),
+                               venues, profile, target_city)
+        job_id = job.id
+    except QueueFull:
+        job_id = None
+    return venues, {'cached': False, 'source': 'fast', 'waiters': waiters,
+                    'enrichment_job': job_id}
+
+
+def enrich_job(venues, profile, target_city):
+    """Enrich every candidate, then cache the finished list"""
+    venues = list(venues)
+    for i, venue in enrich_venues(venues, profile):
+        venues[i] = venue
+    finish_tiered(venues, profile, target_city)
+    return {'venues': venues}
+
+
+def finish_tiered(venues, profile, target_city):
+    """Cache and store an enriched list like a full discovery"""
+    if venues:
+        discover_cache.set(discover_cache_key(profile, target_city), venues)
+        store_venues(venues, profile, target_city)
+
+
+def enrich_venues(venues, profile):
+    """Yield (index, venue) as each venue's enrichment call finishes
+
+    Only venues missing a capacity or website are looked up, at most
+    ENRICH_LIMIT of them. A failed lookup leaves that venue as it was,
+    and hitting the rate limit ends enrichment early.
+    """
+    futures = {
+        enrich_executor.submit(cancellation.propagate(enrich_venue), venue, profile): i
+        for i, venue in enumerate(venues[:ENRICH_LIMIT]) if needs_enrichment(venue)
+    }
+    try:
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                yield i, future.result()
+            except Cancelled:
+                raise
+            except RateLimited as e:
+                print(f"Enrichment stopped: rate limited for {e.retry_after}s")
+                return
+            except Exception as e:
+                print(f"Enrich error for {venues[i].get('name')}: {e}")
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def enrich_venue(venue, profile):
+    response = create_message('enrich', **enrich_request(venue, profile))
+    return merge_details(venue, response.content)
+
+
+def needs_enrichment(venue):
+    return venue.get('capacity') is None or not venue.get('website')
+
+
+def enrich_request(venue, profile):
+    """messages.create arguments for one venue's enrichment call"""
+    extra = {}
+    if ENRICH_TIER.web_searches == 0:
+        # Nothing to search with, so answer straight away
+        extra['tool_choice'] = {"type": "tool", "name": DETAILS_TOOL['name']}
+    prompt = f"""Venue: {venue['name']}
+City: {venue['city']}{', ' + venue['state'] if venue.get('state') else ''}
+Type: {venue.get('type') or 'unknown'}
+Website: {venue.get('website') or 'unknown'}
+
+Artist genre: {profile['genre']}
+Draw: {profile['drawSize']}"""
+    return ENRICH_TIER.request(ENRICH_SYSTEM, prompt, DETAILS_TOOL, **extra)
+
+
+def merge_details(venue, content):
+    """Venue with gaps filled from a record_venue_details call
+
+    Known capacity, website, type and reason are kept; match_score is
+    replaced, since the enrichment call looked at the venue in detail.
+    """
+    block = find_tool_use(content, DETAILS_TOOL['name'])
+    details = block.input if block is not None and isinstance(block.input, dict) else None
+    if details is None:
+        PARSE_FAILURES.inc('invalid')
+        return venue
+    fields = {name: str(details[name]).strip() for name in DETAIL_FIELDS
+              if details.get(name) is not None}
+    cleaned = clean_venue({'name': venue['name'], 'city': venue['city'], **fields})
+    merged = dict(venue, enriched=True)
+    for name in ('capacity', 'website', 'type', 'reason'):
+        if merged.get(name) is None and cleaned.get(name) is not None:
+            merged[name] = cleaned[name]
+    if 'match_score' in fields:
+        merged['match_score'] = cleaned['match_score']
+    return merged
+
+
+def store_candidates(profile, target_city):
+    """Venues from the local store when its coverage is good enough"""
+    if venue_store is None:
+        return None
+    try:
+        return venue_store.candidates(profile, target_city)
+    except Exception as e:
+        print(f"Venue store query error: {e}")
+        return None
+
+
+def store_venues(venues, profile, target_city=None):
+    """Remember discovered venues in the local store"""
+    if venue_store is None:
+        return
+    try:
+        venue_store.upsert(venues, profile.get('genre'), target_city)
+    except Exception as e:
+        print(f"Venue store write error: {e}")
+
+
+NUMBER = re.compile(r'\d+')
+MARKDOWN_LINK = re.compile(r'\[[^\]]*\]\(([^)\s]+)\)')
+FIELD_NAMES = {
+    'VENUE': 'name',
+    'CITY': 'city',
+    'STATE': 'state',
+    'CAPACITY': 'capacity',
+    'TYPE': 'type',
+    'WEBSITE': 'website',
+    'MATCH_SCORE': 'match_score',
+    'MATCH SCORE': 'match_score',
+    'MATCHSCORE': 'match_score',
+    'REASON': 'reason',
+}
+TOOL_FIELDS = tuple(VENUE_TOOL['input_schema']['properties']['venues']['items']['properties'])
+DETAIL_FIELDS = tuple(DETAILS_TOOL['input_schema']['properties'])
+UNKNOWN = ('unknown', 'n/a', 'none', '')
+LABEL_NOISE = ' \t>*_#-'
+VALUE_NOISE = ' \t*'
+# Any 'Label: ...' line, ours or not, e.g. '**Note:** closed Mondays'
+LABEL_LINE = re.compile(r'^[\s>*_#-]*[A-Za-z][\w ]{0,30}[*_]*:[*_]*(\s|$)')
+
+
 def parse_venues(content):
     """Parse venues from Claude response"""
     venues = []
-    text = ""
-    for block in content:
-        if hasattr(block, 'text'):
-            text += block.text
-    
-    blocks = text.split('---')
-    
-    for block in blocks:
-        if 'VENUE:' not in block:
+    for block in response_text(content).split('---'):
+        venue = parse_venue_safe(block)
+        if venue is not None:
+            venues.append(venue)
+    return venues
+
+
+def parse_venue_block(block):
+    """Parse one ---delimited venue block, or None if incomplete"""
+    fields = {}
+    pending = None
+    for line in block.splitlines():
+        colon = line.find(':')
+        # Labels may carry list markers, markdown bold or odd spacing
+        name = FIELD_NAMES.get(line[:colon].strip(LABEL_NOISE).upper()) if colon > 0 else None
+        if name is None:
+            if pending is not None and line.strip():
+                # Label on its own line; the value follows on the next one,
+                # unless that line is another label
+                if not LABEL_LINE.match(line):
+                    fields[pending] = line.strip(VALUE_NOISE)
+                pending = None
             continue
-        
-        try:
-            venue = {}
-            
-            m = re.search(r'VENUE:\s*(.+?)(?:\n|$)', block)
-            if m:
-                venue['name'] = m.group(1).strip()
-            
-            m = re.search(r'CITY:\s*(.+?)(?:\n|$)', block)
-            if m:
-                venue['city'] = m.group(1).strip()
-            
-            m = re.search(r'STATE:\s*(.+?)(?:\n|$)', block)
-            if m:
-                venue['state'] = m.group(1).strip()
-            
-            m = re.search(r'CAPACITY:\s*(.+?)(?:\n|$)', block)
-            if m:
-                cap = m.group(1).strip()
-                if cap.lower() != 'unknown':
-                    cm = re.search(r'\d+', cap)
-                    if cm:
-                        venue['capacity'] = int(cm.group())
-            
-            m = re.search(r'TYPE:\s*(.+?)(?:\n|$)', block)
-            if m:
-                venue['type'] = m.group(1).strip()
-            
-            m = re.search(r'WEBSITE:\s*(.+?)(?:\n|$)', block)
-            if m:
-                website = m.group(1).strip()
-                venue['website'] = None if website.lower() == 'unknown' else website
-            
-            m = re.search(r'MATCH_SCORE:\s*(\d+)', block)
-            if m:
-                venue['match_score'] = int(m.group(1))
-            else:
-                venue['match_score'] = 70
-            
-            m = re.search(r'REASON:\s*(.+?)(?:\n|---|$)', block, re.DOTALL)
-            if m:
-                venue['reason'] = m.group(1).strip()
-            
-            if 'name' in venue and 'city' in venue:
-                venues.append(venue)
-        except Exception as e:
-            print(f"Parse error: {e}")
+        if name in fields:
+            pending = None
             continue
+        value = line[colon + 1:].strip(VALUE_NOISE)
+        if value:
+            fields[name] = value
+            pending = None
+        else:
+            pending = name
     
-    return venues
+    if not fields.get('name') or not fields.get('city'):
+        if fields:
+            PARSE_FAILURES.inc('incomplete')
+        return None
+    return clean_venue(fields)
 
 
-def research_venue_api(venue, profile):
-    """Research a specific venue"""
-    import anthropic
+def clean_venue(fields):
+    """Venue dict from raw field strings that include name and city"""
+    venue = {'name': fields['name'], 'city': fields['city']}
+    if 'state' in fields:
+        venue['state'] = fields['state']
     
-    client = get_client()
+    cap = fields.get('capacity')
+    if cap and cap.lower() not in UNKNOWN:
+        m = NUMBER.search(cap.replace(',', ''))
+        if m:
+            venue['capacity'] = int(m.group())
+    
+    if 'type' in fields:
+        venue['type'] = fields['type']
+    
+    if 'website' in fields:
+        website = fields['website']
+        m = MARKDOWN_LINK.search(website)
+        if m:
+            website = m.group(1)
+        website = website.strip('<>')
+        venue['website'] = None if website.lower() in UNKNOWN else website
+    
+    m = NUMBER.search(fields.get('match_score', ''))
+    venue['match_score'] = min(100, int(m.group())) if m else 70
     
-    prompt = f"""Deep research on this venue for booking:
+    if 'reason' in fields:
+        venue['reason'] = fields['reason']
+    
+    return venue
 
-VENUE: {venue['name']}
-Location: {venue['city']}, {venue['state']}
-Website: {venue.get('website', 'Unknown')}
 
-ARTIST: {profile['name']}
-Genre: {profile['genre']}
-Draw: {profile['drawSize']}
-Fee Range: {profile.get('feeRange', 'N/A')}
+def find_tool_use(content, name):
+    """First tool_use block calling name, or None"""
+    for block in content:
+        if getattr(block, 'type', None) == 'tool_use' and block.name == name:
+            return block
+    return None
+
+
+def tool_venues(content):
+    """Venues from a record_venues call, or None if the model made none"""
+    block = find_tool_use(content, VENUE_TOOL['name'])
+    if block is None:
+        return None
+    items = block.input.get('venues') if isinstance(block.input, dict) else None
+    if not isinstance(items, list):
+        PARSE_FAILURES.inc('invalid')
+        return []
+    venues = []
+    for item in items:
+        if not isinstance(item, dict):
+            PARSE_FAILURES.inc('invalid')
+            continue
+        # Same coercion as the text parser, so both paths agree on types
+        fields = {name: str(item[name]).strip() for name in TOOL_FIELDS
+                  if item.get(name) is not None}
+        if not fields.get('name') or not fields.get('city'):
+            PARSE_FAILURES.inc('invalid')
+            continue
+        venues.append(clean_venue(fields))
+    return venues
+
+
+def parse_venue_safe(block):
+    """Parse a block, logging and skipping malformed ones"""
+    try:
+        return parse_venue_block(block)
+    except Exception as e:
+        print(f"Parse error: {e}")
+        PARSE_FAILURES.inc('error')
+        return None
+
+
+class VenueStreamParser:
+    """Incremental ---delimited block parser fed with text deltas"""
+
+    def __init__(self):
+        self.buffer = ""
+        self.parsed = 0
+
+    def feed(self, text):
+        """Add a text delta and return venues whose blocks have closed"""
+        self.buffer += text
+        if '---' not in self.buffer:
+            return []
+        *closed, self.buffer = self.buffer.split('---')
+        venues = []
+        for block in closed:
+            venue = parse_venue_safe(block)
+            if venue is not None:
+                venues.append(venue)
+        self.parsed += len(venues)
+        return venues
+
+    def close(self):
+        """Flush the trailing block once the stream has ended"""
+        venue = parse_venue_safe(self.buffer)
+        self.buffer = ""
+        if venue is None:
+            return []
+        self.parsed += 1
+        return [venue]
+
+
+RESEARCH_REPORT_SYSTEM = """You research music venues for booking agents. Be thorough. Use web search extensively.
 
 Provide detailed intelligence on:
 
@@ -641,99 +1434,905 @@ Provide detailed intelligence on:
 
 3. RECENT ACTIVITY
    - Recent shows, current booking activity
-   - Similar artists played here
+   - Artists and genres that play here
 
 4. DEAL STRUCTURE  
    - Typical guarantees, percentage splits
-   - Merch terms, what's included
+   - Merch terms, what's included"""
+
+
+RESEARCH_OVERLAY_SYSTEM = """You advise an artist on a venue using research you are given.
+
+Provide:
 
 5. STRATEGIC VALUE
-   - Venue prestige, market importance
+   - Venue prestige, market importance for this artist
    - Career building potential
 
 6. NEXT STEPS
    - Specific action items for outreach
 
-Be thorough. Use web search extensively."""
+Be concise. Do not repeat the venue research."""
+
+
+def venue_location(venue):
+    """City and, when known, state of a venue"""
+    return ', '.join(filter(None, (venue.get('city'), venue.get('state'))))
+
+
+def research_report_prompt(venue):
+    """Build the per-venue part of the research prompt"""
+    return f"""Deep research on this venue for booking:
+
+VENUE: {venue['name']}
+Location: {venue_location(venue)}
+Website: {venue.get('website', 'Unknown')}"""
+
+
+def research_report_request(venue):
+    """messages.create arguments for the venue-level report"""
+    with span('prompt'):
+        prompt = research_report_prompt(venue)
+    return dict(
+        model="claude-sonnet-4-5-20250929",
+        max_tokens=2000,
+        tools=[WEB_SEARCH_TOOL],
+        system=RESEARCH_REPORT_SYSTEM,
+        messages=[{"role": "user", "content": prompt}]
+    )
+
 
+def research_overlay_request(venue, profile, venue_report):
+    """messages.create arguments for the artist-specific overlay"""
+    with span('prompt'):
+        content = research_overlay_content(venue, profile, venue_report)
+    return dict(
+        model="claude-sonnet-4-5-20250929",
+        max_tokens=800,
+        system=RESEARCH_OVERLAY_SYSTEM,
+        messages=[{"role": "user", "content": content}]
+    )
+
+
+def research_venue_report(venue):
+    """Research the artist-independent part of a venue report"""
     try:
-        response = client.messages.create(
-            model="claude-sonnet-4-5-20250929",
-            max_tokens=2000,
-            tools=[{
-                "type": "web_search_20250305",
-                "name": "web_search"
-            }],
-            messages=[{"role": "user", "content": prompt}]
-        )
-        
-        research = ""
-        for block in response.content:
-            if hasattr(block, 'text'):
-                research += block.text
+        response = create_message('research', **research_report_request(venue))
         
-        return research
+        return response_text(response.content)
         
-    except anthropic.RateLimitError as e:
-        # Return special error that frontend can detect
-        raise Exception("RATE_LIMIT_ERROR")
+    except RateLimited:
+        raise
     except Exception as e:
         print(f"Research error: {e}")
         raise
 
 
+def research_overlay_content(venue, profile, venue_report):
+    """User turn for the overlay: the shared venue research, then the artist
+
+    The venue research is a cache breakpoint. A full report takes the
+    prefix past Sonnet's 1024-token minimum, so every artist asking about
+    the same venue within the cache lifetime reads it from cache; a short
+    one is simply billed as normal input.
+    """
+    return [
+        cached_block(f"""VENUE: {venue['name']}
+Location: {venue_location(venue)}
+
+VENUE RESEARCH:
+{venue_report}"""),
+        {"type": "text", "text": f"""ARTIST: {profile['name']}
+Genre: {profile['genre']}
+Draw: {profile['drawSize']}
+Fee Range: {profile.get('feeRange', 'N/A')}
+Similar Artists: {profile.get('similarArtists', 'N/A')}"""},
+    ]
+
+
+def research_artist_overlay(venue, profile, venue_report):
+    """Artist-specific assessment built on a cached venue report"""
+    try:
+        response = create_message(
+            'research_overlay', **research_overlay_request(venue, profile, venue_report))
+        
+        return response_text(response.content)
+        
+    except RateLimited:
+        raise
+    except Exception as e:
+        print(f"Research overlay error: {e}")
+        raise
+
+
+def research_venue_api(venue, profile):
+    """Research a specific venue, reusing cached venue-level research"""
+    key = venue_cache_key(venue)
+    with span('cache'):
+        entry = research_cache.get_entry(key)
+    hit = entry is not None
+    waiters = 1
+    if not hit:
+        entry, waiters = inflight.do(
+            key, lambda: research_cache.set(key, research_venue_report(venue)))
+    venue_report, created_at, expires_at = entry
+    
+    overlay, overlay_waiters = inflight.do(
+        overlay_key(venue, profile),
+        lambda: research_artist_overlay(venue, profile, venue_report))
+    research = f"{venue_report.rstrip()}\n\n{overlay.strip()}"
+    return research, {
+        'cache': research_cache_info(hit, created_at, expires_at),
+        'waiters': max(waiters, overlay_waiters),
+    }
+
+
+def research_cache_info(hit, created_at, expires_at):
+    """Staleness metadata for a venue report"""
+    now = time.time()
+    age = now - created_at
+    return {
+        'hit': hit,
+        'researched_at': created_at,
+        'age_seconds': int(age),
+        'expires_in_seconds': max(0, int(expires_at - now)),
+        'stale': age > RESEARCH_STALE_AFTER,
+    }
+
+
+def research_venue_stream(venue, profile):
+    """Yield ('text', delta) pairs for a report, then ('cache', info)"""
+    key = venue_cache_key(venue)
+    entry = research_cache.get_entry(key)
+    hit = entry is not None
+
+    try:
+        if hit:
+            venue_report = entry[0]
+            yield 'text', venue_report.rstrip()
+        else:
+            parts = []
+            with stream_message('research', **research_report_request(venue)) as stream:
+                for text in text_deltas(stream):
+                    parts.append(text)
+                    yield 'text', text
+            venue_report = "".join(parts)
+            entry = research_cache.set(key, venue_report)
+
+        yield 'text', "\n\n"
+        with stream_message(
+            'research_overlay', **research_overlay_request(venue, profile, venue_report)
+        ) as stream:
+            for text in text_deltas(stream):
+                yield 'text', text
+
+    except RateLimited:
+        raise
+    except Exception as e:
+        print(f"Research stream error: {e}")
+        raise
+
+    yield 'cache', research_cache_info(hit, entry[1], entry[2])
+
+
+def response_text(content):
+    """Concatenate the text blocks of a response"""
+    return "".join(block.text for block in content if hasattr(block, 'text'))
+
+
+# The page has no template variables, so render and compress it once
+with app.app_context():
+    index_page, page_assets = build_site(
+        render_template_string(HTML_TEMPLATE),
+        split_assets=os.environ.get('UI_SPLIT_ASSETS', '') == '1',
+    )
+
+
 @app.route('/')
 def index():
     """Main page"""
-    return render_template_string(HTML_TEMPLATE)
+    return index_page.response(request)
+
+
+@app.route('/assets/<name>')
+def asset(name):
+    """Fingerprinted CSS/JS split out of the page"""
+    page_asset = page_assets.get(name)
+    if page_asset is None:
+        return jsonify({'error': 'Not found'}), 404
+    return page_asset.response(request)
 
 
 @app.route('/discover', methods=['POST'])
 def discover():
     """Discover venues endpoint"""
     try:
-        data = request.json
-        profile = data['profile']
-        target_city = data['targetCity']
+        with span('parse'):
+            data = request.get_json(silent=True)
+            profile, target_city = input_validator.discover(data)
+            tiered = data.get('mode', DISCOVER_MODE) == 'tiered'
         
         print(f"Discovering venues for {profile.get('name')} in {target_city}")
-        venues = discover_venues_api(profile, target_city)
+        if tiered:
+            venues, meta = discover_venues_tiered(profile, target_city)
+        else:
+            venues, meta = discover_venues_cached(profile, target_city)
         
-        return jsonify({'venues': venues})
+        with span('serialize'):
+            return jsonify({'venues': venues, **meta})
+    except Invalid as e:
+        return jsonify(error_payload(e)), 400
+    except Cancelled:
+        # Nobody reads this; the status shows up in logs and metrics
+        return jsonify({'error': 'CANCELLED'}), 499
     except Exception as e:
         error_msg = str(e)
         print(f"ERROR in /discover: {error_msg}")
         
         # Return rate limit error with special format
-        if 'RATE_LIMIT' in error_msg:
-            return jsonify({'error': 'RATE_LIMIT_ERROR'}), 429
+        if isinstance(e, RateLimited):
+            return jsonify(error_payload(e)), 429, {'Retry-After': str(e.retry_after)}
         else:
             return jsonify({'error': error_msg}), 500
 
 
+def error_payload(e):
+    """JSON error body, with a precise wait for rate limits"""
+    if isinstance(e, RateLimited):
+        return {'error': 'RATE_LIMIT_ERROR', 'retry_after': e.retry_after}
+    if isinstance(e, Invalid):
+        return {'error': str(e), 'field': e.field, 'reason': e.reason}
+    return {'error': str(e)}
+
+
+def sse_event(event, data):
+    """Format one Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def sse_response(events):
+    """Stream an event generator without proxy buffering"""
+    return Response(events, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+
+@app.route('/discover/stream', methods=['POST'])
+def discover_stream():
+    """Discover venues, pushing each venue as an SSE event"""
+    try:
+        data = request.get_json(silent=True)
+        profile, target_city = input_validator.discover(data)
+        tiered = data.get('mode', DISCOVER_MODE) == 'tiered'
+    except Exception as e:
+        return jsonify(error_payload(e)), 400
+    
+    print(f"Streaming venues for {profile.get('name')} in {target_city}")
+    
+    def generate():
+        started = time.time()
+        key = discover_cache_key(profile, target_city)
+        venues = discover_cache.get(key)
+        source = 'cache'
+        if venues is None:
+            venues = store_candidates(profile, target_city)
+            source = 'store'
+        if venues is not None:
+            for venue in venues:
+                yield sse_event('venue', venue)
+            yield sse_event('done', {
+                'count': len(venues),
+                'cached': source == 'cache',
+                'source': source,
+            })
+            return
+        if tiered:
+            yield from tiered_events(profile, target_city, started)
+            return
+        
+        venues = []
+        first_venue_at = None
+        try:
+            for venue in discover_venues_stream(profile, target_city):
+                if first_venue_at is None:
+                    first_venue_at = time.time() - started
+                    print(f"First venue after {first_venue_at:.1f}s")
+                venues.append(venue)
+                yield sse_event('venue', venue)
+        except Cancelled:
+            return
+        except Exception as e:
+            error_msg = str(e)
+            print(f"ERROR in /discover/stream: {error_msg}")
+            yield sse_event('error', error_payload(e))
+            return
+        
+        if venues:
+            discover_cache.set(key, venues)
+            store_venues(venues, profile, target_city)
+        yield sse_event('done', {
+            'count': len(venues),
+            'cached': False,
+            'source': 'upstream',
+            'first_venue_seconds': first_venue_at,
+            'total_seconds': time.time() - started,
+        })
+    
+    return sse_response(generate())
+
+
+def tiered_events(profile, target_city, started):
+    """SSE frames for tiered discovery: venues, candidates, updates, done"""
+    try:
+        venues, _ = discover_venues_fast(profile, target_city)
+        for venue in venues:
+            yield sse_event('venue', venue)
+        yield sse_event('candidates', {'count': len(venues),
+                                       'seconds': time.time() - started})
+        enriched = 0
+        for i, venue in enrich_venues(venues, profile):
+            venues[i] = venue
+            enriched += 1
+            yield sse_event('update', {'index': i, 'venue': venue})
+    except Cancelled:
+        return
+    except Exception as e:
+        print(f"ERROR in /discover/stream (tiered): {e}")
+        yield sse_event('error', error_payload(e))
+        return
+    
+    finish_tiered(venues, profile, target_city)
+    yield sse_event('done', {
+        'count': len(venues),
+        'cached': False,
+        'source': 'upstream',
+        'enriched': enriched,
+        'total_seconds': time.time() - started,
+    })
+
+
 @app.route('/research', methods=['POST'])
 def research():
     """Research venue endpoint"""
     try:
-        data = request.json
-        venue = data['venue']
-        profile = data['profile']
+        with span('parse'):
+            venue, profile = input_validator.research(request.get_json(silent=True))
         
         print(f"Researching venue: {venue.get('name')}")
-        research_text = research_venue_api(venue, profile)
+        research_text, meta = research_venue_api(venue, profile)
         
-        return jsonify({'research': research_text})
+        with span('serialize'):
+            return jsonify({'research': research_text, **meta})
+    except Invalid as e:
+        return jsonify(error_payload(e)), 400
+    except Cancelled:
+        # Nobody reads this; the status shows up in logs and metrics
+        return jsonify({'error': 'CANCELLED'}), 499
     except Exception as e:
         error_msg = str(e)
         print(f"ERROR in /research: {error_msg}")
         
         # Return rate limit error with special format
-        if 'RATE_LIMIT' in error_msg:
-            return jsonify({'error': 'RATE_LIMIT_ERROR'}), 429
+        if isinstance(e, RateLimited):
+            return jsonify(error_payload(e)), 429, {'Retry-After': str(e.retry_after)}
         else:
             return jsonify({'error': error_msg}), 500
 
 
+@app.route('/research/stream', methods=['POST'])
+def research_stream():
+    """Research a venue, forwarding text deltas as SSE events"""
+    try:
+        venue, profile = input_validator.research(request.get_json(silent=True))
+    except Exception as e:
+        return jsonify(error_payload(e)), 400
+    
+    print(f"Streaming research for venue: {venue.get('name')}")
+    
+    def generate():
+        started = time.time()
+        first_token_at = None
+        try:
+            for kind, payload in research_venue_stream(venue, profile):
+                if kind == 'text':
+                    if first_token_at is None:
+                        first_token_at = time.time() - started
+                    yield sse_event('text', {'text': payload})
+                else:
+                    yield sse_event('done', {
+                        'cache': payload,
+                        'first_token_seconds': first_token_at,
+                        'total_seconds': time.time() - started,
+                    })
+        except Cancelled:
+            return
+        except Exception as e:
+            error_msg = str(e)
+            print(f"ERROR in /research/stream: {error_msg}")
+            yield sse_event('error', error_payload(e))
+    
+    return sse_response(generate())
+
+
+@app.route('/rerank', methods=['POST'])
+def rerank_venues():
+    """Re-sort and filter a discovered venue list locally, no upstream call"""
+    try:
+        venues, profile, options = input_validator.rerank(request.get_json(silent=True))
+    except Exception as e:
+        return jsonify(error_payload(e)), 400
+    venues, hidden = rerank(venues, profile, options)
+    return jsonify({'venues': venues, 'hidden': hidden})
+
+
+def discover_job(profile, target_city):
+    """Background discovery job"""
+    venues, meta = discover_venues_cached(profile, target_city)
+    return {'venues': venues, **meta}
+
+
+def research_job(venue, profile):
+    """Background research job"""
+    research_text, meta = research_venue_api(venue, profile)
+    return {'research': research_text, **meta}
+
+
+def enqueue(kind, fn, *args):
+    """Submit a job and build the 202 response"""
+    try:
+        job = job_queue.submit(kind, priority.runs_as(BULK, fn), *args)
+    except QueueFull as e:
+        return jsonify({'error': str(e)}), 503
+    return jsonify(job.to_dict()), 202
+
+
+@app.route('/jobs/discover', methods=['POST'])
+def discover_job_submit():
+    """Queue a discovery job"""
+    try:
+        profile, target_city = input_validator.discover(request.get_json(silent=True))
+    except Exception as e:
+        return jsonify(error_payload(e)), 400
+    
+    print(f"Queueing discovery for {profile.get('name')} in {target_city}")
+    return enqueue('discover', discover_job, profile, target_city)
+
+
+@app.route('/jobs/research', methods=['POST'])
+def research_job_submit():
+    """Queue a research job"""
+    try:
+        venue, profile = input_validator.research(request.get_json(silent=True))
+    except Exception as e:
+        return jsonify(error_payload(e)), 400
+    
+    print(f"Queueing research for venue: {venue.get('name')}")
+    return enqueue('research', research_job, venue, profile)
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Poll a job"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def job_cancel(job_id):
+    """Cancel a job"""
+    job = job_queue.cancel(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """Subscribe to a job's status changes over SSE"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    def generate():
+        version = None
+        while True:
+            if version == job.version:
+                # Keep idle connections alive through proxies
+                yield ": keep-alive\n\n"
+            else:
+                version = job.version
+                state = job.to_dict()
+                yield sse_event('status', state)
+                if state['status'] in FINISHED:
+                    return
+            job.wait_for_change(version, timeout=15)
+    
+    return sse_response(generate())
+
+
+def tour_request(data):
+    """Validate a tour request and return (profile, ordered cities)"""
+    profile, cities = input_validator.tour(data, TOUR_MAX_CITIES)
+    cities = list(dict.fromkeys(cities))
+    if data.get('order') == 'route':
+        cities = route_order(cities, profile.get('homeBase'))
+    return profile, cities
+
+
+def run_tour(profile, cities):
+    """Discover every city concurrently, yielding results as they finish
+
+    The caller is waiting on every city, so they run in the discover
+    class like a single discovery, not as capped bulk work; only
+    TOUR_CONCURRENCY and UPSTREAM_CONCURRENCY bound how many run at once.
+    """
+    started = time.time()
+    discover = priority.runs_as(DISCOVER, cancellation.propagate(discover_venues_cached))
+    futures = {tour_executor.submit(discover, profile, city): city for city in cities}
+    for future in as_completed(futures):
+        city = futures[future]
+        try:
+            venues, meta = future.result()
+            yield city, {'venues': venues, **meta, 'seconds': time.time() - started}
+        except Exception as e:
+            print(f"Tour error for {city}: {e}")
+            yield city, {**error_payload(e), 'seconds': time.time() - started}
+
+
+@app.route('/tour', methods=['POST'])
+def tour():
+    """Discover venues across several cities at once"""
+    try:
+        profile, cities = tour_request(request.get_json(silent=True))
+    except Exception as e:
+        return jsonify(error_payload(e)), 400
+    
+    print(f"Tour discovery for {profile.get('name')} across {len(cities)} cities")
+    started = time.time()
+    results = {}
+    errors = {}
+    for city, result in run_tour(profile, cities):
+        if 'error' in result:
+            errors[city] = result
+        else:
+            results[city] = result['venues']
+    
+    groups, ranked = merge_tour({city: results[city] for city in cities if city in results})
+    return jsonify({
+        'cities': [
+            {'city': city, 'venues': groups[city]} if city in groups
+            else {'city': city, **errors[city]}
+            for city in cities
+        ],
+        'ranked': ranked,
+        'total_seconds': time.time() - started,
+    })
+
+
+@app.route('/tour/stream', methods=['POST'])
+def tour_stream():
+    """Tour discovery, pushing each city as an SSE event when it finishes"""
+    try:
+        profile, cities = tour_request(request.get_json(silent=True))
+    except Exception as e:
+        return jsonify(error_payload(e)), 400
+    
+    print(f"Streaming tour for {profile.get('name')} across {len(cities)} cities")
+    
+    def generate():
+        started = time.time()
+        yield sse_event('plan', {'cities': cities})
+        results = {}
+        for city, result in run_tour(profile, cities):
+            if 'error' in result:
+                yield sse_event('city_error', {'city': city, **result})
+            else:
+                results[city] = result['venues']
+                yield sse_event('city', {'city': city, **result})
+        
+        _, ranked = merge_tour({city: results[city] for city in cities if city in results})
+        yield sse_event('done', {
+            'ranked': ranked,
+            'count': len(ranked),
+            'total_seconds': time.time() - started,
+        })
+    
+    return sse_response(generate())
+
+
+@app.route('/venues')
+def venues_query():
+    """Query the local venue store without an upstream call"""
+    if venue_store is None:
+        return jsonify({'error': 'Venue store is disabled'}), 404
+    
+    args = request.args
+    city = args.get('city', '').strip()
+    if not city:
+        return jsonify({'error': 'city is required'}), 400
+    
+    started = time.time()
+    try:
+        venues = venue_store.query(
+            city,
+            genre=args.get('genre'),
+            min_capacity=args.get('minCapacity', type=int),
+            max_capacity=args.get('maxCapacity', type=int),
+            limit=min(args.get('limit', 30, type=int), 200),
+        )
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    return jsonify({
+        'venues': venues,
+        'coverage': venue_store.coverage(city),
+        'ms': round((time.time() - started) * 1000, 2),
+    })
+
+
+EXPORT_TYPES = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+
+def export_request():
+    """(body, cities, format) from a GET query or a POST body"""
+    data = request.get_json(silent=True) if request.method == 'POST' else {}
+    if not isinstance(data, dict):
+        raise ValueError('Body must be a JSON object')
+    cities = data.get('cities') or request.args.getlist('city')
+    return data, cities, data.get('format') or request.args.get('format', 'csv')
+
+
+def export_source(data, cities):
+    """(scope, venues) to export; venues is a lazy iterable
+
+    A 'venues' list exports a session as given. Cities export a tour,
+    from the discovery cache when a profile is sent, else from the venue
+    store. With neither, the whole store is exported.
+    """
+    if data.get('venues') is not None:
+        return 'session', input_validator.export(data)
+    if cities and data.get('profile'):
+        # Normalized as discovery did, so the cache keys match
+        profile = input_validator.profile(data, 'export')
+        return 'tour', tour_export_venues(profile, cities)
+    if venue_store is None:
+        raise LookupError('Venue store is disabled')
+    return ('tour' if cities else 'all'), venue_store.iter_venues(cities or None)
+
+
+def tour_export_venues(profile, cities):
+    for city in cities:
+        venues = discover_cache.peek(discover_cache_key(profile, city))
+        if venues is None and venue_store is not None:
+            venues = venue_store.iter_venues([city])
+        yield from venues or ()
+
+
+def counted(items, fmt):
+    for item in items:
+        EXPORT_ROWS.inc(fmt)
+        yield item
+
+
+def export_response(body, mimetype, filename):
+    """Stream body with chunked transfer as a file download"""
+    return Response(body, mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'Cache-Control': 'no-store',
+        'X-Accel-Buffering': 'no',
+    })
+
+
+@app.route('/export/venues', methods=['GET', 'POST'])
+def export_venues():
+    """Stream venues as CSV or JSONL rows"""
+    try:
+        data, cities, fmt = export_request()
+        if fmt not in EXPORT_TYPES:
+            raise ValueError(f"format must be one of {', '.join(EXPORT_TYPES)}")
+        scope, venues = export_source(data, cities)
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify(error_payload(e)), 400
+    
+    rows = counted(venues, fmt)
+    body = csv_stream(rows) if fmt == 'csv' else jsonl_stream(rows)
+    return export_response(body, EXPORT_TYPES[fmt], f"venues-{scope}.{fmt}")
+
+
+@app.route('/export/research', methods=['GET', 'POST'])
+def export_research():
+    """Stream a ZIP with one text file per venue that has cached research"""
+    try:
+        data, cities, _ = export_request()
+        scope, venues = export_source(data, cities)
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify(error_payload(e)), 400
+    
+    return export_response(zip_stream(research_members(venues)), 'application/zip',
+                           f"research-{scope}.zip")
+
+
+def research_members(venues):
+    """(file name, text) for each venue with a cached report, then a summary
+
+    Files are numbered rather than deduplicated by name, so nothing about
+    earlier venues has to be remembered. The archive itself still keeps a
+    small central directory entry per report until the end.
+    """
+    written = missing = 0
+    for venue in venues:
+        report = research_cache.peek(venue_cache_key(venue))
+        if report is None:
+            missing += 1
+            continue
+        written += 1
+        EXPORT_ROWS.inc('zip')
+        header = [f"Venue: {venue.get('name')}", f"City: {venue_location(venue)}"]
+        if venue.get('website'):
+            header.append(f"Website: {venue['website']}")
+        if venue.get('capacity'):
+            header.append(f"Capacity: {venue['capacity']}")
+        name = f"{written:04d}_{safe_filename(venue.get('name'))}.txt"
+        yield name, "\n".join(header) + "\n\n" + report.strip() + "\n"
+    yield 'README.txt', (f"{written} research reports.\n"
+                         f"{missing} venues had no cached research; open them in the app first.\n")
+
+
+@app.before_request
+def track_request_start():
+    request.environ['timing'] = timing.begin()
+    # Needs waitress --channel-request-lookahead to see the client leave
+    disconnected = request.environ.get('waitress.client_disconnected')
+    cancellation.begin(CancelToken(disconnected) if disconnected is not None else None)
+    HTTP_IN_FLIGHT.inc(request.endpoint or 'unknown')
+    if profiler.should_profile(request.headers):
+        request.environ['profile'] = profiler.start()
+
+
+@app.after_request
+def track_request_end(response):
+    """Observe latency and log spans once the body has been sent
+
+    Server-Timing can only carry spans finished before the headers go
+    out; streamed responses report later phases in the log line only.
+    """
+    endpoint = request.endpoint or 'unknown'
+    timings = request.environ.get('timing')
+    if timings is None:
+        return response
+    status = response.status_code
+    method, path = request.method, request.path
+    sampler = request.environ.get('profile')
+    response.headers['Server-Timing'] = timings.server_timing()
+    
+    def done():
+        HTTP_IN_FLIGHT.dec(endpoint)
+        HTTP_LATENCY.observe(endpoint, str(status), value=timings.elapsed())
+        profile_path = profiler.finish(sampler, endpoint) if sampler is not None else None
+        if timings.spans or profile_path:
+            print(timings.log_record(event='request', method=method, path=path,
+                                     endpoint=endpoint, status=status,
+                                     profile=profile_path))
+        timing.end()
+        cancellation.end()
+    
+    response.call_on_close(done)
+    return response
+
+
+@metrics.collector
+def component_metrics():
+    """Totals kept by the usage tracker, limiter, dispatcher, validator, caches and queues"""
+    usage = usage_tracker.stats()
+    limits = rate_limiter.stats()
+    classes = dispatcher.stats()['classes']
+    pool = client_manager.pool_stats()
+    jobs = job_queue.stats()
+    caches = {'discover': discover_cache.stats(), 'research': research_cache.stats()}
+    checks = input_validator.stats()['calls']
+    families = [
+        ('venue_agent_upstream_calls_total', 'counter', 'Messages API calls with usage',
+         ('call',), [((call,), c['calls']) for call, c in usage.items()]),
+        ('venue_agent_tokens_total', 'counter', 'Tokens reported in response.usage',
+         ('call', 'type'), [
+             ((call, kind), c[field]) for call, c in usage.items()
+             for kind, field in (('input', 'input_tokens'),
+                                 ('output', 'output_tokens'),
+                                 ('cache_read', 'cache_read_input_tokens'),
+                                 ('cache_write', 'cache_creation_input_tokens'))
+         ]),
+        ('venue_agent_web_search_requests_total', 'counter', 'Web search tool invocations',
+         ('call',), [((call,), c['web_search_requests']) for call, c in usage.items()]),
+        ('venue_agent_upstream_cancelled_total', 'counter', 'Calls abandoned after the caller left',
+         ('call',), [((call,), c['cancelled']) for call, c in usage.items()]),
+        ('venue_agent_tokens_saved_total', 'counter', 'Estimated tokens not spent on abandoned calls',
+         ('call',), [((call,), c['tokens_saved']) for call, c in usage.items()]),
+        ('venue_agent_input_checks_total', 'counter',
+         'Request bodies validated, by outcome (accepted, truncated or a rejection reason)',
+         ('call', 'outcome'), [((call, outcome), n) for call, c in checks.items()
+                               for outcome, n in c['outcomes'].items()]),
+        ('venue_agent_input_tokens_avoided_total', 'counter',
+         'Estimated client text tokens kept out of prompts by truncation or rejection',
+         ('call',), [((call,), c['tokens_avoided']) for call, c in checks.items()]),
+        ('venue_agent_rate_limit_hits_total', 'counter', 'Upstream 429 responses',
+         (), [((), limits['rate_limit_hits'])]),
+        ('venue_agent_rate_limit_rejected_total', 'counter', 'Requests refused with RATE_LIMIT_ERROR',
+         (), [((), limits['rejected'])]),
+        ('venue_agent_upstream_retries_total', 'counter', 'Upstream attempts retried',
+         (), [((), limits['retries'])]),
+        ('venue_agent_rate_limit_delay_seconds_total', 'counter', 'Time spent waiting for budget',
+         (), [((), limits['delayed_seconds'])]),
+        ('venue_agent_upstream_admitted_in_flight', 'gauge',
+         'Upstream calls holding a limiter slot, across all workers sharing the ledger',
+         (), [((), limits['in_flight'])]),
+        ('venue_agent_upstream_queue_depth', 'gauge',
+         'Calls waiting in the priority dispatcher, by class',
+         ('class',), [((name,), c['queued']) for name, c in classes.items()]),
+        ('venue_agent_upstream_dispatched_in_flight', 'gauge',
+         'Calls holding a dispatcher slot, by class',
+         ('class',), [((name,), c['running']) for name, c in classes.items()]),
+        ('venue_agent_upstream_queue_oldest_seconds', 'gauge',
+         'Age of the longest-waiting call in each class',
+         ('class',), [((name,), c['oldest_wait_seconds']) for name, c in classes.items()]),
+        ('venue_agent_upstream_promoted_total', 'counter',
+         'Calls run out of fair order because they had waited PRIORITY_MAX_WAIT',
+         ('class',), [((name,), c['promoted']) for name, c in classes.items()]),
+        ('venue_agent_coalesced_in_flight', 'gauge', 'Distinct upstream calls being shared',
+         (), [((), inflight.stats()['in_flight'])]),
+        ('venue_agent_jobs', 'gauge', 'Background jobs by status',
+         ('status',), [((status,), jobs[status]) for status in (QUEUED, RUNNING) + FINISHED]),
+        ('venue_agent_pool_connections_in_use', 'gauge',
+         'Upstream requests holding a pooled HTTP connection',
+         (), [((), pool['in_use'])]),
+        ('venue_agent_pool_connections_limit', 'gauge', 'Configured upstream HTTP pool limits',
+         ('limit',), [(('max',), pool['max_connections']),
+                      (('keepalive',), pool['max_keepalive_connections'])]),
+        ('venue_agent_cache_hits_total', 'counter', 'Cache hits',
+         ('cache',), [((name,), c['hits']) for name, c in caches.items()]),
+        ('venue_agent_cache_misses_total', 'counter', 'Cache misses',
+         ('cache',), [((name,), c['misses']) for name, c in caches.items()]),
+    ]
+    return families
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint"""
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+
+@app.route('/stats')
+def stats():
+    """Runtime stats endpoint"""
+    return jsonify(stats_payload())
+
+
+def stats_payload():
+    return {
+        'worker': os.getpid(),
+        'pool': client_manager.pool_stats(),
+        'usage': usage_tracker.stats(),
+        'discover_cache': discover_cache.stats(),
+        'research_cache': research_cache.stats(),
+        'jobs': job_queue.stats(),
+        'rate_limit': rate_limiter.stats(),
+        'priority': dispatcher.stats(),
+        'inflight': inflight.stats(),
+        'input': input_validator.stats(),
+        'venue_store': venue_store.stats() if venue_store is not None else None,
+        'profiler': profiler.stats(),
+        'discover_mode': DISCOVER_MODE,
+        'tiers': {tier.name: tier.stats() for tier in (FULL_TIER, FAST_TIER, ENRICH_TIER)},
+    }
+
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8080))
     app.run(host='0.0.0.0', port=port, debug=False)
@@ -0,0 +1,252 @@
+"""
+Upstream priority
+Orders upstream calls by class, so a click on a venue card is not stuck
+behind tours, background jobs and enrichment. Tours run in the discover
+class; jobs and enrichment are bulk work, capped by its limit
+"""
+
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+import cancellation
+
+RESEARCH = 'research'
+DISCOVER = 'discover'
+BULK = 'bulk'
+CLASSES = (RESEARCH, DISCOVER, BULK)
+
+# Upstream call label -> class, when the work has no class bound
+LABEL_CLASSES = {'research': RESEARCH, 'research_overlay': RESEARCH, 'enrich': BULK}
+DEFAULT_WEIGHTS = {RESEARCH: 6, DISCOVER: 3, BULK: 1}
+DEFAULT_LIMITS = {BULK: 4}
+# How often a waiting call checks whether its caller has gone
+POLL = 0.1
+
+_current = contextvars.ContextVar('priority_class', default=None)
+
+
+def classify(label):
+    """Class for an upstream call: the bound one, else by call label"""
+    return _current.get() or LABEL_CLASSES.get(label, DISCOVER)
+
+
+@contextmanager
+def bound(name):
+    """Run a block's upstream calls in class name"""
+    reset = _current.set(name)
+    try:
+        yield name
+    finally:
+        _current.reset(reset)
+
+
+def runs_as(name, fn):
+    """Wrap fn so its upstream calls are in class name, on whatever thread runs it"""
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        with bound(name):
+            return fn(*args, **kwargs)
+    return run
+
+
+class Ticket:
+    """One call's place in line
+
+    finish is its virtual finish time; waited is how long it queued.
+    """
+
+    def __init__(self, name, finish, wake):
+        self.name = name
+        self.finish = finish
+        self.wake = wake
+        self.enqueued = time.monotonic()
+        self.granted = False
+        self.waited = 0.0
+
+
+class _Class:
+    def __init__(self, name, weight, limit):
+        self.name = name
+        self.weight = weight
+        self.limit = limit
+        self.queue = deque()
+        self.running = 0
+        # Virtual finish time of the last call queued in this class
+        self.finish = 0.0
+        self.admitted = 0
+        self.promoted = 0
+        self.withdrawn = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def ready(self):
+        return self.queue and (self.limit is None or self.running < self.limit)
+
+
+class Dispatcher:
+    """Admits upstream calls by class, in weighted fair order
+
+    capacity bounds the calls running at once in this process (None for
+    no bound). While it is full, calls queue per class. Each call is
+    stamped with a virtual finish time, max(virtual now, its class's
+    last finish) + 1/weight, and the lowest stamp runs next, so under
+    load the classes share slots in proportion to their weights. A class
+    at its limit is passed over. A call that has waited max_wait runs
+    next whatever its stamp: a light class behind long calls would
+    otherwise wait weight-ratio many of them for each turn.
+    """
+
+    def __init__(self, capacity=8, weights=None, limits=None, max_wait=10.0):
+        weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+        limits = {**DEFAULT_LIMITS, **(limits or {})}
+        for name, weight in weights.items():
+            if weight <= 0:
+                raise ValueError(f"{name} weight must be positive")
+        self.capacity = capacity
+        self.max_wait = max_wait
+        self.classes = {name: _Class(name, weights[name], limits.get(name)) for name in CLASSES}
+        self.running = 0
+        self.virtual = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Build a dispatcher from UPSTREAM_CONCURRENCY and PRIORITY_* variables
+
+        PRIORITY_<CLASS>_WEIGHT and PRIORITY_<CLASS>_LIMIT set each class;
+        0 (or empty) means no bound for UPSTREAM_CONCURRENCY and a limit.
+        """
+        env = os.environ
+        weights, limits = {}, {}
+        for name in CLASSES:
+            prefix = f"PRIORITY_{name.upper()}_"
+            if env.get(prefix + 'WEIGHT'):
+                weights[name] = float(env[prefix + 'WEIGHT'])
+            if prefix + 'LIMIT' in env:
+                limits[name] = int(env[prefix + 'LIMIT'] or 0) or None
+        return cls(
+            capacity=int(env.get('UPSTREAM_CONCURRENCY', 8)) or None,
+            weights=weights,
+            limits=limits,
+            max_wait=float(env.get('PRIORITY_MAX_WAIT', 10)),
+        )
+
+    @contextmanager
+    def slot(self, name):
+        """Wait for a turn in class name and hold it for the block"""
+        ready = threading.Event()
+        ticket = self._enqueue(name, ready.set)
+        try:
+            while not ready.wait(POLL):
+                cancellation.check()
+        except BaseException:
+            self._withdraw(ticket)
+            raise
+        try:
+            yield ticket
+        finally:
+            self._release(ticket)
+
+    @asynccontextmanager
+    async def slot_async(self, name):
+        """slot() for the event loop; cancelling the task leaves the queue"""
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: ready.done() or ready.set_result(None))
+
+        ticket = self._enqueue(name, wake)
+        try:
+            await ready
+        except BaseException:
+            self._withdraw(ticket)
+            raise
+        try:
+            yield ticket
+        finally:
+            self._release(ticket)
+
+    def _enqueue(self, name, wake):
+        cls = self.classes[name]
+        with self._lock:
+            ticket = Ticket(name, max(self.virtual, cls.finish) + 1 / cls.weight, wake)
+            cls.finish = ticket.finish
+            cls.queue.append(ticket)
+            self._dispatch()
+        return ticket
+
+    def _dispatch(self):
+        """Start queued calls while there is room; the lock is held"""
+        while self.capacity is None or self.running < self.capacity:
+            ready = [cls for cls in self.classes.values() if cls.ready()]
+            if not ready:
+                return
+            now = time.monotonic()
+            cls = min(ready, key=lambda c: c.queue[0].finish)
+            overdue = [c for c in ready if now - c.queue[0].enqueued >= self.max_wait]
+            if overdue:
+                oldest = min(overdue, key=lambda c: c.queue[0].enqueued)
+                if oldest is not cls:
+                    oldest.promoted += 1
+                    cls = oldest
+            ticket = cls.queue.popleft()
+            ticket.granted = True
+            ticket.waited = now - ticket.enqueued
+            cls.running += 1
+            cls.admitted += 1
+            cls.wait_seconds += ticket.waited
+            cls.max_wait_seconds = max(cls.max_wait_seconds, ticket.waited)
+            self.running += 1
+            self.virtual = max(self.virtual, ticket.finish)
+            ticket.wake()
+
+    def _release(self, ticket):
+        with self._lock:
+            self._release_locked(ticket)
+
+    def _release_locked(self, ticket):
+        self.classes[ticket.name].running -= 1
+        self.running -= 1
+        self._dispatch()
+
+    def _withdraw(self, ticket):
+        """Take back a call whose caller stopped waiting"""
+        with self._lock:
+            if ticket.granted:
+                self._release_locked(ticket)
+                return
+            cls = self.classes[ticket.name]
+            cls.queue.remove(ticket)
+            cls.withdrawn += 1
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                'capacity': self.capacity,
+                'running': self.running,
+                'max_wait': self.max_wait,
+                'classes': {
+                    name: {
+                        'weight': cls.weight,
+                        'limit': cls.limit,
+                        'queued': len(cls.queue),
+                        'running': cls.running,
+                        'admitted': cls.admitted,
+                        'promoted': cls.promoted,
+                        'withdrawn': cls.withdrawn,
+                        'wait_seconds': round(cls.wait_seconds, 3),
+                        'max_wait_seconds': round(cls.max_wait_seconds, 3),
+                        'oldest_wait_seconds': round(now - cls.queue[0].enqueued, 3)
+                        if cls.queue else 0.0,
+                    }
+                    for name, cls in self.classes.items()
+                },
+            }
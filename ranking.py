@@ -0,0 +1,120 @@
+"""
+Local re-ranking
+Scores and filters already-discovered venues against the artist profile
+without another upstream call. The page runs the same rules in JS.
+"""
+
+import re
+
+from cache import normalize_text
+
+# 'k' only as a suffix: '2k+' is 2000, '150 kids' is 150
+AMOUNT = re.compile(r'(\d+(?:\.\d+)?)\s*(k\b)?')
+
+# A show sells well when the draw fills 60-100% of the room
+FILL_LOW = 0.6
+FILL_HIGH = 1.0
+# Rooms beyond this multiple of the top draw are hidden as too big
+MAX_OVERSIZE = 3.0
+TICKET_PRICE = 20.0
+ARTIST_SHARE = 0.7
+
+WEIGHTS = {'match': 0.5, 'capacity': 0.3, 'type': 0.1, 'fee': 0.1}
+
+
+def parse_range(text):
+    """(low, high) from strings like '200-400', '$1,500-3,000', '2k+', '~300'
+
+    A trailing '+' leaves high open (None); no number gives (None, None).
+    """
+    text = (text or '').lower().replace(',', '').replace('$', '')
+    amounts = [float(n) * (1000 if k else 1) for n, k in AMOUNT.findall(text)]
+    if not amounts:
+        return None, None
+    low, high = min(amounts), max(amounts)
+    if len(amounts) == 1 and '+' in text:
+        high = None
+    return low, high
+
+
+def capacity_fit(capacity, draw_low, draw_high):
+    """1.0 when the draw fills the room comfortably, falling off either side"""
+    if not capacity or draw_low is None:
+        return 0.5
+    draw = (draw_low + draw_high) / 2 if draw_high is not None else draw_low
+    fill = draw / capacity
+    if fill < FILL_LOW:
+        return fill / FILL_LOW
+    if fill > FILL_HIGH:
+        return FILL_HIGH / fill
+    return 1.0
+
+
+def fee_fit(capacity, fee_low):
+    """Share of the minimum fee a full room could cover at a typical ticket"""
+    if not capacity or not fee_low:
+        return 0.5
+    return min(1.0, capacity * TICKET_PRICE * ARTIST_SHARE / fee_low)
+
+
+def type_fit(venue_type, types):
+    """Share of the wanted types the venue's type covers; 1.0 with none wanted"""
+    if not types:
+        return 1.0
+    return sum(t in venue_type for t in types) / len(types)
+
+
+def too_small_or_big(capacity, draw_low, draw_high):
+    if not capacity or draw_low is None:
+        return False
+    return capacity < draw_low or capacity > (draw_high or draw_low) * MAX_OVERSIZE
+
+
+def rerank(venues, profile, options=None):
+    """Return (ranked venues, hidden count)
+
+    options:
+        sort: 'score' (default), 'capacity' or 'match'
+        hide_unfit: drop rooms smaller than the low draw or far above it
+        types: only keep venues whose type contains one of these words;
+            one covering more of them scores higher
+        min_capacity / max_capacity: explicit bounds; unknown capacity passes
+    Each returned venue is a copy carrying rank_score and capacity_fit.
+    """
+    options = options or {}
+    draw_low, draw_high = parse_range(profile.get('drawSize'))
+    fee_low, _ = parse_range(profile.get('feeRange'))
+    types = [normalize_text(t) for t in options.get('types') or [] if normalize_text(t)]
+    min_capacity = options.get('min_capacity')
+    max_capacity = options.get('max_capacity')
+    hide_unfit = options.get('hide_unfit', False)
+
+    ranked = []
+    for venue in venues:
+        capacity = venue.get('capacity')
+        venue_type = normalize_text(venue.get('type'))
+        matched = type_fit(venue_type, types)
+        if not matched:
+            continue
+        if capacity:
+            if min_capacity is not None and capacity < min_capacity:
+                continue
+            if max_capacity is not None and capacity > max_capacity:
+                continue
+        if hide_unfit and too_small_or_big(capacity, draw_low, draw_high):
+            continue
+        fit = capacity_fit(capacity, draw_low, draw_high)
+        score = (WEIGHTS['match'] * venue.get('match_score', 70) / 100
+                 + WEIGHTS['capacity'] * fit
+                 + WEIGHTS['type'] * matched
+                 + WEIGHTS['fee'] * fee_fit(capacity, fee_low))
+        ranked.append(dict(venue, rank_score=round(score * 100, 1), capacity_fit=round(fit, 2)))
+
+    sort = options.get('sort', 'score')
+    if sort == 'capacity':
+        ranked.sort(key=lambda v: v.get('capacity') or 0, reverse=True)
+    elif sort == 'match':
+        ranked.sort(key=lambda v: v.get('match_score', 0), reverse=True)
+    else:
+        ranked.sort(key=lambda v: v['rank_score'], reverse=True)
+    return ranked, len(venues) - len(ranked)
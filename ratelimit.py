@@ -0,0 +1,476 @@
+"""
+Upstream rate limiting
+Token buckets fed by Anthropic rate-limit headers, plus a retry scheduler.
+With a ledger the budget is shared by every worker process on the node.
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import anthropic
+
+import cancellation
+from ledger import UsageLedger
+
+RETRYABLE_STATUS = (429, 500, 502, 503, 504, 529)
+# How often a waiting call checks for a free slot and for its caller leaving
+SLOT_POLL = 0.1
+
+
+class RateLimited(Exception):
+    """Raised when a call cannot fit the upstream budget in time"""
+
+    def __init__(self, retry_after):
+        super().__init__("RATE_LIMIT_ERROR")
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+
+def sleep(seconds):
+    """time.sleep in SLOT_POLL slices, raising Cancelled once the caller has gone"""
+    deadline = time.monotonic() + seconds
+    while True:
+        cancellation.check()
+        left = deadline - time.monotonic()
+        if left <= 0:
+            return
+        time.sleep(min(left, SLOT_POLL))
+
+
+def parse_reset(value):
+    """Parse an RFC 3339 reset header into epoch seconds"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return None
+
+
+def parse_retry_after(headers):
+    """Seconds to wait from a retry-after header, if present"""
+    if headers is None:
+        return None
+    value = headers.get('retry-after')
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+class Bucket:
+    """One upstream budget (requests, input or output tokens)"""
+
+    def __init__(self, name):
+        self.name = name
+        self.limit = None
+        self.remaining = None
+        self.reset_at = None
+        self.updated_at = None
+
+    def update(self, limit, remaining, reset_at, now):
+        if limit is None or remaining is None:
+            return
+        self.limit = limit
+        self.remaining = remaining
+        self.reset_at = reset_at
+        self.updated_at = now
+
+    def _rate(self, now):
+        # The API replenishes continuously; reset is when the bucket is full.
+        if self.reset_at is None or self.reset_at <= self.updated_at:
+            return self.limit / 60.0
+        return max(self.limit - self.remaining, 1) / (self.reset_at - self.updated_at)
+
+    def level(self, now):
+        if self.limit is None:
+            return float('inf')
+        refill = (now - self.updated_at) * self._rate(now)
+        return min(self.limit, self.remaining + refill)
+
+    def wait_for(self, amount, now):
+        """Seconds until amount is available"""
+        if self.limit is None:
+            return 0.0
+        missing = min(amount, self.limit) - self.level(now)
+        if missing <= 0:
+            return 0.0
+        return missing / self._rate(now)
+
+    def take(self, amount, now):
+        if self.limit is None:
+            return
+        self.remaining = self.level(now) - amount
+        self.updated_at = now
+
+    def to_dict(self, now):
+        if self.limit is None:
+            return None
+        return {
+            'limit': self.limit,
+            'remaining': int(self.level(now)),
+            'reset_in': max(0.0, (self.reset_at or now) - now),
+        }
+
+
+class Slot:
+    """An admitted call's place in the in-flight count
+
+    amounts is what it took from each bucket. They stay pending until the
+    call's response headers are observed, since the server's remaining
+    counts do not include them before that.
+    """
+
+    def __init__(self, limiter, amounts):
+        self._limiter = limiter
+        self.amounts = amounts
+        self.pending = True
+        self._held = True
+
+    def release(self):
+        if self._held:
+            self._held = False
+            self._limiter._release(self)
+
+    async def release_async(self):
+        """release() for the event loop"""
+        if self._held:
+            self._held = False
+            await self._limiter._off_loop(self._limiter._release, self)
+
+
+class RateLimiter:
+    """Admits upstream calls within the observed budget and retries 429s
+
+    max_in_flight caps the calls open at once (None: no cap). With a
+    ledger, the budget, the 429 block and that cap hold across every
+    process using the same ledger file.
+    """
+
+    def __init__(self, max_wait=30.0, max_attempts=4, base_delay=1.0, max_delay=60.0,
+                 max_in_flight=None, ledger=None):
+        self.max_wait = max_wait
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_in_flight = max_in_flight
+        self.ledger = ledger
+        self.buckets = {
+            'requests': Bucket('requests'),
+            'input-tokens': Bucket('input-tokens'),
+            'output-tokens': Bucket('output-tokens'),
+        }
+        self.blocked_until = 0.0
+        # Calls open, and budget taken by calls whose headers are not back
+        # yet; in this process, and on the node when there is a ledger
+        self.in_flight = 0
+        self.pending = dict.fromkeys(self.buckets, 0)
+        self.node_in_flight = 0
+        self.node_pending = dict(self.pending)
+        self.rate_limit_hits = 0
+        self.retries = 0
+        self.rejected = 0
+        self.delayed_seconds = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Build a limiter from RATE_LIMIT_* environment variables"""
+        env = os.environ
+        return cls(
+            max_wait=float(env.get('RATE_LIMIT_MAX_WAIT', 30)),
+            max_attempts=int(env.get('RATE_LIMIT_MAX_ATTEMPTS', 4)),
+            base_delay=float(env.get('RATE_LIMIT_BASE_DELAY', 1)),
+            max_delay=float(env.get('RATE_LIMIT_MAX_DELAY', 60)),
+            max_in_flight=int(env.get('RATE_LIMIT_MAX_IN_FLIGHT', 0)) or None,
+            ledger=UsageLedger.from_env(),
+        )
+
+    @contextmanager
+    def _budget(self, write=True):
+        """Hold the budget for one decision
+
+        With a ledger, the buckets, block and node totals are reloaded
+        from it first and written back afterwards in the same transaction.
+        """
+        with self._lock:
+            if self.ledger is None:
+                self.node_in_flight = self.in_flight
+                self.node_pending = dict(self.pending)
+                yield
+                return
+            with self.ledger.transaction(write):
+                self.ledger.load(self)
+                yield
+                if write:
+                    self.ledger.store(self)
+
+    async def _off_loop(self, fn, *args, undo=None):
+        """fn(*args) for a coroutine, in a thread when there is a ledger
+
+        A ledger decision takes a file lock and a SQLite transaction that
+        can wait on other workers, which would stall the event loop; an
+        in-memory one is quicker than the hop to a thread. Cancelling the
+        caller does not stop the thread; undo gets what it returns after
+        the caller has gone.
+        """
+        if self.ledger is None:
+            return fn(*args)
+        work = asyncio.ensure_future(asyncio.to_thread(fn, *args))
+        try:
+            return await asyncio.shield(work)
+        except asyncio.CancelledError:
+            if undo is not None:
+                work.add_done_callback(
+                    lambda done: done.cancelled() or done.exception() or undo(done.result()))
+            raise
+
+    def _give_back(self, reserved):
+        """Release a slot reserved for a caller that was cancelled meanwhile"""
+        _, slot = reserved
+        if slot is not None:
+            asyncio.get_running_loop().run_in_executor(None, slot.release)
+
+    def _settle(self, headers, slot):
+        self.observe(headers, slot)
+        slot.release()
+
+    def _wait_locked(self, input_tokens, output_tokens, now):
+        wait = max(0.0, self.blocked_until - now)
+        wait = max(wait, self.buckets['requests'].wait_for(1, now))
+        wait = max(wait, self.buckets['input-tokens'].wait_for(input_tokens, now))
+        wait = max(wait, self.buckets['output-tokens'].wait_for(output_tokens, now))
+        return wait
+
+    def estimate_wait(self, input_tokens=0, output_tokens=0):
+        """Seconds until a call of this size would be admitted"""
+        with self._budget(write=False):
+            return self._wait_locked(input_tokens, output_tokens, time.time())
+
+    def acquire(self, input_tokens=0, output_tokens=0):
+        """Reserve budget and a slot for one call, sleeping if it is due shortly"""
+        waited = 0.0
+        while True:
+            wait, slot = self.reserve(input_tokens, output_tokens, waited)
+            if wait > 0:
+                try:
+                    sleep(wait)
+                except BaseException:
+                    if slot is not None:
+                        slot.release()
+                    raise
+            if slot is not None:
+                return slot
+            waited += wait
+
+    async def acquire_async(self, input_tokens=0, output_tokens=0):
+        """acquire() for the event loop"""
+        waited = 0.0
+        while True:
+            wait, slot = await self._off_loop(
+                self.reserve, input_tokens, output_tokens, waited, undo=self._give_back)
+            if wait > 0:
+                try:
+                    await asyncio.sleep(wait)
+                except BaseException:
+                    if slot is not None:
+                        await slot.release_async()
+                    raise
+            if slot is not None:
+                return slot
+            waited += wait
+
+    def reserve(self, input_tokens=0, output_tokens=0, waited=0.0):
+        """Reserve budget for one call; returns (seconds to wait, slot)
+
+        slot is None while every in-flight slot is taken: nothing is
+        reserved and the caller should wait and ask again. waited is the
+        time already spent waiting, which counts towards max_wait.
+        """
+        with self._budget():
+            now = time.time()
+            if self.max_in_flight is not None and self.node_in_flight >= self.max_in_flight:
+                wait = SLOT_POLL
+                full = True
+            else:
+                wait = self._wait_locked(input_tokens, output_tokens, now)
+                full = False
+            if waited + wait > self.max_wait:
+                self.rejected += 1
+                raise RateLimited(wait)
+            self.delayed_seconds += wait
+            if full:
+                return wait, None
+            # Reserve now so concurrent callers queue up behind this one
+            amounts = {'requests': 1, 'input-tokens': input_tokens,
+                       'output-tokens': output_tokens}
+            for name, amount in amounts.items():
+                self.buckets[name].take(amount, now)
+            self._add_pending(amounts, 1)
+            self.in_flight += 1
+            self.node_in_flight += 1
+        return wait, Slot(self, amounts)
+
+    def _add_pending(self, amounts, sign):
+        for name, amount in amounts.items():
+            self.pending[name] += sign * amount
+            self.node_pending[name] += sign * amount
+
+    def _release(self, slot):
+        with self._budget():
+            if slot.pending:
+                slot.pending = False
+                self._add_pending(slot.amounts, -1)
+            self.in_flight -= 1
+            self.node_in_flight -= 1
+
+    def observe(self, headers, slot=None):
+        """Sync the buckets from anthropic-ratelimit-* response headers
+
+        slot is the call the headers came back on. Budget other admitted
+        calls have taken but the server has not seen yet stays reserved.
+        """
+        if headers is None:
+            return
+        now = time.time()
+        with self._budget():
+            if slot is not None and slot.pending:
+                slot.pending = False
+                self._add_pending(slot.amounts, -1)
+            for name, bucket in self.buckets.items():
+                prefix = f'anthropic-ratelimit-{name}-'
+                limit = headers.get(prefix + 'limit')
+                remaining = headers.get(prefix + 'remaining')
+                if limit is None or remaining is None:
+                    continue
+                try:
+                    bucket.update(int(limit), int(remaining) - self.node_pending[name],
+                                  parse_reset(headers.get(prefix + 'reset')), now)
+                except ValueError:
+                    continue
+
+    def _block(self, delay):
+        with self._budget():
+            self.blocked_until = max(self.blocked_until, time.time() + delay)
+
+    def backoff(self, attempt, retry_after=None):
+        """Jittered delay before the next attempt"""
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+        delay = random.uniform(delay / 2, delay)
+        if retry_after is not None:
+            delay = max(delay, retry_after + random.uniform(0, self.base_delay))
+        return delay
+
+    def retry_delay(self, error, attempt):
+        """Seconds to wait before retrying a failed attempt, or raise
+
+        attempt counts the attempts made so far, including the failed one.
+        """
+        if isinstance(error, anthropic.APIConnectionError):
+            if attempt >= self.max_attempts:
+                raise error
+            return self.backoff(attempt)
+        if error.status_code not in RETRYABLE_STATUS:
+            raise error
+        retry_after = parse_retry_after(error.response.headers)
+        self.observe(error.response.headers)
+        if error.status_code == 429:
+            with self._lock:
+                self.rate_limit_hits += 1
+        delay = self.backoff(attempt - 1, retry_after)
+        if error.status_code in (429, 529):
+            # Everyone shares the budget, so hold back every caller; the
+            # next acquire waits the block out
+            self._block(delay)
+            if attempt >= self.max_attempts or delay > self.max_wait:
+                raise RateLimited(delay) from error
+            return 0.0
+        if attempt >= self.max_attempts:
+            raise error
+        return delay
+
+    def call(self, send, input_tokens=0, output_tokens=0, hold=False):
+        """Run send() -> (result, headers) within budget, retrying 429/5xx
+
+        Each attempt holds an in-flight slot while send() runs. hold=True
+        returns (result, slot) and leaves the slot to the caller, for a
+        result such as an open stream that is still using the upstream.
+        """
+        attempt = 0
+        while True:
+            slot = self.acquire(input_tokens, output_tokens)
+            try:
+                result, headers = send()
+            except (anthropic.APIStatusError, anthropic.APIConnectionError) as e:
+                slot.release()
+                attempt += 1
+                delay = self.retry_delay(e, attempt)
+                if delay > 0:
+                    sleep(delay)
+            except BaseException:
+                slot.release()
+                raise
+            else:
+                self.observe(headers, slot)
+                if hold:
+                    return result, slot
+                slot.release()
+                return result
+            with self._lock:
+                self.retries += 1
+
+    async def call_async(self, send, input_tokens=0, output_tokens=0, hold=False):
+        """call() for a coroutine send() on the event loop"""
+        attempt = 0
+        while True:
+            slot = await self.acquire_async(input_tokens, output_tokens)
+            try:
+                result, headers = await send()
+            except (anthropic.APIStatusError, anthropic.APIConnectionError) as e:
+                await slot.release_async()
+                attempt += 1
+                delay = await self._off_loop(self.retry_delay, e, attempt)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            except BaseException:
+                await slot.release_async()
+                raise
+            else:
+                if not hold:
+                    await self._off_loop(self._settle, headers, slot)
+                    return result
+                try:
+                    await self._off_loop(self.observe, headers, slot)
+                except BaseException:
+                    await slot.release_async()
+                    raise
+                return result, slot
+            with self._lock:
+                self.retries += 1
+
+    def stats(self):
+        """Current budgets and limiter counters
+
+        Budgets and in_flight cover the node when there is a ledger; the
+        counters are this process's own.
+        """
+        now = time.time()
+        with self._budget(write=False):
+            return {
+                'buckets': {name: b.to_dict(now) for name, b in self.buckets.items()},
+                'blocked_for': max(0.0, self.blocked_until - now),
+                'in_flight': self.node_in_flight,
+                'process_in_flight': self.in_flight,
+                'max_in_flight': self.max_in_flight,
+                'ledger': self.ledger.stats() if self.ledger is not None else None,
+                'rate_limit_hits': self.rate_limit_hits,
+                'retries': self.retries,
+                'rejected': self.rejected,
+                'delayed_seconds': round(self.delayed_seconds, 3),
+            }
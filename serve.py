@@ -0,0 +1,158 @@
+"""
+Multi-process server
+Forks several waitress workers that accept from one listening socket, so
+JSON, parsing and prompt work spread across cores instead of sharing one
+GIL. The workers admit upstream calls against one rate-limit ledger
+(ledger.py), so together they stay inside the account's budget.
+RATE_LIMIT_LEDGER names the ledger file, a temporary one by default; set
+it empty to give each worker its own budget again.
+
+    python serve.py
+    WEB_CONCURRENCY=4 WEB_THREADS=8 PORT=8080 python serve.py
+
+Each worker still keeps its own memory caches, background jobs and
+metrics. Set DISCOVER_CACHE_DB and RESEARCH_CACHE_DB to share caches; a
+job can only be polled through the worker that accepted it, so clients
+that use /jobs need a single worker. POSIX only.
+"""
+
+import os
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from contextlib import closing
+
+from ledger import UsageLedger
+
+# A worker that dies sooner than this after starting is restarted after a pause
+MIN_UPTIME = 1.0
+
+
+def listen(host, port, backlog=1024):
+    """Bound socket the workers share"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    return sock
+
+
+def watch_parent(parent):
+    """Exit once the supervisor is gone, so workers never outlive it"""
+    while os.getppid() == parent:
+        time.sleep(1)
+    os._exit(0)
+
+
+def run_worker(sock, threads, parent):
+    """Worker body: import the app only after the fork, then serve"""
+    threading.Thread(target=watch_parent, args=(parent,), daemon=True).start()
+    # Importing here gives every worker its own clients, pools and connections
+    from waitress import serve
+    import main
+    serve(main.app, sockets=[sock], threads=threads, channel_timeout=600,
+          channel_request_lookahead=1)
+
+
+def spawn(sock, threads):
+    """Fork one worker and return its pid"""
+    parent = os.getpid()
+    # Held off until the child has dropped the supervisor's handlers
+    mask = signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGTERM, signal.SIGINT})
+    pid = os.fork()
+    if pid:
+        signal.pthread_sigmask(signal.SIG_SETMASK, mask)
+        return pid
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.pthread_sigmask(signal.SIG_SETMASK, mask)
+    code = 0
+    try:
+        run_worker(sock, threads, parent)
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        os._exit(code)
+
+
+def forget(ledger_path, pid):
+    """Release the slots and pending budget a dead worker was holding"""
+    with closing(UsageLedger(ledger_path)) as ledger:
+        ledger.forget(pid)
+
+
+def main():
+    env = os.environ
+    port = int(env.get('PORT', 8080))
+    workers = int(env.get('WEB_CONCURRENCY', os.cpu_count() or 1))
+    threads = int(env.get('WEB_THREADS', 4))
+    ledger_path = env.get('RATE_LIMIT_LEDGER')
+    scratch = ledger_path is None
+    if scratch:
+        ledger_path = os.path.join(tempfile.gettempdir(),
+                                   f"venue-agent-ledger-{os.getpid()}.db")
+        # Workers build their limiter from this
+        env['RATE_LIMIT_LEDGER'] = ledger_path
+    if ledger_path:
+        with closing(UsageLedger(ledger_path)) as ledger:
+            ledger.clear_workers()
+
+    sock = listen(env.get('HOST', '0.0.0.0'), port)
+    print(f"Serving on port {port} with {workers} workers x {threads} threads, "
+          f"ledger {ledger_path or 'off'}")
+    sys.stdout.flush()
+
+    started = {}
+    for _ in range(workers):
+        started[spawn(sock, threads)] = time.time()
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(started):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    try:
+        while started:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            born = started.pop(pid, None)
+            if born is None:
+                continue
+            if ledger_path:
+                forget(ledger_path, pid)
+            if stopping:
+                continue
+            print(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}; "
+                  f"restarting")
+            sys.stdout.flush()
+            if time.time() - born < MIN_UPTIME:
+                time.sleep(MIN_UPTIME)
+            started[spawn(sock, threads)] = time.time()
+    finally:
+        sock.close()
+        if scratch:
+            for suffix in ('', '-wal', '-shm', '.lock'):
+                try:
+                    os.remove(ledger_path + suffix)
+                except FileNotFoundError:
+                    pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Request coalescing
+Concurrent callers with the same key share one in-flight upstream call
+"""
+
+import asyncio
+import threading
+
+import cancellation
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 1
+        # One cancel token per caller; the call stops only when all are gone
+        self.tokens = [cancellation.current()]
+
+
+class SingleFlight:
+    """Runs fn once per key at a time; later callers wait for its outcome"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+
+    def do(self, key, fn):
+        """Return (result, waiters) where waiters counts every caller served"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                call.tokens.append(cancellation.current())
+                self.followers += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                leader = True
+
+        if not leader:
+            while not call.done.wait(0.5):
+                cancellation.check()
+            if call.error is not None:
+                raise call.error
+            return call.result, call.waiters
+
+        try:
+            with cancellation.bound(cancellation.SharedToken(call.tokens)):
+                call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            # No one can join once the key is gone, so waiters is final
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, call.waiters
+
+    def stats(self):
+        """Upstream calls made, callers that piggybacked, and calls in flight"""
+        with self._lock:
+            return {
+                'calls': self.leaders,
+                'coalesced': self.followers,
+                'in_flight': len(self._calls),
+            }
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines sharing one event loop"""
+
+    def __init__(self):
+        self._calls = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key, fn):
+        """Await fn() once per key; returns (result, waiters)"""
+        call = self._calls.get(key)
+        if call is not None:
+            self.followers += 1
+            call[1] += 1
+            call[2] += 1
+            return await self._wait(call), call[1]
+
+        self.leaders += 1
+        # [task, callers served, callers still waiting]
+        call = self._calls[key] = [asyncio.ensure_future(fn()), 1, 1]
+        call[0].add_done_callback(lambda _: self._calls.pop(key, None))
+        return await self._wait(call), call[1]
+
+    @staticmethod
+    async def _wait(call):
+        # shield: one caller going away must not cancel the shared call,
+        # but once the last one has gone nobody needs the result
+        try:
+            return await asyncio.shield(call[0])
+        except asyncio.CancelledError:
+            call[2] -= 1
+            if call[2] == 0:
+                call[0].cancel()
+            raise
+
+    def stats(self):
+        return {
+            'calls': self.leaders,
+            'coalesced': self.followers,
+            'in_flight': len(self._calls),
+        }
@@ -0,0 +1,92 @@
+"""
+Precompiled static responses
+Pages and assets are encoded once at import and served with ETags
+"""
+
+import gzip
+import hashlib
+import re
+
+from flask import Response
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+HTML_CACHE = 'no-cache'
+ASSET_CACHE = 'public, max-age=31536000, immutable'
+
+STYLE_BLOCK = re.compile(r'<style>(.*?)</style>', re.DOTALL)
+SCRIPT_BLOCK = re.compile(r'<script>(.*?)</script>', re.DOTALL)
+
+
+class Asset:
+    """One immutable body with precomputed encodings and ETags"""
+
+    def __init__(self, body, content_type, cache_control):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.content_type = content_type
+        self.cache_control = cache_control
+        self.digest = hashlib.sha256(body).hexdigest()
+        self.encodings = {None: body, 'gzip': gzip.compress(body, 9, mtime=0)}
+        if brotli is not None:
+            self.encodings['br'] = brotli.compress(body, quality=11)
+
+    def etag(self, encoding):
+        # Strong ETags must differ per representation
+        suffix = f"-{encoding}" if encoding else ''
+        return f'"{self.digest[:32]}{suffix}"'
+
+    def choose_encoding(self, accept):
+        for encoding in ('br', 'gzip'):
+            if encoding in self.encodings and accept[encoding] > 0:
+                return encoding
+        return None
+
+    def select(self, accept_encodings, if_none_match):
+        """(status, headers, body) given parsed Accept-Encoding and If-None-Match"""
+        encoding = self.choose_encoding(accept_encodings)
+        etag = self.etag(encoding)
+        headers = {
+            'ETag': etag,
+            'Cache-Control': self.cache_control,
+            'Vary': 'Accept-Encoding',
+        }
+        if if_none_match.contains(etag.strip('"')):
+            return 304, headers, b''
+        headers['Content-Type'] = self.content_type
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        return 200, headers, self.encodings[encoding]
+
+    def response(self, request):
+        """Full, compressed or 304 response for this request"""
+        status, headers, body = self.select(request.accept_encodings, request.if_none_match)
+        return Response(body, status=status, headers=headers)
+
+
+def build_site(html, split_assets=False):
+    """Return (index Asset, {filename: Asset}) for a rendered page
+
+    With split_assets, the inline <style> and <script> blocks are moved
+    into fingerprinted files that browsers can cache indefinitely.
+    """
+    assets = {}
+    if split_assets:
+        def extract(pattern, ext, content_type, tag):
+            nonlocal html
+            m = pattern.search(html)
+            if m is None:
+                return
+            asset = Asset(m.group(1), content_type, ASSET_CACHE)
+            name = f"app.{asset.digest[:12]}.{ext}"
+            assets[name] = asset
+            html = html[:m.start()] + tag.format(name) + html[m.end():]
+
+        extract(STYLE_BLOCK, 'css', 'text/css; charset=utf-8',
+                '<link rel="stylesheet" href="/assets/{}">')
+        extract(SCRIPT_BLOCK, 'js', 'application/javascript; charset=utf-8',
+                '<script src="/assets/{}"></script>')
+    return Asset(html, 'text/html; charset=utf-8', HTML_CACHE), assets
@@ -0,0 +1,15 @@
+"""
+Test setup
+Puts the repository on the import path and keeps main from opening the
+default venue store or needing a real API key
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('ANTHROPIC_API_KEY', 'test')
+os.environ['VENUE_STORE_DB'] = ''
+for name in ('DISCOVER_CACHE_DB', 'RESEARCH_CACHE_DB', 'RATE_LIMIT_LEDGER'):
+    os.environ.pop(name, None)
@@ -0,0 +1,82 @@
+import time
+
+import pytest
+
+from cache import SQLiteBackend, TTLCache, discover_cache_key, venue_cache_key
+
+
+@pytest.fixture
+def backend(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / 'cache.db'))
+    yield backend
+    backend.close()
+
+
+def test_entries_expire_after_their_ttl():
+    cache = TTLCache(ttl=60)
+    cache.set('short', 'value', ttl=0.01)
+    cache.set('long', 'value')
+    time.sleep(0.02)
+    assert cache.get('short') is None
+    assert cache.get('long') == 'value'
+    assert cache.stats()['expirations'] == 1
+    assert cache.stats()['size'] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(max_entries=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert cache.stats()['evictions'] == 1
+
+
+def test_peek_does_not_count_or_reorder():
+    cache = TTLCache(max_entries=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.peek('a') == 1
+    cache.set('c', 3)
+    assert cache.peek('a') is None
+    assert cache.stats()['hits'] == 0
+
+
+def test_backend_round_trip_survives_a_new_cache(backend):
+    TTLCache(backend=backend).set('key', {'venues': [{'name': 'Mohawk'}]})
+    cache = TTLCache(backend=backend)
+    assert cache.get('key') == {'venues': [{'name': 'Mohawk'}]}
+    assert cache.stats()['size'] == 1
+    cache.delete('key')
+    assert backend.get('key') is None
+
+
+def test_expired_backend_entry_is_a_miss(backend):
+    TTLCache(backend=backend).set('key', 'value', ttl=0.01)
+    time.sleep(0.02)
+    cache = TTLCache(backend=backend)
+    assert cache.get('key') is None
+    assert cache.stats()['misses'] == 1
+
+
+def test_backend_prunes_expired_and_oldest_rows(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / 'cache.db'), max_entries=10)
+    now = time.time()
+    backend.set('expired', 1, now - 10, now - 1)
+    evicted = sum(backend.set(f"key {i}", i, now + i, now + 60) for i in range(49))
+    assert evicted == 40
+    assert backend.get('expired') is None
+    assert backend.get('key 38') is None
+    assert backend.get('key 48')[0] == 48
+    backend.close()
+
+
+def test_keys_ignore_case_spacing_and_order():
+    assert discover_cache_key({'genre': 'Indie Rock', 'drawSize': '200 - 400',
+                               'similarArtists': 'B, A'}, 'Austin') == \
+        discover_cache_key({'genre': 'indie  rock', 'drawSize': '200-400',
+                            'similarArtists': ['a', 'b']}, ' austin ')
+    assert venue_cache_key({'name': 'Mohawk', 'city': 'Austin', 'website': 'https://www.mohawk.com/'}) == \
+        venue_cache_key({'name': 'mohawk', 'city': 'austin', 'website': 'mohawk.com'})
@@ -0,0 +1,38 @@
+import csv
+import io
+import json
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def client():
+    return main.app.test_client()
+
+
+@pytest.mark.parametrize('path', ['/export/venues', '/export/research'])
+@pytest.mark.parametrize('venues, field', [
+    ('x', 'venues'),
+    (['x'], 'venues[0]'),
+    ([{'name': 'A', 'city': 'X'}, {'name': 7, 'city': 'X'}], 'venues[1].name'),
+    ([{'name': 'A', 'capacity': 'lots'}], 'venues[0].capacity'),
+])
+def test_bad_session_venues_are_refused_before_streaming(client, path, venues, field):
+    response = client.post(path, json={'venues': venues})
+    assert response.status_code == 400
+    assert response.get_json()['field'] == field
+
+
+def test_session_export_rows(client):
+    venues = [{'name': 'Mohawk', 'city': 'Austin', 'state': 'TX', 'capacity': '1,000'},
+              {'name': '=cmd', 'city': 'Austin'}]
+    response = client.post('/export/venues', json={'venues': venues})
+    assert response.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [(r['name'], r['capacity']) for r in rows] == [('Mohawk', '1000'), ("'=cmd", '')]
+
+    response = client.post('/export/venues', json={'venues': venues, 'format': 'jsonl'})
+    lines = response.get_data(as_text=True).splitlines()
+    assert json.loads(lines[0])['name'] == 'Mohawk'
@@ -0,0 +1,98 @@
+import threading
+import time
+
+import pytest
+
+import cancellation
+from jobs import CANCELLED, FAILED, QUEUED, RUNNING, SUCCEEDED, JobQueue, QueueFull
+from ratelimit import RateLimited
+
+
+@pytest.fixture
+def queue():
+    queue = JobQueue(max_workers=1, max_pending=2)
+    yield queue
+    queue.shutdown()
+
+
+def finished(job):
+    job.future.exception(timeout=2)
+    return job.to_dict()
+
+
+def test_job_moves_from_queued_to_succeeded(queue):
+    release = threading.Event()
+    job = queue.submit('discover', lambda: release.wait(2) and ['venue'])
+    version = job.wait_for_change(0, 2)
+    assert job.status == RUNNING and job.started_at is not None
+    release.set()
+    job.wait_for_change(version, 2)
+    data = finished(job)
+    assert data['status'] == SUCCEEDED
+    assert data['result'] == ['venue']
+    assert queue.get(job.id) is job
+
+
+def test_failure_keeps_the_error_and_retry_after(queue):
+    def fail():
+        raise RateLimited(2.5)
+
+    data = finished(queue.submit('research', fail))
+    assert data['status'] == FAILED
+    assert data['error'] == 'RATE_LIMIT_ERROR'
+    assert data['retry_after'] == 3
+    assert 'result' not in data
+
+
+def test_queue_full_counts_only_waiting_jobs(queue):
+    release = threading.Event()
+    running = queue.submit('discover', release.wait, 2)
+    running.wait_for_change(0, 2)
+    waiting = [queue.submit('discover', lambda: None) for _ in range(2)]
+    assert all(job.status == QUEUED for job in waiting)
+    with pytest.raises(QueueFull):
+        queue.submit('discover', lambda: None)
+    assert queue.stats()[QUEUED] == 2
+    release.set()
+    for job in waiting:
+        finished(job)
+    queue.submit('discover', lambda: None)
+
+
+def test_cancel_stops_a_running_job_and_skips_a_queued_one(queue):
+    started = threading.Event()
+
+    def work():
+        started.set()
+        while True:
+            cancellation.check()
+            time.sleep(0.01)
+
+    running = queue.submit('discover', work)
+    waiting = queue.submit('discover', lambda: 'never')
+    assert started.wait(2)
+    queue.cancel(waiting.id)
+    queue.cancel(running.id)
+    running.future.result(timeout=2)
+    assert running.to_dict()['status'] == CANCELLED
+    assert waiting.status == CANCELLED and waiting.result is None
+    assert queue.cancel('missing') is None
+
+
+def test_finished_status_is_final():
+    queue = JobQueue(max_workers=1)
+    job = queue.submit('discover', lambda: 'done')
+    finished(job)
+    queue.cancel(job.id)
+    assert job.status == SUCCEEDED
+    queue.shutdown()
+
+
+def test_finished_jobs_are_pruned_after_result_ttl():
+    queue = JobQueue(max_workers=1, result_ttl=0.01)
+    job = queue.submit('discover', lambda: 'done')
+    finished(job)
+    time.sleep(0.02)
+    assert queue.stats()[SUCCEEDED] == 0
+    assert queue.get(job.id) is None
+    queue.shutdown()
@@ -0,0 +1,83 @@
+import threading
+
+import pytest
+
+from ledger import UsageLedger
+from ratelimit import RateLimited, RateLimiter
+from test_ratelimit import StatusError, ratelimit_headers
+
+
+@pytest.fixture
+def workers(tmp_path):
+    """Two limiters sharing one ledger file, as two worker processes would"""
+    path = str(tmp_path / 'ledger.db')
+    ledgers = [UsageLedger(path), UsageLedger(path)]
+    # Both live in this process; give the second its own worker row
+    ledgers[1].pid = ledgers[0].pid + 1
+    yield [RateLimiter(max_wait=0, max_in_flight=4, ledger=ledger) for ledger in ledgers]
+    for ledger in ledgers:
+        ledger.close()
+
+
+def test_concurrent_reservations_share_one_budget(workers):
+    workers[0].observe(ratelimit_headers('requests', 20, 20, 3600))
+    slots = []
+    barrier = threading.Barrier(8)
+
+    def reserve(limiter):
+        barrier.wait()
+        for _ in range(10):
+            try:
+                _, slot = limiter.reserve()
+            except RateLimited:
+                continue
+            if slot is not None:
+                slots.append(slot)
+                slot.release()
+
+    threads = [threading.Thread(target=reserve, args=(workers[i % 2],)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(slots) == 20
+    for limiter in workers:
+        stats = limiter.stats()
+        assert stats['buckets']['requests']['remaining'] == 0
+        assert stats['in_flight'] == 0
+
+
+def test_in_flight_cap_covers_both_workers(workers):
+    for limiter in workers:
+        limiter.max_in_flight = 1
+        limiter.max_wait = 1
+    slot = workers[0].acquire()
+    assert workers[1].reserve() == (pytest.approx(0.1), None)
+    assert workers[1].stats()['in_flight'] == 1
+    assert workers[1].stats()['process_in_flight'] == 0
+    slot.release()
+    workers[1].acquire().release()
+
+
+def test_pending_budget_is_seen_by_the_other_worker(workers):
+    workers[0].observe(ratelimit_headers('requests', 10, 10, 60))
+    slot = workers[0].acquire()
+    # The other worker's headers predate this call, so it stays reserved
+    workers[1].observe(ratelimit_headers('requests', 10, 10, 60))
+    assert workers[1].stats()['buckets']['requests']['remaining'] == 9
+    slot.release()
+
+
+def test_429_block_holds_back_the_other_worker(workers):
+    workers[0].max_wait = 30
+    workers[0].retry_delay(StatusError(429, {'retry-after': '5'}), 1)
+    assert workers[1].estimate_wait() >= 5
+    with pytest.raises(RateLimited):
+        workers[1].acquire()
+
+
+def test_forget_drops_an_exited_workers_calls(workers):
+    workers[1].acquire()
+    assert workers[0].stats()['in_flight'] == 1
+    workers[0].ledger.forget(workers[1].ledger.pid)
+    assert workers[0].stats()['in_flight'] == 0
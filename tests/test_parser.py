@@ -0,0 +1,91 @@
+from main import clean_venue, parse_venue_block, parse_venues
+
+
+class TextBlock:
+    type = 'text'
+
+    def __init__(self, text):
+        self.text = text
+
+
+def test_parses_every_field():
+    venue = parse_venue_block("""VENUE: Doug Fir Lounge
+CITY: Portland
+STATE: OR
+CAPACITY: 300
+TYPE: Club
+WEBSITE: https://dougfirlounge.com
+MATCH_SCORE: 92
+REASON: Books touring indie acts""")
+    assert venue == {
+        'name': 'Doug Fir Lounge', 'city': 'Portland', 'state': 'OR', 'capacity': 300,
+        'type': 'Club', 'website': 'https://dougfirlounge.com', 'match_score': 92,
+        'reason': 'Books touring indie acts',
+    }
+
+
+def test_labels_with_markdown_and_list_markers():
+    venue = parse_venue_block("""- **Venue:** The Earl
+  * City: Atlanta
+### Match Score: 85%""")
+    assert venue['name'] == 'The Earl'
+    assert venue['city'] == 'Atlanta'
+    assert venue['match_score'] == 85
+
+
+def test_value_on_the_line_after_its_label():
+    venue = parse_venue_block("VENUE:\nMohawk\nCITY: Austin\n")
+    assert venue['name'] == 'Mohawk'
+    assert venue['city'] == 'Austin'
+
+
+def test_label_after_an_empty_label_is_not_its_value():
+    venue = parse_venue_block("VENUE: Mohawk\nWEBSITE:\nNote: closed Mondays\nCITY: Austin\n")
+    assert venue['city'] == 'Austin'
+    assert 'website' not in venue
+    venue = parse_venue_block("VENUE: Mohawk\nTYPE:\n**Booking:** email only\nCITY: Austin\n")
+    assert 'type' not in venue
+    venue = parse_venue_block("VENUE: Mohawk\nCITY: Austin\nWEBSITE:\nhttps://mohawkaustin.com")
+    assert venue['website'] == 'https://mohawkaustin.com'
+
+
+def test_first_value_wins():
+    venue = parse_venue_block("VENUE: First\nVENUE: Second\nCITY: Austin")
+    assert venue['name'] == 'First'
+
+
+def test_incomplete_block_is_dropped():
+    assert parse_venue_block("VENUE: Nowhere Hall\nCAPACITY: 200") is None
+    assert parse_venue_block("Some closing remarks") is None
+
+
+def test_state_is_optional():
+    venue = parse_venue_block("VENUE: Mohawk\nCITY: Austin")
+    assert 'state' not in venue
+
+
+def test_parse_venues_splits_blocks_and_skips_bad_ones():
+    content = [TextBlock("Intro text\n---\nVENUE: A\nCITY: X\n---\nVENUE: B\n---\n"
+                         "VENUE: C\nCITY: Y\n---")]
+    assert [v['name'] for v in parse_venues(content)] == ['A', 'C']
+
+
+def test_clean_venue_capacity():
+    assert clean_venue({'name': 'A', 'city': 'X', 'capacity': '1,200 standing'})['capacity'] == 1200
+    assert 'capacity' not in clean_venue({'name': 'A', 'city': 'X', 'capacity': 'Unknown'})
+    assert 'capacity' not in clean_venue({'name': 'A', 'city': 'X', 'capacity': 'varies'})
+
+
+def test_clean_venue_website():
+    assert clean_venue({'name': 'A', 'city': 'X', 'website': '[site](https://a.example)'}
+                       )['website'] == 'https://a.example'
+    assert clean_venue({'name': 'A', 'city': 'X', 'website': '<https://a.example>'}
+                       )['website'] == 'https://a.example'
+    assert clean_venue({'name': 'A', 'city': 'X', 'website': 'N/A'})['website'] is None
+
+
+def test_clean_venue_match_score():
+    assert clean_venue({'name': 'A', 'city': 'X'})['match_score'] == 70
+    assert clean_venue({'name': 'A', 'city': 'X', 'match_score': '150'})['match_score'] == 100
+    assert clean_venue({'name': 'A', 'city': 'X', 'match_score': 'high'})['match_score'] == 70
+
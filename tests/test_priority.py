@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from priority import BULK, DISCOVER, RESEARCH, Dispatcher
+
+
+def admission_order(dispatcher, names, hold=0.0):
+    """Classes in the order their calls ran, all queued behind one held slot"""
+    order = []
+
+    async def call(name):
+        async with dispatcher.slot_async(name):
+            order.append(name)
+            await asyncio.sleep(0)
+
+    async def run():
+        async with dispatcher.slot_async(DISCOVER):
+            tasks = [asyncio.create_task(call(name)) for name in names]
+            await asyncio.sleep(hold or 0.01)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    return order
+
+
+def test_classes_share_slots_by_weight():
+    dispatcher = Dispatcher(capacity=1, limits={BULK: None})
+    order = admission_order(dispatcher, [BULK] * 10 + [DISCOVER] * 10 + [RESEARCH] * 10)
+    first = order[:10]
+    assert (first.count(RESEARCH), first.count(DISCOVER), first.count(BULK)) == (6, 3, 1)
+    assert dispatcher.stats()['classes'][RESEARCH]['admitted'] == 10
+
+
+def test_queued_research_runs_ahead_of_earlier_bulk():
+    order = admission_order(Dispatcher(capacity=1), [BULK, BULK, RESEARCH])
+    assert order[0] == RESEARCH
+
+
+def test_limit_passes_over_a_full_class():
+    dispatcher = Dispatcher(capacity=2, limits={BULK: 1})
+    with dispatcher.slot(BULK):
+        with dispatcher.slot(RESEARCH):
+            stats = dispatcher.stats()
+    assert stats['running'] == 2
+    assert stats['classes'][BULK]['running'] == 1
+
+
+def test_overdue_call_is_promoted():
+    dispatcher = Dispatcher(capacity=1, max_wait=0.05)
+    order = admission_order(dispatcher, [BULK] + [RESEARCH] * 5, hold=0.1)
+    assert order[0] == BULK
+    assert dispatcher.stats()['classes'][BULK]['promoted'] == 1
+
+
+def test_without_max_wait_bulk_waits_its_turn():
+    dispatcher = Dispatcher(capacity=1, max_wait=60)
+    order = admission_order(dispatcher, [BULK] + [RESEARCH] * 5, hold=0.1)
+    assert order[-1] == BULK
+    assert dispatcher.stats()['classes'][BULK]['promoted'] == 0
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    dispatcher = Dispatcher(capacity=1)
+
+    async def run():
+        async with dispatcher.slot_async(DISCOVER):
+            waiter = asyncio.create_task(dispatcher.slot_async(BULK).__aenter__())
+            await asyncio.sleep(0.01)
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+
+    asyncio.run(run())
+    stats = dispatcher.stats()
+    assert stats['running'] == 0
+    assert stats['classes'][BULK]['queued'] == 0
+    assert stats['classes'][BULK]['withdrawn'] == 1
+
+
+def test_weights_must_be_positive():
+    with pytest.raises(ValueError):
+        Dispatcher(weights={BULK: 0})
@@ -0,0 +1,10 @@
+from main import research_overlay_content, research_report_prompt
+
+
+def test_research_prompts_without_a_state():
+    venue = {'name': 'Mohawk', 'city': 'Austin'}
+    profile = {'name': 'Artist', 'genre': 'rock', 'drawSize': '100'}
+    assert 'Location: Austin\n' in research_report_prompt(venue)
+    overlay = research_overlay_content(venue, profile, 'Report')
+    assert 'Location: Austin\n' in overlay[0]['text']
+    assert 'Location: Austin, TX' in research_report_prompt(dict(venue, state='TX'))
@@ -0,0 +1,101 @@
+import pytest
+
+from ranking import capacity_fit, parse_range, rerank
+from validation import InputValidator, Invalid
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('200-400', (200, 400)),
+    ('$1,500-3,000', (1500, 3000)),
+    ('2k+', (2000, None)),
+    ('1.5k-2k', (1500, 2000)),
+    ('~300', (300, 300)),
+    ('150 kids', (150, 150)),
+    ('about 50 kilometers away', (50, 50)),
+    ('', (None, None)),
+    (None, (None, None)),
+])
+def test_parse_range(text, expected):
+    assert parse_range(text) == expected
+
+
+def test_capacity_fit():
+    assert capacity_fit(400, 200, 400) == 1.0
+    assert capacity_fit(1000, 200, 400) == pytest.approx(0.5)
+    assert capacity_fit(150, 200, 400) == pytest.approx(0.5)
+    assert capacity_fit(None, 200, 400) == 0.5
+
+
+def venue(name, **fields):
+    return dict({'name': name, 'city': 'Austin', 'match_score': 80}, **fields)
+
+
+def test_ranks_by_fit_and_counts_hidden():
+    venues = [venue('Huge', capacity=3000), venue('Right', capacity=350)]
+    ranked, hidden = rerank(venues, {'drawSize': '200-400'})
+    assert [v['name'] for v in ranked] == ['Right', 'Huge']
+    assert hidden == 0
+    assert ranked[0]['capacity_fit'] == 1.0
+    assert 'rank_score' not in venues[0]
+
+
+def test_type_filter_and_coverage():
+    venues = [venue('Bar', type='Bar', capacity=300),
+              venue('Both', type='Bar and Club', capacity=300),
+              venue('Theater', type='Theater', capacity=300)]
+    ranked, hidden = rerank(venues, {}, {'types': ['bar', 'club']})
+    assert [v['name'] for v in ranked] == ['Both', 'Bar']
+    assert ranked[0]['rank_score'] > ranked[1]['rank_score']
+    assert hidden == 1
+
+
+def test_capacity_bounds_pass_unknown_capacity():
+    venues = [venue('Small', capacity=50), venue('Unknown'), venue('Big', capacity=900)]
+    ranked, hidden = rerank(venues, {}, {'min_capacity': 100, 'max_capacity': 500})
+    assert [v['name'] for v in ranked] == ['Unknown']
+    assert hidden == 2
+
+
+def test_hide_unfit():
+    venues = [venue('Tiny', capacity=100), venue('Fine', capacity=300),
+              venue('Arena', capacity=5000)]
+    ranked, _ = rerank(venues, {'drawSize': '200-400'}, {'hide_unfit': True})
+    assert [v['name'] for v in ranked] == ['Fine']
+
+
+def test_sort_orders():
+    venues = [venue('A', capacity=100, match_score=90), venue('B', capacity=500, match_score=60)]
+    by_capacity, _ = rerank(venues, {}, {'sort': 'capacity'})
+    by_match, _ = rerank(venues, {}, {'sort': 'match'})
+    assert [v['name'] for v in by_capacity] == ['B', 'A']
+    assert [v['name'] for v in by_match] == ['A', 'B']
+
+
+def test_rerank_body_validation():
+    venues, profile, options = InputValidator().rerank({
+        'venues': [{'name': 'A', 'capacity': '1,200', 'extra': 'kept'}, {'name': 'B'}],
+        'profile': {'drawSize': '200-400', 'name': 'not needed'},
+        'options': {'types': 'club', 'sort': 'capacity', 'min_capacity': '100'}})
+    assert venues == [{'name': 'A', 'capacity': 1200, 'extra': 'kept'}, {'name': 'B'}]
+    assert profile == {'drawSize': '200-400'}
+    assert options == {'types': ['club'], 'sort': 'capacity', 'min_capacity': 100}
+
+
+def rejected(body):
+    with pytest.raises(Invalid) as info:
+        InputValidator().rerank(body)
+    return info.value
+
+
+@pytest.mark.parametrize('body, field', [
+    ({'venues': 'A'}, 'venues'),
+    ({'venues': ['A']}, 'venues[0]'),
+    ({'venues': [{'name': 'A', 'capacity': 'lots'}]}, 'venues[0].capacity'),
+    ({'venues': [{'name': 'A', 'type': 3}]}, 'venues[0].type'),
+    ({'venues': [], 'options': {'sort': 'name'}}, 'options.sort'),
+    ({'venues': [], 'options': {'hide_unfit': 'yes'}}, 'options.hide_unfit'),
+    ({'venues': [], 'options': {'max_capacity': 'big'}}, 'options.max_capacity'),
+])
+def test_rerank_refuses_bad_input(body, field):
+    e = rejected(body)
+    assert (e.field, e.reason) == (field, 'type')
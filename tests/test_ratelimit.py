@@ -0,0 +1,131 @@
+import threading
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+import cancellation
+from ratelimit import Bucket, RateLimited, RateLimiter, parse_reset, parse_retry_after
+
+
+class StatusError(Exception):
+    """Stands in for anthropic.APIStatusError, whose HTTP types vary by SDK release"""
+
+    def __init__(self, status_code, headers=None):
+        super().__init__(status_code)
+        self.status_code = status_code
+        self.response = type('Response', (), {'headers': headers or {}})()
+
+
+def iso(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+def ratelimit_headers(name, limit, remaining, reset_in):
+    prefix = f'anthropic-ratelimit-{name}-'
+    return {prefix + 'limit': str(limit), prefix + 'remaining': str(remaining),
+            prefix + 'reset': iso(time.time() + reset_in)}
+
+
+def test_bucket_refills_towards_reset():
+    bucket = Bucket('requests')
+    bucket.update(60, 0, 1060.0, 1000.0)
+    assert bucket.wait_for(1, 1000.0) == pytest.approx(1.0)
+    assert bucket.level(1030.0) == pytest.approx(30.0)
+    assert bucket.level(2000.0) == 60
+    assert bucket.wait_for(1, 1030.0) == 0.0
+
+
+def test_headers_set_the_budget():
+    limiter = RateLimiter()
+    limiter.observe(ratelimit_headers('requests', 60, 0, 60))
+    assert limiter.estimate_wait() == pytest.approx(1.0, abs=0.05)
+    limiter.observe(ratelimit_headers('input-tokens', 1000, 1000, 60))
+    assert limiter.stats()['buckets']['input-tokens']['remaining'] == 1000
+
+
+def test_admitted_calls_stay_reserved_until_their_headers_return():
+    limiter = RateLimiter()
+    limiter.observe(ratelimit_headers('requests', 10, 5, 60))
+    slot = limiter.acquire()
+    # Headers from another call that left before this one reached the server
+    limiter.observe(ratelimit_headers('requests', 10, 5, 60))
+    assert limiter.stats()['buckets']['requests']['remaining'] == 4
+    limiter.observe(ratelimit_headers('requests', 10, 4, 60), slot)
+    slot.release()
+    assert limiter.stats()['buckets']['requests']['remaining'] == 4
+
+
+def test_wait_beyond_max_wait_is_refused():
+    limiter = RateLimiter(max_wait=0.5)
+    limiter.observe(ratelimit_headers('requests', 60, 0, 60))
+    with pytest.raises(RateLimited) as info:
+        limiter.acquire()
+    assert info.value.retry_after == 1
+    assert limiter.stats()['rejected'] == 1
+
+
+def test_429_blocks_every_caller_for_retry_after():
+    limiter = RateLimiter(max_wait=30, base_delay=0.01)
+    assert limiter.retry_delay(StatusError(429, {'retry-after': '7'}), 1) == 0.0
+    stats = limiter.stats()
+    assert stats['rate_limit_hits'] == 1
+    assert 7 <= stats['blocked_for'] <= 7.1
+    assert limiter.estimate_wait() >= 7
+
+
+def test_529_blocks_without_counting_a_rate_limit_hit():
+    limiter = RateLimiter(base_delay=0.01)
+    assert limiter.retry_delay(StatusError(529), 1) == 0.0
+    assert limiter.stats()['rate_limit_hits'] == 0
+    assert limiter.stats()['blocked_for'] > 0
+
+
+def test_429_past_the_last_attempt_or_max_wait_raises():
+    limiter = RateLimiter(max_wait=5, max_attempts=2, base_delay=0.01)
+    with pytest.raises(RateLimited):
+        limiter.retry_delay(StatusError(429, {'retry-after': '7'}), 1)
+    with pytest.raises(RateLimited):
+        limiter.retry_delay(StatusError(429), 2)
+
+
+def test_server_errors_back_off_without_blocking():
+    limiter = RateLimiter(base_delay=1, max_attempts=3)
+    assert 0.5 <= limiter.retry_delay(StatusError(503), 1) <= 1
+    assert limiter.stats()['blocked_for'] == 0
+    with pytest.raises(StatusError):
+        limiter.retry_delay(StatusError(503), 3)
+    with pytest.raises(StatusError):
+        limiter.retry_delay(StatusError(400), 1)
+
+
+def test_in_flight_cap():
+    limiter = RateLimiter(max_in_flight=1, max_wait=0.3)
+    slot = limiter.acquire()
+    with pytest.raises(RateLimited):
+        limiter.acquire()
+    slot.release()
+    limiter.acquire().release()
+    assert limiter.stats()['in_flight'] == 0
+
+
+def test_waiting_caller_that_goes_away_gives_its_slot_back():
+    limiter = RateLimiter(max_wait=30)
+    limiter.observe(ratelimit_headers('requests', 60, 0, 60))
+    limiter._block(5)
+    token = cancellation.CancelToken()
+    threading.Timer(0.1, token.cancel).start()
+    started = time.monotonic()
+    with cancellation.bound(token):
+        with pytest.raises(cancellation.Cancelled):
+            limiter.acquire()
+    assert time.monotonic() - started < 1
+    assert limiter.stats()['in_flight'] == 0
+
+
+def test_header_parsers():
+    assert parse_reset('2026-01-01T00:00:00Z') == datetime(2026, 1, 1, tzinfo=timezone.utc).timestamp()
+    assert parse_reset('soon') is None
+    assert parse_retry_after({'retry-after': '2.5'}) == 2.5
+    assert parse_retry_after({'retry-after': 'later'}) is None
+    assert parse_retry_after(None) is None
@@ -0,0 +1,47 @@
+import asyncio
+import json
+
+import pytest
+
+import asgi
+import main
+
+MALFORMED = [b'{"profile": ', b'not json', b'']
+ROUTES = ['/discover', '/research', '/discover/stream', '/research/stream']
+
+
+@pytest.mark.parametrize('body', MALFORMED)
+@pytest.mark.parametrize('path', ROUTES + ['/jobs/discover', '/jobs/research', '/tour', '/rerank'])
+def test_malformed_body_is_refused(path, body):
+    response = main.app.test_client().post(path, data=body, content_type='application/json')
+    assert response.status_code == 400
+    assert response.get_json()['reason'] == 'type'
+
+
+def asgi_post(path, body):
+    """(status, JSON body) from one POST through the ASGI app"""
+    sent = []
+    chunks = [{'type': 'http.request', 'body': body, 'more_body': False}]
+
+    async def receive():
+        if chunks:
+            return chunks.pop()
+        await asyncio.Event().wait()
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': 'POST', 'path': path, 'query_string': b'',
+             'headers': [(b'content-type', b'application/json')]}
+    asyncio.run(asgi.app(scope, receive, send))
+    status = next(m['status'] for m in sent if m['type'] == 'http.response.start')
+    payload = b''.join(m.get('body', b'') for m in sent if m['type'] == 'http.response.body')
+    return status, json.loads(payload)
+
+
+@pytest.mark.parametrize('body', MALFORMED)
+@pytest.mark.parametrize('path', ROUTES + ['/rerank'])
+def test_malformed_body_is_refused_on_asgi(path, body):
+    status, payload = asgi_post(path, body)
+    assert status == 400
+    assert payload['reason'] == 'type'
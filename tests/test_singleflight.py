@@ -0,0 +1,158 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import cancellation
+from cancellation import CancelToken
+from singleflight import AsyncSingleFlight, SingleFlight
+
+
+def wait_until(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_followers_share_the_result():
+    flight = SingleFlight()
+    release = threading.Event()
+    results = []
+    calls = []
+
+    def work():
+        calls.append(1)
+        release.wait(2)
+        return 'venues'
+
+    threads = [threading.Thread(target=lambda: results.append(flight.do('key', work)))
+               for _ in range(3)]
+    for t in threads:
+        t.start()
+    wait_until(lambda: flight.stats()['coalesced'] == 2)
+    release.set()
+    for t in threads:
+        t.join()
+    assert calls == [1]
+    assert results == [('venues', 3)] * 3
+    assert flight.stats() == {'calls': 1, 'coalesced': 2, 'in_flight': 0}
+
+
+def test_leader_failure_reaches_every_caller():
+    flight = SingleFlight()
+    release = threading.Event()
+    errors = []
+
+    def work():
+        release.wait(2)
+        raise ValueError('upstream down')
+
+    def caller():
+        try:
+            flight.do('key', work)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=caller) for _ in range(2)]
+    for t in threads:
+        t.start()
+    wait_until(lambda: flight.stats()['coalesced'] == 1)
+    release.set()
+    for t in threads:
+        t.join()
+    assert len(errors) == 2 and errors[0] is errors[1]
+    # The failure is not cached; the next caller runs the work again
+    assert flight.do('key', lambda: 'ok') == ('ok', 1)
+
+
+def test_work_stops_only_when_every_caller_has_gone():
+    flight = SingleFlight()
+    started, stopped = threading.Event(), threading.Event()
+    tokens = [CancelToken(), CancelToken()]
+    cancelled = []
+
+    def work():
+        started.set()
+        try:
+            while True:
+                cancellation.check()
+                time.sleep(0.01)
+        except cancellation.Cancelled:
+            stopped.set()
+            raise
+
+    def caller(token):
+        with cancellation.bound(token):
+            try:
+                flight.do('key', work)
+            except cancellation.Cancelled:
+                cancelled.append(token)
+
+    threads = [threading.Thread(target=caller, args=(token,)) for token in tokens]
+    threads[0].start()
+    assert started.wait(2)
+    threads[1].start()
+    wait_until(lambda: flight.stats()['coalesced'] == 1)
+    tokens[1].cancel()
+    threads[1].join(2)
+    assert cancelled == [tokens[1]]
+    assert not stopped.wait(0.1)
+    tokens[0].cancel()
+    threads[0].join(2)
+    assert stopped.is_set()
+    assert cancelled == tokens[::-1]
+
+
+def test_async_followers_share_the_result_and_the_failure():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError('upstream down')
+
+    async def run():
+        results = await asyncio.gather(flight.do('key', work), flight.do('key', work),
+                                       return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
+        assert results[0] is results[1]
+        assert flight.stats() == {'calls': 1, 'coalesced': 1, 'in_flight': 0}
+
+        async def ok():
+            return 'ok'
+        assert await flight.do('key', ok) == ('ok', 1)
+
+    asyncio.run(run())
+    assert calls == [1]
+
+
+def test_async_call_is_cancelled_with_its_last_waiter():
+    flight = AsyncSingleFlight()
+    stopped = []
+
+    async def work():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            stopped.append(1)
+            raise
+
+    async def run():
+        callers = [asyncio.create_task(flight.do('key', work)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        callers[0].cancel()
+        await asyncio.sleep(0.01)
+        assert stopped == []
+        assert flight.stats()['in_flight'] == 1
+        callers[1].cancel()
+        for caller in callers:
+            with pytest.raises(asyncio.CancelledError):
+                await caller
+        await asyncio.sleep(0)
+        assert stopped == [1]
+        assert flight.stats()['in_flight'] == 0
+
+    asyncio.run(run())
@@ -0,0 +1,25 @@
+from tour import merge_tour, route_order
+
+
+def test_same_name_in_same_named_cities_stays_apart():
+    groups, ranked = merge_tour({
+        'Portland, OR': [{'name': 'The Grand', 'city': 'Portland', 'state': 'OR', 'match_score': 80}],
+        'Portland, ME': [{'name': 'The Grand', 'city': 'Portland', 'match_score': 70}],
+    })
+    assert [v['tour_city'] for v in ranked] == ['Portland, OR', 'Portland, ME']
+    assert [len(venues) for venues in groups.values()] == [1, 1]
+
+
+def test_duplicate_venue_keeps_its_best_city():
+    groups, ranked = merge_tour({
+        'Austin, TX': [{'name': 'Mohawk', 'city': 'Austin', 'match_score': 60}],
+        'Austin': [{'name': 'mohawk', 'city': 'Austin', 'state': 'Texas', 'match_score': 90}],
+    })
+    assert [(v['name'], v['tour_city']) for v in ranked] == [('mohawk', 'Austin')]
+    assert groups['Austin, TX'] == []
+
+
+def test_route_order_groups_states_from_home():
+    cities = ['Austin, TX', 'Denver, CO', 'Dallas, TX', 'Boulder, CO']
+    assert route_order(cities, 'Boulder, CO') == ['Denver, CO', 'Boulder, CO',
+                                                  'Austin, TX', 'Dallas, TX']
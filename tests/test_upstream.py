@@ -0,0 +1,38 @@
+import anthropic
+import pytest
+
+import main
+from upstream import ClientManager
+
+
+def test_checkout_counts_requests_in_use():
+    manager = ClientManager(api_key='test', max_connections=4, max_keepalive_connections=2)
+    with manager.checkout():
+        with manager.checkout():
+            assert manager.pool_stats()['in_use'] == 2
+        assert manager.pool_stats()['in_use'] == 1
+    assert manager.pool_stats() == {'max_connections': 4, 'max_keepalive_connections': 2,
+                                    'in_use': 0}
+
+
+def test_checkout_releases_on_error():
+    manager = ClientManager(api_key='test')
+    with pytest.raises(RuntimeError):
+        with manager.checkout():
+            raise RuntimeError
+    assert manager.pool_stats()['in_use'] == 0
+
+
+def test_client_is_built_once_with_sdk_types():
+    manager = ClientManager(api_key='test', base_url='http://127.0.0.1:9')
+    client = manager.get()
+    assert isinstance(client, anthropic.Anthropic)
+    assert manager.get() is client
+    manager.close()
+
+
+def test_pool_metrics_export_only_measured_state():
+    text = main.metrics.render()
+    assert 'venue_agent_pool_connections_in_use ' in text
+    assert 'venue_agent_pool_connections_limit{limit="max"}' in text
+    assert 'state="idle"' not in text
@@ -0,0 +1,86 @@
+import pytest
+
+from validation import InputValidator, Invalid, estimate_tokens, number, shorten
+
+PROFILE = {'name': 'Artist', 'genre': 'indie rock', 'drawSize': '200-400'}
+
+
+def rejected(call, *args):
+    with pytest.raises(Invalid) as info:
+        call(*args)
+    return info.value
+
+
+def test_discover_normalizes_text():
+    profile, city = InputValidator().discover({
+        'profile': dict(PROFILE, name='  The\tBand\x00 ', similarArtists=['A', 'B']),
+        'targetCity': 'Austin,  TX'})
+    assert profile['name'] == 'The Band'
+    assert profile['similarArtists'] == 'A, B'
+    assert city == 'Austin, TX'
+
+
+def test_missing_and_mistyped_fields():
+    validator = InputValidator()
+    e = rejected(validator.discover, {'profile': {'genre': 'rock', 'drawSize': '100'},
+                                      'targetCity': 'Austin'})
+    assert (e.field, e.reason) == ('profile.name', 'missing')
+    e = rejected(validator.discover, {'profile': PROFILE, 'targetCity': {'city': 'Austin'}})
+    assert (e.field, e.reason) == ('targetCity', 'type')
+    e = rejected(validator.discover, ['not', 'an', 'object'])
+    assert e.reason == 'type'
+
+
+def test_research_venue_needs_only_name_and_city():
+    venue, _ = InputValidator().research({
+        'venue': {'name': 'Mohawk', 'city': 'Austin', 'capacity': '1,200', 'match_score': 140},
+        'profile': PROFILE})
+    assert venue == {'name': 'Mohawk', 'city': 'Austin', 'capacity': 1200, 'match_score': 100}
+
+
+def test_too_long_text_is_cut_or_refused():
+    long_genre = 'rock, ' * 40
+    profile, _ = InputValidator().discover({'profile': dict(PROFILE, genre=long_genre),
+                                            'targetCity': 'Austin'})
+    assert len(profile['genre']) <= 80
+    assert not profile['genre'].endswith(',')
+    e = rejected(InputValidator(overflow='reject').discover,
+                 {'profile': dict(PROFILE, genre=long_genre), 'targetCity': 'Austin'})
+    assert (e.field, e.reason) == ('profile.genre', 'too_long')
+    assert e.tokens > 0
+
+
+def test_over_budget_trims_optional_fields_first():
+    body = {'profile': dict(PROFILE, similarArtists='Band ' * 60), 'targetCity': 'Austin'}
+    profile, _ = InputValidator(token_budget=40).discover(body)
+    assert estimate_tokens(' '.join(profile.values())) + estimate_tokens('Austin') <= 40
+    assert profile['name'] == PROFILE['name']
+    e = rejected(InputValidator(token_budget=40, overflow='reject').discover, body)
+    assert e.reason == 'over_budget'
+
+
+def test_tour_cities():
+    validator = InputValidator()
+    _, cities = validator.tour({'profile': PROFILE, 'cities': ['Austin', ' ', 'Denver']}, 5)
+    assert cities == ['Austin', 'Denver']
+    e = rejected(validator.tour, {'profile': PROFILE, 'cities': ['A', 'B', 'C']}, 2)
+    assert (e.field, e.reason) == ('cities', 'too_long')
+    e = rejected(validator.tour, {'profile': PROFILE, 'cities': 'Austin'}, 5)
+    assert (e.field, e.reason) == ('cities', 'type')
+
+
+def test_stats_count_outcomes():
+    validator = InputValidator()
+    validator.research({'venue': {'name': 'A', 'city': 'X'}, 'profile': PROFILE})
+    rejected(validator.research, {'venue': {'name': 'A'}, 'profile': PROFILE})
+    outcomes = validator.stats()['calls']['research']['outcomes']
+    assert outcomes == {'accepted': 1, 'missing': 1}
+
+
+def test_helpers():
+    assert number('1,200') == 1200
+    assert number(True) is None
+    assert number('about 300') is None
+    assert shorten('one two three', 9) == 'one two'
+    assert estimate_tokens('') == 0
+    assert estimate_tokens('abcdef 123') == 2
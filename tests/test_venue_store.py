@@ -0,0 +1,79 @@
+import pytest
+
+from venue_store import VenueStore, normalize_state, state_part, venue_place
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = VenueStore(str(tmp_path / 'venues.db'))
+    yield store
+    store.close()
+
+
+def names(venues):
+    return sorted(v['name'] for v in venues)
+
+
+def test_query_by_city(store):
+    store.upsert([{'name': 'Mohawk', 'city': 'Austin', 'state': 'TX', 'capacity': 900},
+                  {'name': 'Ogden', 'city': 'Denver', 'state': 'CO'}], 'indie rock')
+    venues = store.query('Austin, TX')
+    assert venues == [{'name': 'Mohawk', 'city': 'Austin', 'state': 'TX', 'capacity': 900,
+                       'match_score': 70}]
+    assert names(store.query('austin')) == ['Mohawk']
+
+
+def test_state_keeps_same_named_cities_apart(store):
+    store.upsert([{'name': 'Doug Fir', 'city': 'Portland', 'state': 'OR'},
+                  {'name': 'Port City Music Hall', 'city': 'Portland', 'state': 'ME'}])
+    assert names(store.query('Portland, OR')) == ['Doug Fir']
+    assert names(store.query('Portland, Maine')) == ['Port City Music Hall']
+    assert names(store.query('Portland')) == ['Doug Fir', 'Port City Music Hall']
+    assert store.coverage('Portland, OR')['venues'] == 1
+
+
+def test_dedup_key_includes_state(store):
+    store.upsert([{'name': 'The Grand', 'city': 'Portland', 'state': 'OR', 'capacity': 500}])
+    store.upsert([{'name': 'the grand', 'city': 'Portland', 'state': 'Oregon', 'type': 'Hall'}])
+    store.upsert([{'name': 'The Grand', 'city': 'Portland', 'state': 'ME'}])
+    assert store.stats()['venues'] == 2
+    [oregon] = store.query('Portland, OR')
+    assert oregon['capacity'] == 500
+    assert oregon['type'] == 'Hall'
+
+
+def test_venue_without_state_takes_the_target_state(store):
+    store.upsert([{'name': 'Doug Fir', 'city': 'Portland'},
+                  {'name': 'Elsewhere', 'city': 'Salem'}], target_city='Portland, OR')
+    assert names(store.query('Portland, OR')) == ['Doug Fir']
+    assert store.query('Salem, OR') == []
+    assert names(store.query('Salem')) == ['Elsewhere']
+
+
+def test_genre_and_capacity_filters(store):
+    store.upsert([{'name': 'Rock Room', 'city': 'Austin', 'capacity': 300},
+                  {'name': 'Big Rock', 'city': 'Austin', 'capacity': 3000}], 'rock')
+    store.upsert([{'name': 'Jazz Club', 'city': 'Austin', 'capacity': 200}], 'jazz')
+    assert names(store.query('Austin', genre='rock')) == ['Big Rock', 'Rock Room']
+    assert names(store.query('Austin', genre='rock', max_capacity=1000)) == ['Rock Room']
+    assert names(store.query('Austin', min_capacity=250)) == ['Big Rock', 'Rock Room']
+
+
+def test_candidates_need_enough_venues(tmp_path):
+    store = VenueStore(str(tmp_path / 'venues.db'), min_venues=2)
+    profile = {'genre': 'rock', 'drawSize': '100-200'}
+    store.upsert([{'name': 'One', 'city': 'Austin', 'capacity': 150}], 'rock', 'Austin, TX')
+    assert store.candidates(profile, 'Austin, TX') is None
+    store.upsert([{'name': 'Two', 'city': 'Austin', 'capacity': 200}], 'rock', 'Austin, TX')
+    assert names(store.candidates(profile, 'Austin, TX')) == ['One', 'Two']
+    store.close()
+
+
+def test_place_helpers():
+    assert normalize_state('Oregon') == 'or'
+    assert normalize_state('D.C.') == 'dc'
+    assert state_part('Portland, OR') == 'or'
+    assert state_part('Portland') == ''
+    assert venue_place({'city': 'Portland, ME'}) == ('portland', 'me')
+    assert venue_place({'city': 'Portland'}, 'Portland, OR') == ('portland', 'or')
+    assert venue_place({'city': 'Salem'}, 'Portland, OR') == ('salem', '')
@@ -0,0 +1,73 @@
+"""
+Discovery tiers
+Model, output budget and web search cap for each stage of discovery:
+the full single pass, the fast candidate pass and per-venue enrichment
+"""
+
+import os
+
+WEB_SEARCH_TYPE = "web_search_20250305"
+
+
+class Tier:
+    """Upstream settings for one discovery stage
+
+    web_searches caps the web search tool: None leaves it uncapped and 0
+    leaves the tool out entirely.
+    """
+
+    def __init__(self, name, model, max_tokens, web_searches=None):
+        self.name = name
+        self.model = model
+        self.max_tokens = max_tokens
+        self.web_searches = web_searches
+
+    @classmethod
+    def from_env(cls, name, model, max_tokens, web_searches=None):
+        """Defaults overridden by DISCOVER_<NAME>_MODEL, _MAX_TOKENS and _WEB_SEARCHES
+
+        An empty _WEB_SEARCHES means uncapped.
+        """
+        prefix = f"DISCOVER_{name.upper()}_"
+        env = os.environ
+        searches = env.get(prefix + "WEB_SEARCHES")
+        if searches is None:
+            searches = web_searches
+        else:
+            searches = int(searches) if searches.strip() else None
+        return cls(
+            name,
+            model=env.get(prefix + "MODEL", model),
+            max_tokens=int(env.get(prefix + "MAX_TOKENS", max_tokens)),
+            web_searches=searches,
+        )
+
+    def tools(self, *extra):
+        """Tool list for this tier: web search (if allowed) then extra"""
+        if self.web_searches == 0:
+            return list(extra)
+        search = {"type": WEB_SEARCH_TYPE, "name": "web_search"}
+        if self.web_searches is not None:
+            search["max_uses"] = self.web_searches
+        return [search, *extra]
+
+    def request(self, system, prompt, *tools, **extra):
+        """messages.create arguments for one call at this tier"""
+        kwargs = dict(
+            model=self.model,
+            max_tokens=self.max_tokens,
+            system=system,
+            messages=[{"role": "user", "content": prompt}],
+            **extra,
+        )
+        tools = self.tools(*tools)
+        if tools:
+            kwargs['tools'] = tools
+        return kwargs
+
+    def stats(self):
+        return {
+            'model': self.model,
+            'max_tokens': self.max_tokens,
+            'web_searches': self.web_searches,
+        }
@@ -0,0 +1,173 @@
+"""
+Request timing
+Per-phase spans for Server-Timing headers and structured log lines, plus an
+opt-in sampling profiler that writes collapsed stacks for flamegraphs
+"""
+
+import contextvars
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+_current = contextvars.ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """Spans recorded while handling one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = []
+
+    def add(self, name, seconds):
+        self.spans.append((name, seconds))
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def totals(self):
+        """Seconds per span name; repeated phases are summed"""
+        merged = {}
+        for name, seconds in self.spans:
+            merged[name] = merged.get(name, 0.0) + seconds
+        return merged
+
+    def server_timing(self):
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.totals().items()]
+        parts.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(parts)
+
+    def log_record(self, **fields):
+        """One JSON log line with every span in milliseconds"""
+        return json.dumps({
+            **fields,
+            'duration_ms': round(self.elapsed() * 1000, 1),
+            'spans_ms': {name: round(s * 1000, 1) for name, s in self.totals().items()},
+        })
+
+
+def begin():
+    """Start collecting spans for the request on this thread"""
+    timings = RequestTimings()
+    _current.set(timings)
+    return timings
+
+
+def current():
+    """Timings for the request on this thread, or None"""
+    return _current.get()
+
+
+def end():
+    _current.set(None)
+
+
+@contextmanager
+def span(name):
+    """Time a phase of the current request; a no-op outside one"""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started)
+
+
+def collapse(frame):
+    """Root-first 'func (file:line);...' string for one stack"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler:
+    """Samples one thread's stack on a timer and counts collapsed stacks"""
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name='profiler')
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.counts[collapse(frame)] += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.counts
+
+
+class Profiler:
+    """Decides which requests to sample and writes their collapsed stacks
+
+    A request is profiled when it sends the configured token in the
+    X-Profile header, or when it falls within the global sample rate.
+    Output files are in the collapsed format read by flamegraph.pl and
+    speedscope.
+    """
+
+    def __init__(self, sample_rate=0.0, token=None, directory='profiles', interval=0.005):
+        self.sample_rate = sample_rate
+        self.token = token
+        self.directory = directory
+        self.interval = interval
+        self.written = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        env = os.environ
+        return cls(
+            sample_rate=float(env.get('PROFILE_SAMPLE_RATE', 0)),
+            token=env.get('PROFILE_TOKEN') or None,
+            directory=env.get('PROFILE_DIR', 'profiles'),
+            interval=float(env.get('PROFILE_INTERVAL', 0.005)),
+        )
+
+    def should_profile(self, headers):
+        if self.token is not None and headers.get('X-Profile') == self.token:
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start(self):
+        """Begin sampling the calling thread"""
+        return StackSampler(threading.get_ident(), self.interval).start()
+
+    def finish(self, sampler, label):
+        """Stop a sampler and write its stacks; returns the file path"""
+        counts = sampler.stop()
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{label}-{id(sampler):x}.folded")
+        with open(path, 'w') as f:
+            for stack, count in counts.most_common():
+                f.write(f"{stack} {count}\n")
+        with self._lock:
+            self.written += 1
+        return path
+
+    def stats(self):
+        return {
+            'sample_rate': self.sample_rate,
+            'header_enabled': self.token is not None,
+            'profiles_written': self.written,
+        }
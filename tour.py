@@ -0,0 +1,67 @@
+"""
+Tour planning helpers
+City ordering and merging of per-city discovery results
+"""
+
+from cache import normalize_text
+from venue_store import venue_place
+
+
+def city_state(city):
+    """State part of a 'City, ST' string, if any"""
+    if ',' not in city:
+        return ''
+    return normalize_text(city.rsplit(',', 1)[1])
+
+
+def route_order(cities, home_base=None):
+    """Order cities so each state is visited in one leg, home state first
+
+    There is no geocoder here, so this is a coarse stand-in for a real
+    route: cities keep their given order within a state, and states are
+    visited in order of first appearance after the home base's state.
+    """
+    home_state = city_state(home_base or '')
+    states = []
+    for city in cities:
+        state = city_state(city)
+        if state not in states:
+            states.append(state)
+    if home_state in states:
+        states.remove(home_state)
+        states.insert(0, home_state)
+    return [city for state in states for city in cities if city_state(city) == state]
+
+
+def venue_identity(venue, target_city=None):
+    """Name, city and state, the venue store's key: Portland, OR is not Portland, ME"""
+    return (normalize_text(venue.get('name')), *venue_place(venue, target_city))
+
+
+def merge_tour(results):
+    """Dedupe venues across cities and rank them by match_score
+
+    results maps each target city to its venue list. Returns the per-city
+    groups (each ranked) and one overall ranking tagged with tour_city.
+    """
+    best = {}
+    for target_city, venues in results.items():
+        for venue in venues:
+            key = venue_identity(venue, target_city)
+            current = best.get(key)
+            if current is None or venue.get('match_score', 0) > current[1].get('match_score', 0):
+                best[key] = (target_city, venue)
+
+    groups = {city: [] for city in results}
+    ranked = []
+    for target_city, venue in best.values():
+        groups[target_city].append(venue)
+        ranked.append(dict(venue, tour_city=target_city))
+
+    def score(venue):
+        return -venue.get('match_score', 0)
+
+    for venues in groups.values():
+        venues.sort(key=score)
+    ranked.sort(key=score)
+    return groups, ranked
@@ -0,0 +1,209 @@
+"""
+Upstream Anthropic client
+One pooled, thread-safe client shared by every waitress thread
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+
+import anthropic
+
+# The SDK's own HTTP types: older releases build on httpx, newer ones on
+# its successor, and each refuses the other's objects
+Limits = type(anthropic.DEFAULT_CONNECTION_LIMITS)
+
+
+class ClientManager:
+    """Owns the process-wide Anthropic client and its connection pool"""
+
+    def __init__(self, api_key=None, base_url=None, max_connections=20,
+                 max_keepalive_connections=10, keepalive_expiry=30.0,
+                 connect_timeout=10.0, read_timeout=300.0, max_retries=0):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self._client = None
+        self._lock = threading.Lock()
+        self._in_use = 0
+
+    @classmethod
+    def from_env(cls):
+        """Build a manager from ANTHROPIC_* environment variables"""
+        env = os.environ
+        return cls(
+            api_key=env.get("ANTHROPIC_API_KEY"),
+            base_url=env.get("ANTHROPIC_BASE_URL") or None,
+            max_connections=int(env.get("ANTHROPIC_POOL_SIZE", 20)),
+            max_keepalive_connections=int(env.get("ANTHROPIC_POOL_KEEPALIVE", 10)),
+            keepalive_expiry=float(env.get("ANTHROPIC_KEEPALIVE_EXPIRY", 30)),
+            connect_timeout=float(env.get("ANTHROPIC_CONNECT_TIMEOUT", 10)),
+            read_timeout=float(env.get("ANTHROPIC_READ_TIMEOUT", 300)),
+            # Retries are scheduled by ratelimit.RateLimiter by default
+            max_retries=int(env.get("ANTHROPIC_MAX_RETRIES", 0)),
+        )
+
+    def get(self):
+        """Return the shared client, creating it on first use"""
+        client = self._client
+        if client is not None:
+            return client
+        with self._lock:
+            if self._client is None:
+                self._client = self._build()
+            return self._client
+
+    def _limits(self):
+        return Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def _timeout(self):
+        return anthropic.Timeout(self.read_timeout, connect=self.connect_timeout)
+
+    def _build(self):
+        if not self.api_key:
+            raise ValueError("ANTHROPIC_API_KEY environment variable not set")
+        return anthropic.Anthropic(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            max_retries=self.max_retries,
+            timeout=self._timeout(),
+            http_client=anthropic.DefaultHttpxClient(limits=self._limits()),
+        )
+
+    @contextmanager
+    def checkout(self):
+        """Count one upstream request as holding a pooled connection"""
+        with self._lock:
+            self._in_use += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_use -= 1
+
+    def pool_stats(self):
+        """Configured pool limits and the requests counted by checkout()
+
+        The HTTP library has no public pool stats, so idle and open
+        connections are not reported.
+        """
+        with self._lock:
+            return {
+                'max_connections': self.max_connections,
+                'max_keepalive_connections': self.max_keepalive_connections,
+                'in_use': self._in_use,
+            }
+
+    def close(self):
+        """Close the pooled client"""
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+
+class AsyncClientManager(ClientManager):
+    """AsyncAnthropic twin for the ASGI server
+
+    Waiting connections cost no thread there, so the pool is sized for
+    hundreds of concurrent calls.
+    """
+
+    @classmethod
+    def from_env(cls):
+        manager = super().from_env()
+        env = os.environ
+        manager.max_connections = int(env.get("ANTHROPIC_ASYNC_POOL_SIZE", 500))
+        manager.max_keepalive_connections = int(env.get("ANTHROPIC_ASYNC_POOL_KEEPALIVE", 100))
+        return manager
+
+    def _build(self):
+        if not self.api_key:
+            raise ValueError("ANTHROPIC_API_KEY environment variable not set")
+        return anthropic.AsyncAnthropic(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            max_retries=self.max_retries,
+            timeout=self._timeout(),
+            http_client=anthropic.DefaultAsyncHttpxClient(limits=self._limits()),
+        )
+
+    async def aclose(self):
+        """Close the pooled client"""
+        client, self._client = self._client, None
+        if client is not None:
+            await client.close()
+
+
+class UsageTracker:
+    """Per-call token accounting, including prompt cache reads and writes"""
+
+    FIELDS = ('input_tokens', 'output_tokens', 'cache_read_input_tokens',
+              'cache_creation_input_tokens', 'web_search_requests')
+
+    def __init__(self):
+        self._totals = {}
+        # label -> (calls, output tokens) over calls that ran to the end
+        self._finished = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def extract(usage):
+        """Flatten an SDK usage object into plain counts"""
+        counts = {
+            name: getattr(usage, name, None) or 0
+            for name in UsageTracker.FIELDS[:4]
+        }
+        server_tools = getattr(usage, 'server_tool_use', None)
+        counts['web_search_requests'] = getattr(server_tools, 'web_search_requests', None) or 0
+        return counts
+
+    def _label(self, label):
+        return self._totals.setdefault(
+            label, dict.fromkeys(('calls',) + self.FIELDS + ('cancelled', 'tokens_saved'), 0))
+
+    def record(self, label, usage, finished=True):
+        """Add one call's usage under label and return its counts
+
+        finished=False marks a call cut short, which is still billed but
+        left out of the expected output used by record_cancelled.
+        """
+        counts = self.extract(usage)
+        with self._lock:
+            totals = self._label(label)
+            totals['calls'] += 1
+            for name, value in counts.items():
+                totals[name] += value
+            if finished:
+                calls, output = self._finished.get(label, (0, 0))
+                self._finished[label] = (calls + 1, output + counts['output_tokens'])
+        return counts
+
+    def record_cancelled(self, label, produced, max_tokens, unsent_input=0):
+        """Count a call abandoned because its caller left; returns tokens saved
+
+        The output it would have produced is estimated from this label's
+        average over finished calls, or max_tokens before there are any.
+        unsent_input counts input tokens when the request was never sent.
+        """
+        with self._lock:
+            totals = self._label(label)
+            calls, output = self._finished.get(label, (0, 0))
+            expected = output / calls if calls else max_tokens
+            saved = max(0, int(expected) - produced) + unsent_input
+            totals['cancelled'] += 1
+            totals['tokens_saved'] += saved
+        return saved
+
+    def stats(self):
+        with self._lock:
+            return {label: dict(totals) for label, totals in self._totals.items()}
@@ -0,0 +1,389 @@
+"""
+Input validation
+Checks and normalizes the profile, city and venue fields a client sends
+before they are formatted into prompts, and keeps the text they add to a
+prompt under a token budget
+"""
+
+import os
+import re
+import threading
+
+CONTROL = re.compile(r'[\x00-\x1f\x7f]')
+PIECE = re.compile(r'[A-Za-z]+|\d+|\S')
+
+# field: (max characters, required, formatted into prompts)
+PROFILE_FIELDS = {
+    'name': (120, True, True),
+    'genre': (80, True, True),
+    'drawSize': (40, True, True),
+    'feeRange': (40, False, True),
+    'homeBase': (80, False, False),
+    'similarArtists': (300, False, True),
+}
+VENUE_FIELDS = {
+    'name': (160, True, True),
+    'city': (80, True, True),
+    'state': (40, False, True),
+    'type': (80, False, True),
+    'website': (300, False, True),
+    'reason': (500, False, False),
+}
+CITY_LENGTH = 80
+TYPE_LENGTH = 80
+RERANK_SORTS = ('score', 'capacity', 'match')
+# Optional prompt fields given up, in order, when a request is over budget
+TRIM_ORDER = ('similarArtists', 'feeRange', 'type')
+
+OVERFLOW = ('truncate', 'reject')
+
+
+class Invalid(ValueError):
+    """Client input that will not be sent upstream
+
+    reason is 'missing', 'type', 'too_long' or 'over_budget'; tokens is
+    the estimated prompt text the rejection kept out.
+    """
+
+    def __init__(self, field, reason, message, tokens=0):
+        super().__init__(message)
+        self.field = field
+        self.reason = reason
+        self.tokens = tokens
+
+
+def estimate_tokens(text):
+    """Rough token count without a tokenizer
+
+    Words count one token per six letters, numbers one per three digits
+    and every other character one. This runs a little high for English,
+    which is the safe side for a budget.
+    """
+    tokens = 0
+    for piece in PIECE.findall(text or ''):
+        if piece.isdigit():
+            tokens += (len(piece) + 2) // 3
+        elif piece.isalpha():
+            tokens += (len(piece) + 5) // 6
+        else:
+            tokens += 1
+    return tokens
+
+
+def clean(text):
+    """Text with control characters removed and whitespace collapsed"""
+    return ' '.join(CONTROL.sub(' ', text).split())
+
+
+def shorten(text, limit):
+    """text cut to at most limit characters, at a comma or space if one is near"""
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    for sep in (',', ' '):
+        at = cut.rfind(sep)
+        if at >= limit // 2:
+            return cut[:at].rstrip(' ,')
+    return cut
+
+
+def fit_tokens(text, tokens):
+    """text shortened until it is estimated at no more than tokens"""
+    while text and estimate_tokens(text) > tokens:
+        limit = len(text) * tokens // estimate_tokens(text)
+        text = shorten(text, min(limit, len(text) - 1))
+    return text
+
+
+class _Check:
+    """Validation state for one request body"""
+
+    def __init__(self, overflow):
+        self.overflow = overflow
+        # (dict, key) for every field that ends up in a prompt
+        self.prompt_fields = []
+        self.fixed_tokens = 0
+        self.truncated = []
+        self.tokens_cut = 0
+
+    def text(self, value, field, limit, required):
+        """Normalized text for one field, or None when optional and empty"""
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = str(value)
+        elif isinstance(value, list) and all(isinstance(v, str) for v in value):
+            value = ', '.join(value)
+        elif value is not None and not isinstance(value, str):
+            raise Invalid(field, 'type', f"{field} must be text")
+        text = clean(value or '')
+        if not text:
+            if required:
+                raise Invalid(field, 'missing', f"{field} is required")
+            return None
+        if len(text) > limit:
+            if self.overflow == 'reject':
+                raise Invalid(field, 'too_long', f"{field} is longer than {limit} characters",
+                              tokens=estimate_tokens(text))
+            short = shorten(text, limit)
+            self.tokens_cut += estimate_tokens(text) - estimate_tokens(short)
+            self.truncated.append(field)
+            text = short
+        return text
+
+    def fields(self, value, field, spec):
+        if value is None:
+            raise Invalid(field, 'missing', f"{field} is required")
+        if not isinstance(value, dict):
+            raise Invalid(field, 'type', f"{field} must be an object")
+        result = {}
+        for key, (limit, required, prompt) in spec.items():
+            text = self.text(value.get(key), f"{field}.{key}", limit, required)
+            if text is not None:
+                result[key] = text
+                if prompt:
+                    self.prompt_fields.append((result, key))
+        return result
+
+    def profile(self, value, field='profile'):
+        return self.fields(value, field, PROFILE_FIELDS)
+
+    def venue(self, value, field='venue'):
+        venue = self.fields(value, field, VENUE_FIELDS)
+        capacity = number(value.get('capacity'))
+        if capacity is not None and capacity > 0:
+            venue['capacity'] = capacity
+        score = number(value.get('match_score'))
+        if score is not None:
+            venue['match_score'] = max(0, min(100, score))
+        return venue
+
+    def city(self, value, field='targetCity'):
+        city = self.text(value, field, CITY_LENGTH, True)
+        self.fixed_tokens += estimate_tokens(city)
+        return city
+
+    def tokens(self):
+        return self.fixed_tokens + sum(
+            estimate_tokens(owner[key]) for owner, key in self.prompt_fields if key in owner)
+
+    def fit(self, budget):
+        """Trim optional fields, or refuse, until the prompt text fits budget"""
+        used = self.tokens()
+        if used <= budget:
+            return
+        if self.overflow == 'truncate':
+            for name in TRIM_ORDER:
+                for owner, key in self.prompt_fields:
+                    if key != name or key not in owner:
+                        continue
+                    before = estimate_tokens(owner[key])
+                    text = fit_tokens(owner[key], max(0, budget - (used - before)))
+                    if text:
+                        owner[key] = text
+                    else:
+                        del owner[key]
+                    after = estimate_tokens(text)
+                    used -= before - after
+                    self.tokens_cut += before - after
+                    self.truncated.append(key)
+                    if used <= budget:
+                        return
+        raise Invalid('', 'over_budget',
+                      f"Request text is about {used} tokens; the limit is {budget}",
+                      tokens=used)
+
+
+def number(value):
+    """int from a number or a string like '1,200', else None"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, str):
+        value = value.replace(',', '').strip()
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def given_number(value, field):
+    """number(value), None when absent; text that is not a number is refused"""
+    if value is None or value == '':
+        return None
+    result = number(value)
+    if result is None:
+        raise Invalid(field, 'type', f"{field} must be a number")
+    return result
+
+
+def listed_venue(value, field):
+    """A copy of one venue from a client's list, with numeric capacity and match_score
+
+    Text fields must be text when present; other keys are kept as sent.
+    """
+    if not isinstance(value, dict):
+        raise Invalid(field, 'type', f"{field} must be an object")
+    venue = dict(value)
+    for key in VENUE_FIELDS:
+        if venue.get(key) is not None and not isinstance(venue[key], str):
+            raise Invalid(f"{field}.{key}", 'type', f"{field}.{key} must be text")
+    capacity = given_number(venue.pop('capacity', None), f"{field}.capacity")
+    if capacity is not None and capacity > 0:
+        venue['capacity'] = capacity
+    score = given_number(venue.pop('match_score', None), f"{field}.match_score")
+    if score is not None:
+        venue['match_score'] = max(0, min(100, score))
+    return venue
+
+
+def listed_venues(value):
+    if not isinstance(value, list):
+        raise Invalid('venues', 'type', "venues must be a list")
+    return [listed_venue(venue, f"venues[{i}]") for i, venue in enumerate(value)]
+
+
+def rerank_options(check, value):
+    """Ranking options with known keys only, each of the type rerank() expects"""
+    if value is None:
+        return {}
+    if not isinstance(value, dict):
+        raise Invalid('options', 'type', "options must be an object")
+    options = {}
+    sort = value.get('sort')
+    if sort is not None:
+        if sort not in RERANK_SORTS:
+            raise Invalid('options.sort', 'type',
+                          f"options.sort must be one of {', '.join(RERANK_SORTS)}")
+        options['sort'] = sort
+    hide_unfit = value.get('hide_unfit')
+    if hide_unfit is not None:
+        if not isinstance(hide_unfit, bool):
+            raise Invalid('options.hide_unfit', 'type', "options.hide_unfit must be true or false")
+        options['hide_unfit'] = hide_unfit
+    types = value.get('types')
+    if isinstance(types, str):
+        types = [types]
+    if types is not None:
+        if not isinstance(types, list):
+            raise Invalid('options.types', 'type', "options.types must be a list")
+        options['types'] = [t for t in (check.text(t, 'options.types', TYPE_LENGTH, False)
+                                        for t in types) if t]
+    for key in ('min_capacity', 'max_capacity'):
+        bound = given_number(value.get(key), f"options.{key}")
+        if bound is not None:
+            options[key] = bound
+    return options
+
+
+class InputValidator:
+    """Normalizes request input and enforces field limits and a token budget
+
+    overflow decides what happens to text over a limit: 'truncate' cuts it
+    down, 'reject' refuses the request. Missing or mistyped required fields
+    are always refused. The budget covers the client's text in one
+    upstream prompt; the fixed instructions around it are not counted.
+    """
+
+    def __init__(self, token_budget=250, overflow='truncate'):
+        if overflow not in OVERFLOW:
+            raise ValueError(f"overflow must be one of {', '.join(OVERFLOW)}")
+        self.token_budget = token_budget
+        self.overflow = overflow
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Build a validator from INPUT_TOKEN_BUDGET and INPUT_OVERFLOW"""
+        env = os.environ
+        return cls(
+            token_budget=int(env.get('INPUT_TOKEN_BUDGET', 250)),
+            overflow=env.get('INPUT_OVERFLOW', 'truncate'),
+        )
+
+    def discover(self, data, call='discover'):
+        """(profile, target city) from a discovery request body"""
+        return self._check(call, data, lambda check: (
+            check.profile(data.get('profile')), check.city(data.get('targetCity'))))
+
+    def research(self, data, call='research'):
+        """(venue, profile) from a research request body"""
+        return self._check(call, data, lambda check: (
+            check.venue(data.get('venue')), check.profile(data.get('profile'))))
+
+    def tour(self, data, max_cities, call='tour'):
+        """(profile, cities) from a tour request body
+
+        Each city gets its own discovery call, so the budget is checked
+        against the profile plus the longest city.
+        """
+        def read(check):
+            profile = check.profile(data.get('profile'))
+            cities = data.get('cities')
+            if not isinstance(cities, list):
+                raise Invalid('cities', 'type', "cities must be a list")
+            if len(cities) > max_cities:
+                raise Invalid('cities', 'too_long',
+                              f"A tour can have at most {max_cities} cities")
+            cities = [check.text(city, 'cities', CITY_LENGTH, False) for city in cities]
+            cities = [city for city in cities if city]
+            if not cities:
+                raise Invalid('cities', 'missing', "At least one city is required")
+            check.fixed_tokens += max(estimate_tokens(city) for city in cities)
+            return profile, cities
+        return self._check(call, data, read)
+
+    def rerank(self, data, call='rerank'):
+        """(venues, profile, options) from a rerank request body
+
+        Nothing here reaches a prompt, so venues keep their other fields;
+        capacity and match_score must be numbers, as in venue().
+        """
+        def read(check):
+            venues = listed_venues(data.get('venues'))
+            profile = data.get('profile') or {}
+            if not isinstance(profile, dict):
+                raise Invalid('profile', 'type', "profile must be an object")
+            fields = {}
+            for key in ('drawSize', 'feeRange'):
+                text = check.text(profile.get(key), f"profile.{key}", PROFILE_FIELDS[key][0], False)
+                if text is not None:
+                    fields[key] = text
+            return venues, fields, rerank_options(check, data.get('options'))
+        return self._check(call, data, read)
+
+    def export(self, data, call='export'):
+        """Venues from a session export body, all checked before any row is sent"""
+        return self._check(call, data, lambda check: listed_venues(data.get('venues')))
+
+    def profile(self, data, call):
+        """Profile from a request body that carries only a profile"""
+        return self._check(call, data, lambda check: check.profile(data.get('profile')))
+
+    def _check(self, call, data, read):
+        check = _Check(self.overflow)
+        try:
+            if not isinstance(data, dict):
+                raise Invalid('', 'type', "Body must be a JSON object")
+            result = read(check)
+            check.fit(self.token_budget)
+        except Invalid as e:
+            self._count(call, e.reason, e.tokens)
+            raise
+        self._count(call, 'truncated' if check.truncated else 'accepted', check.tokens_cut)
+        return result
+
+    def _count(self, call, outcome, tokens):
+        with self._lock:
+            counts = self._calls.setdefault(call, {'outcomes': {}, 'tokens_avoided': 0})
+            counts['outcomes'][outcome] = counts['outcomes'].get(outcome, 0) + 1
+            counts['tokens_avoided'] += tokens
+
+    def stats(self):
+        with self._lock:
+            return {
+                'token_budget': self.token_budget,
+                'overflow': self.overflow,
+                'calls': {
+                    call: {'outcomes': dict(c['outcomes']), 'tokens_avoided': c['tokens_avoided']}
+                    for call, c in self._calls.items()
+                },
+            }
@@ -0,0 +1,359 @@
+"""
+Local venue store
+SQLite table of every discovered venue, with a full-text index so common
+queries can be answered without an upstream call
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from cache import normalize_text
+
+NUMBER = re.compile(r'\d[\d,]*')
+TOKEN = re.compile(r'\w+')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS venues (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    city TEXT NOT NULL,
+    state TEXT,
+    city_norm TEXT NOT NULL,
+    state_norm TEXT,
+    capacity INTEGER,
+    type TEXT,
+    website TEXT,
+    match_score INTEGER,
+    reason TEXT,
+    genres TEXT NOT NULL DEFAULT '',
+    discovered_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS venues_city ON venues (city_norm, updated_at);
+CREATE INDEX IF NOT EXISTS venues_state ON venues (state_norm);
+CREATE INDEX IF NOT EXISTS venues_capacity ON venues (capacity);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS venues_fts USING fts5(
+    name, type, reason, genres, content='venues', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS venues_ai AFTER INSERT ON venues BEGIN
+    INSERT INTO venues_fts (rowid, name, type, reason, genres)
+    VALUES (new.id, new.name, new.type, new.reason, new.genres);
+END;
+CREATE TRIGGER IF NOT EXISTS venues_au AFTER UPDATE ON venues BEGIN
+    INSERT INTO venues_fts (venues_fts, rowid, name, type, reason, genres)
+    VALUES ('delete', old.id, old.name, old.type, old.reason, old.genres);
+    INSERT INTO venues_fts (rowid, name, type, reason, genres)
+    VALUES (new.id, new.name, new.type, new.reason, new.genres);
+END;
+"""
+
+UPSERT = """
+INSERT INTO venues (key, name, city, state, city_norm, state_norm, capacity,
+                    type, website, match_score, reason, genres,
+                    discovered_at, updated_at)
+VALUES (:key, :name, :city, :state, :city_norm, :state_norm, :capacity,
+        :type, :website, :match_score, :reason, :genres, :now, :now)
+ON CONFLICT (key) DO UPDATE SET
+    state = COALESCE(excluded.state, state),
+    state_norm = COALESCE(excluded.state_norm, state_norm),
+    capacity = COALESCE(excluded.capacity, capacity),
+    type = COALESCE(excluded.type, type),
+    website = COALESCE(excluded.website, website),
+    match_score = COALESCE(excluded.match_score, match_score),
+    reason = COALESCE(excluded.reason, reason),
+    genres = CASE
+        WHEN excluded.genres = '' OR instr(' ' || genres || ' ', ' ' || excluded.genres || ' ')
+        THEN genres ELSE trim(genres || ' ' || excluded.genres) END,
+    updated_at = excluded.updated_at
+"""
+
+COLUMNS = ('name', 'city', 'state', 'capacity', 'type', 'website',
+           'match_score', 'reason')
+# Rows written before state was part of the key are re-keyed on open
+SCHEMA_VERSION = 1
+
+# Full state names -> postal codes, so 'Oregon' and 'OR' match
+STATE_CODES = {
+    'alabama': 'al', 'alaska': 'ak', 'arizona': 'az', 'arkansas': 'ar',
+    'california': 'ca', 'colorado': 'co', 'connecticut': 'ct', 'delaware': 'de',
+    'district of columbia': 'dc', 'washington dc': 'dc', 'florida': 'fl',
+    'georgia': 'ga', 'hawaii': 'hi', 'idaho': 'id', 'illinois': 'il',
+    'indiana': 'in', 'iowa': 'ia', 'kansas': 'ks', 'kentucky': 'ky',
+    'louisiana': 'la', 'maine': 'me', 'maryland': 'md', 'massachusetts': 'ma',
+    'michigan': 'mi', 'minnesota': 'mn', 'mississippi': 'ms', 'missouri': 'mo',
+    'montana': 'mt', 'nebraska': 'ne', 'nevada': 'nv', 'new hampshire': 'nh',
+    'new jersey': 'nj', 'new mexico': 'nm', 'new york': 'ny',
+    'north carolina': 'nc', 'north dakota': 'nd', 'ohio': 'oh', 'oklahoma': 'ok',
+    'oregon': 'or', 'pennsylvania': 'pa', 'rhode island': 'ri',
+    'south carolina': 'sc', 'south dakota': 'sd', 'tennessee': 'tn', 'texas': 'tx',
+    'utah': 'ut', 'vermont': 'vt', 'virginia': 'va', 'washington': 'wa',
+    'west virginia': 'wv', 'wisconsin': 'wi', 'wyoming': 'wy',
+}
+
+
+def city_part(target_city):
+    """City name without the trailing ', ST'"""
+    return normalize_text(target_city.split(',', 1)[0])
+
+
+def normalize_state(state):
+    """Lowercase postal code for a US state name or code; other text as is"""
+    state = normalize_text(state).replace('.', '')
+    return STATE_CODES.get(state, state)
+
+
+def state_part(target_city):
+    """Normalized state from a 'City, ST' string, or '' when there is none"""
+    parts = target_city.split(',')
+    return normalize_state(parts[1]) if len(parts) > 1 else ''
+
+
+def venue_place(venue, target_city=None):
+    """(city, state) of a venue, normalized
+
+    The state comes from the venue's state field, else its city string,
+    else the target city when the venue is in it.
+    """
+    city = venue.get('city') or ''
+    city_norm = city_part(city)
+    state = normalize_state(venue.get('state')) or state_part(city)
+    if not state and target_city and city_part(target_city) == city_norm:
+        state = state_part(target_city)
+    return city_norm, state
+
+
+def venue_key(name_norm, city_norm, state_norm):
+    """Dedup key: the same name in a same-named city of another state is another venue"""
+    return f"{name_norm}|{city_norm}|{state_norm}"
+
+
+def draw_range(draw_size):
+    """(low, high) audience numbers from a string like '200-400'"""
+    numbers = [int(n.replace(',', '')) for n in NUMBER.findall(draw_size or '')]
+    if not numbers:
+        return None, None
+    return min(numbers), max(numbers)
+
+
+def fts_query(text):
+    """OR of quoted tokens, safe to pass to MATCH"""
+    tokens = TOKEN.findall((text or '').lower())
+    return ' OR '.join(f'"{t}"' for t in tokens)
+
+
+class VenueStore:
+    """Upserts discovered venues and serves candidate queries from SQLite"""
+
+    def __init__(self, path, min_venues=8, max_age=14 * 86400):
+        self.path = path
+        self.min_venues = min_venues
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        try:
+            self._conn.executescript(FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5: fall back to LIKE matching
+            self.fts = False
+        self._conn.commit()
+        self.fast_path_hits = 0
+        self.fast_path_misses = 0
+
+    @classmethod
+    def from_env(cls):
+        """Build a store from VENUE_STORE_* variables; None when disabled"""
+        env = os.environ
+        path = env.get('VENUE_STORE_DB', 'venues.db')
+        if not path:
+            return None
+        return cls(
+            path,
+            min_venues=int(env.get('VENUE_STORE_MIN_VENUES', 8)),
+            max_age=float(env.get('VENUE_STORE_MAX_AGE', 14 * 86400)),
+        )
+
+    def _migrate(self):
+        """Re-key rows stored under name + city alone"""
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        rows = self._conn.execute("SELECT id, name, city, state FROM venues").fetchall()
+        for row in rows:
+            city_norm, state_norm = venue_place(dict(row))
+            self._conn.execute(
+                "UPDATE venues SET key = ?, state_norm = ? WHERE id = ?",
+                (venue_key(normalize_text(row['name']), city_norm, state_norm),
+                 state_norm or None, row['id']))
+        self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self._conn.commit()
+
+    def upsert(self, venues, genre=None, target_city=None):
+        """Insert or merge venues, deduplicated on normalized name, city and state
+
+        Venues without a state in target_city's city take its state.
+        """
+        now = time.time()
+        genre = ' '.join(TOKEN.findall((genre or '').lower()))
+        rows = []
+        for venue in venues:
+            city_norm, state_norm = venue_place(venue, target_city)
+            name_norm = normalize_text(venue.get('name'))
+            if not name_norm or not city_norm:
+                continue
+            rows.append({
+                'key': venue_key(name_norm, city_norm, state_norm),
+                'name': venue['name'],
+                'city': venue['city'],
+                'state': venue.get('state'),
+                'city_norm': city_norm,
+                'state_norm': state_norm or None,
+                'capacity': venue.get('capacity'),
+                'type': venue.get('type'),
+                'website': venue.get('website'),
+                'match_score': venue.get('match_score'),
+                'reason': venue.get('reason'),
+                'genres': genre,
+                'now': now,
+            })
+        with self._lock:
+            self._conn.executemany(UPSERT, rows)
+            self._conn.commit()
+        return len(rows)
+
+    def query(self, city, genre=None, min_capacity=None, max_capacity=None,
+              max_age=None, limit=30):
+        """Candidate venues for a city, best text match and score first
+
+        A 'City, ST' target only matches venues known to be in that state.
+        """
+        sql = ["SELECT v.* FROM venues v"]
+        where, params = self._place_filter(city, 'v.')
+        order = "v.match_score DESC"
+        match = fts_query(genre)
+        if match and self.fts:
+            sql.append("JOIN venues_fts f ON f.rowid = v.id")
+            where.append("venues_fts MATCH ?")
+            params.append(match)
+            order = "bm25(venues_fts), v.match_score DESC"
+        elif match:
+            like = ["(v.genres || ' ' || coalesce(v.type, '') || ' ' || coalesce(v.reason, '')) LIKE ?"
+                    for _ in TOKEN.findall(genre.lower())]
+            where.append("(" + " OR ".join(like) + ")")
+            params.extend(f"%{t}%" for t in TOKEN.findall(genre.lower()))
+        if min_capacity is not None:
+            where.append("(v.capacity IS NULL OR v.capacity >= ?)")
+            params.append(min_capacity)
+        if max_capacity is not None:
+            where.append("(v.capacity IS NULL OR v.capacity <= ?)")
+            params.append(max_capacity)
+        if max_age is not None:
+            where.append("v.updated_at >= ?")
+            params.append(time.time() - max_age)
+        sql.append("WHERE " + " AND ".join(where))
+        sql.append(f"ORDER BY {order} LIMIT ?")
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(" ".join(sql), params).fetchall()
+        return [self._venue(row) for row in rows]
+
+    def candidates(self, profile, target_city):
+        """Venues to serve instead of an upstream call, or None if too thin"""
+        low, high = draw_range(profile.get('drawSize'))
+        venues = self.query(
+            target_city,
+            genre=profile.get('genre'),
+            min_capacity=low,
+            max_capacity=high * 5 if high else None,
+            max_age=self.max_age,
+        )
+        with self._lock:
+            if len(venues) < self.min_venues:
+                self.fast_path_misses += 1
+                return None
+            self.fast_path_hits += 1
+        return venues
+
+    def iter_venues(self, cities=None, batch=500):
+        """Yield every stored venue, or those in cities, in batches
+
+        Reads on a connection of its own, so a long export sees one
+        consistent snapshot and never holds the lock writers need.
+        """
+        sql = "SELECT * FROM venues"
+        params = []
+        if cities:
+            clauses = []
+            for city in cities:
+                where, place = self._place_filter(city)
+                clauses.append("(" + " AND ".join(where) + ")")
+                params.extend(place)
+            sql += " WHERE " + " OR ".join(clauses)
+        sql += " ORDER BY city_norm, match_score DESC, name"
+        conn = sqlite3.connect(Path(self.path).absolute().as_uri() + "?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        try:
+            cursor = conn.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(batch)
+                if not rows:
+                    break
+                for row in rows:
+                    yield self._venue(row)
+        finally:
+            conn.close()
+
+    def coverage(self, city):
+        """Venue count and freshness for a city"""
+        where, params = self._place_filter(city)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT count(*), max(updated_at) FROM venues WHERE " + " AND ".join(where),
+                params,
+            ).fetchone()
+        count, newest = row
+        return {
+            'venues': count,
+            'newest_age_seconds': int(time.time() - newest) if newest else None,
+        }
+
+    def _place_filter(self, target_city, prefix=''):
+        """(conditions, params) matching venues in target_city"""
+        where = [f"{prefix}city_norm = ?"]
+        params = [city_part(target_city)]
+        state = state_part(target_city)
+        if state:
+            where.append(f"{prefix}state_norm = ?")
+            params.append(state)
+        return where, params
+
+    def _venue(self, row):
+        venue = {name: row[name] for name in COLUMNS if row[name] is not None}
+        venue.setdefault('match_score', 70)
+        return venue
+
+    def stats(self):
+        with self._lock:
+            total = self._conn.execute("SELECT count(*) FROM venues").fetchone()[0]
+            return {
+                'venues': total,
+                'fts': self.fts,
+                'fast_path_hits': self.fast_path_hits,
+                'fast_path_misses': self.fast_path_misses,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()